@@ -0,0 +1,199 @@
+"""CPU亲和性和调度优先级（Linux）：把发送/接收循环、统计线程和工作进程固定在指定的CPU上。
+
+线程在不同核之间迁移会表现为发包节奏的抖动。各线程开始运行时用os.sched_setaffinity绑定自己（pid为0时作用于调用线程，
+Linux的nice值也是每个线程的属性，os.setpriority的who为0时同样只作用于调用线程），
+发送循环可以请求SCHED_FIFO实时优先级或nice值，没有权限时记录失败并继续以普通优先级运行。
+新线程继承创建者的设置，所以每个辅助线程开始时都按自己的角色重新绑定：没有单独指定CPU的角色恢复进程原来的CPU集合，
+不是send角色的线程恢复普通调度策略和原来的nice值。统计、时钟偏移测量、TCP_INFO采样和剖析采样线程使用stats角色；
+--bidir的接收线程和服务器上的反向流发送线程是数据循环，沿用send角色的设置；单个CPS工作者的线程使用workers角色。
+
+--irq-iface给出网卡时，处理该网卡中断的CPU从所有线程的CPU集合中去掉，留给中断处理；
+--numa-node给出节点时，没有单独指定CPU的线程使用该节点的CPU（只绑定CPU，内存按首次访问分配在本地节点）。
+"""
+import os
+import threading
+
+# 可以绑定的线程角色：发送/接收循环、统计和采样线程、工作进程
+ROLES = ('send', 'stats', 'workers')
+
+
+def parse_cpus(spec):
+    """'0-3,6' -> {0, 1, 2, 3, 6}"""
+    cpus = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if first < 0 or last < first:
+            raise ValueError(f"Invalid CPU list: {spec}")
+        cpus.update(range(first, last + 1))
+    if not cpus:
+        raise ValueError(f"Invalid CPU list: {spec}")
+    return cpus
+
+
+def read_cpu_list(path):
+    with open(path, 'r') as f:
+        return parse_cpus(f.read().strip())
+
+
+def numa_cpus(node):
+    try:
+        return read_cpu_list(f'/sys/devices/system/node/node{node}/cpulist')
+    except FileNotFoundError:
+        raise ValueError(f"No such NUMA node: {node}")
+
+
+def irq_cpus(interface):
+    """处理网卡中断的CPU：网卡的MSI中断号来自sysfs，没有时按名字在/proc/interrupts中查找"""
+    try:
+        irqs = set(os.listdir(f'/sys/class/net/{interface}/device/msi_irqs'))
+    except FileNotFoundError:
+        irqs = set()
+    if not irqs:
+        with open('/proc/interrupts', 'r') as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if fields and fields[0].rstrip(':').isdigit() and any(interface in field for field in fields[1:]):
+                    irqs.add(fields[0].rstrip(':'))
+    if not irqs:
+        raise ValueError(f"No interrupts found for {interface}")
+    cpus = set()
+    for irq in irqs:
+        for name in ('effective_affinity_list', 'smp_affinity_list'):
+            try:
+                cpus |= read_cpu_list(f'/proc/irq/{irq}/{name}')
+                break
+            except (FileNotFoundError, ValueError):
+                continue
+    return cpus
+
+
+def pin_thread(cpus):
+    """把调用线程绑定到cpus上（None时不改变），返回实际生效的CPU列表"""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    return sorted(os.sched_getaffinity(0))
+
+
+class AffinityPlan:
+    """各角色的CPU集合和发送循环的调度策略；apply在要绑定的线程中调用，记录实际生效的设置"""
+
+    def __init__(self, send=None, stats=None, workers=None, numa_node=None, irq_interface=None, fifo=None, nice=None):
+        available = os.sched_getaffinity(0)
+        default = numa_cpus(numa_node) & available if numa_node is not None else None
+        self.numa_node = numa_node
+        self.irq_interface = irq_interface
+        self.irq_cpus = irq_cpus(irq_interface) if irq_interface else set()
+        if self.irq_cpus and default is None:
+            default = set(available)
+        # 进程原来的CPU集合，没有单独指定CPU的角色恢复到它，而不是继承创建者的绑定
+        self.available = available
+        self.plan = {}
+        for role, spec in zip(ROLES, (send, stats, workers)):
+            cpus = parse_cpus(spec) if spec else default
+            if spec and not cpus <= available:
+                raise ValueError(f"CPUs {','.join(str(cpu) for cpu in sorted(cpus - available))} are not available "
+                                 f"to this process")
+            if cpus is not None:
+                cpus = cpus - self.irq_cpus
+                if not cpus:
+                    raise ValueError(f"No CPU left for the {role} thread after removing the IRQ CPUs")
+            self.plan[role] = cpus
+        self.fifo = fifo
+        self.nice = nice
+        self.base_nice = os.getpriority(os.PRIO_PROCESS, 0)
+        self.applied = {}
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def cpus(self, role):
+        return self.plan.get(role)
+
+    def worker_cpus(self, index):
+        """第index个工作进程的CPU：在workers集合中轮流分配一个"""
+        cpus = self.plan['workers']
+        if not cpus:
+            return None
+        cpus = sorted(cpus)
+        return {cpus[index % len(cpus)]}
+
+    def apply(self, role):
+        """绑定调用线程：send角色按请求设置SCHED_FIFO和nice，其他角色恢复普通调度"""
+        info = {}
+        try:
+            info['cpus'] = pin_thread(self.plan.get(role) or self.available)
+        except OSError as e:
+            self.error(f"{role} affinity: {e}")
+            info['cpus'] = sorted(os.sched_getaffinity(0))
+        if role == 'send':
+            if self.fifo:
+                try:
+                    os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.fifo))
+                except OSError as e:
+                    self.error(f"SCHED_FIFO: {e}")
+            if self.nice is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, 0, self.nice)
+                except OSError as e:
+                    self.error(f"nice {self.nice}: {e}")
+        elif self.fifo or self.nice is not None:
+            try:
+                if os.sched_getscheduler(0) != os.SCHED_OTHER:
+                    os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+                os.setpriority(os.PRIO_PROCESS, 0, self.base_nice)
+            except OSError as e:
+                self.error(f"{role} scheduling: {e}")
+        policy = os.sched_getscheduler(0)
+        info['policy'] = 'fifo' if policy == os.SCHED_FIFO else 'other'
+        if policy == os.SCHED_FIFO:
+            info['priority'] = os.sched_getparam(0).sched_priority
+        info['nice'] = os.getpriority(os.PRIO_PROCESS, 0)
+        with self.lock:
+            self.applied[role] = info
+
+    def record_worker(self, cpus):
+        with self.lock:
+            self.applied.setdefault('workers', []).append({'cpus': cpus})
+
+    def error(self, message):
+        with self.lock:
+            if message not in self.errors:
+                self.errors.append(message)
+
+    def summary(self):
+        summary = dict(self.applied)
+        if self.irq_interface:
+            summary['irq_interface'] = self.irq_interface
+            summary['irq_cpus'] = sorted(self.irq_cpus)
+        if self.numa_node is not None:
+            summary['numa_node'] = self.numa_node
+        if self.errors:
+            summary['errors'] = self.errors
+        return summary
+
+    @staticmethod
+    def describe(summary):
+        """一行文字描述summary()"""
+        cpu_list = lambda cpus: ','.join(str(cpu) for cpu in cpus)
+        parts = []
+        for role in ('send', 'stats'):
+            info = summary.get(role)
+            if info:
+                text = f"{role} {cpu_list(info['cpus'])}"
+                if info['policy'] == 'fifo':
+                    text += f" (SCHED_FIFO {info['priority']})"
+                if info['nice']:
+                    text += f" (nice {info['nice']})"
+                parts.append(text)
+        if summary.get('workers'):
+            parts.append("workers " + " ".join(cpu_list(worker['cpus']) for worker in summary['workers']))
+        text = "CPU affinity: " + ", ".join(parts)
+        if 'irq_cpus' in summary:
+            text += f"; IRQ CPUs of {summary['irq_interface']} kept free: {cpu_list(summary['irq_cpus'])}"
+        if summary.get('errors'):
+            text += "; not applied: " + "; ".join(summary['errors'])
+        return text
@@ -0,0 +1,151 @@
+"""突发流量模型：预先用NumPy按块生成包间隔调度，发送循环只取下一个间隔，不做任何状态判断。
+
+模型写作`名称:键=值,...`，用于--burst，速率支持K/M/G后缀（bps，按发生器的帧长换算为包速率）：
+    onoff:on=0.01,off=0.09,peak=1G[,dist=exp]
+        开启on秒、以峰值速率peak均匀发包，然后空闲off秒；dist=exp时开/关时长服从指数分布，默认固定
+    train:packets=32,interval=0.001[,peak=10G]
+        每interval秒发送一串packets个包，串内以peak速率发包，不指定peak时背靠背发送
+    mmpp:rates=10M/500M,sojourn=0.1/0.01
+        马尔可夫调制泊松过程：各状态停留时间服从均值为sojourn的指数分布，之后等概率跳到其他状态，
+        状态内按该状态的速率泊松发包
+"""
+import numpy as np
+
+from FlowGenerator import FlowGenerator
+
+# 每块大约生成的包数
+BLOCK = 65536
+
+
+def parse_model(spec):
+    """'onoff:on=0.01,off=0.09' -> ('onoff', {'on': '0.01', 'off': '0.09'})"""
+    name, _, argument = spec.partition(':')
+    params = {}
+    for item in argument.split(','):
+        if not item:
+            continue
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"Burst parameter must be key=value: {item}")
+        params[key.strip()] = value.strip()
+    return name.lower(), params
+
+
+def _rate(value):
+    return float(FlowGenerator.to_bps(value))
+
+
+class BurstSchedule:
+    """可调用对象，每次返回发送当前包之后到下一个包的间隔(秒)"""
+
+    def __init__(self, spec, frame_size, seed=None):
+        self.spec = spec
+        self.rng = np.random.default_rng(seed)
+        self.frame_bits = frame_size * 8
+        name, params = parse_model(spec)
+        try:
+            if name == 'onoff':
+                self.on = float(params.pop('on'))
+                self.off = float(params.pop('off'))
+                self.peak_pps = _rate(params.pop('peak')) / self.frame_bits
+                self.dist = params.pop('dist', 'fixed')
+                if self.dist not in ('fixed', 'exp'):
+                    raise ValueError("dist must be fixed or exp")
+                if self.on <= 0 or self.off < 0 or self.peak_pps <= 0:
+                    raise ValueError("onoff needs on > 0, off >= 0 and peak > 0")
+                self.next_block = self.onoff_block
+                self.mean_pps = self.peak_pps * self.on / (self.on + self.off)
+            elif name == 'train':
+                self.packets = int(params.pop('packets'))
+                self.period = float(params.pop('interval'))
+                peak = params.pop('peak', None)
+                self.peak_pps = _rate(peak) / self.frame_bits if peak else None
+                if self.packets < 1 or self.period <= 0 or (self.peak_pps is not None and self.peak_pps <= 0):
+                    raise ValueError("train needs packets >= 1, interval > 0 and peak > 0")
+                self.next_block = self.train_block
+                self.mean_pps = self.packets / self.period
+            elif name == 'mmpp':
+                self.rates = np.array([_rate(x) / self.frame_bits for x in params.pop('rates').split('/')])
+                self.sojourn = np.array([float(x) for x in params.pop('sojourn').split('/')])
+                if len(self.rates) < 2 or len(self.rates) != len(self.sojourn):
+                    raise ValueError("mmpp needs the same number (at least 2) of rates and sojourn times")
+                if np.any(self.rates < 0) or np.any(self.sojourn <= 0):
+                    raise ValueError("mmpp needs rates >= 0 and sojourn times > 0")
+                self.state = 0
+                self.clock = 0.0
+                self.last_time = None
+                self.next_block = self.mmpp_block
+                # 跳转链在各状态间等概率转移，时间上的稳态概率与平均停留时间成正比
+                self.mean_pps = float(np.sum(self.rates * self.sojourn) / np.sum(self.sojourn))
+                # 每段停留的平均包数，用来估计一块需要的停留段数
+                self.segment_packets = float(np.mean(self.rates * self.sojourn))
+            else:
+                raise ValueError(f"Unsupported burst model: {name}")
+        except KeyError as e:
+            raise ValueError(f"Burst model {name} needs parameter {e.args[0]}")
+        if params:
+            raise ValueError(f"Unknown burst parameters: {', '.join(params)}")
+        if self.mean_pps <= 0:
+            raise ValueError("Burst model has a zero mean rate")
+        self.block = []
+        self.index = 0
+
+    def __call__(self):
+        index = self.index
+        while index >= len(self.block):
+            self.block = self.next_block().tolist()
+            index = 0
+        self.index = index + 1
+        return self.block[index]
+
+    def _cycles(self, gap, packets, cycle):
+        """每个周期packets[k]个包、包间隔gap，周期长cycle[k]：最后一个包之后的间隔补足到周期结束"""
+        gaps = np.full(int(packets.sum()), gap)
+        last = np.cumsum(packets) - 1
+        gaps[last] = np.maximum(cycle - (packets - 1) * gap, 0.0)
+        return gaps
+
+    def onoff_block(self):
+        gap = 1.0 / self.peak_pps
+        cycles = max(1, int(BLOCK / max(1.0, self.on * self.peak_pps)))
+        if self.dist == 'exp':
+            on = self.rng.exponential(self.on, cycles)
+            off = self.rng.exponential(self.off, cycles)
+        else:
+            on = np.full(cycles, self.on)
+            off = np.full(cycles, self.off)
+        packets = np.maximum(1, np.round(on / gap)).astype(np.int64)
+        return self._cycles(gap, packets, on + off)
+
+    def train_block(self):
+        gap = 1.0 / self.peak_pps if self.peak_pps else 0.0
+        cycles = max(1, BLOCK // self.packets)
+        packets = np.full(cycles, self.packets, dtype=np.int64)
+        return self._cycles(gap, packets, np.full(cycles, self.period))
+
+    def mmpp_block(self):
+        n = len(self.rates)
+        segments = max(1, int(np.ceil(BLOCK / max(1.0, self.segment_packets))))
+        # 状态序列：每次跳到其他n-1个状态之一
+        jumps = np.concatenate(([0], self.rng.integers(1, n, segments - 1)))
+        states = (self.state + np.cumsum(jumps)) % n
+        self.state = int((states[-1] + self.rng.integers(1, n)) % n)
+        durations = self.rng.exponential(self.sojourn[states])
+        ends = self.clock + np.cumsum(durations)
+        starts = ends - durations
+        self.clock = float(ends[-1])
+        # 每段内的泊松到达：个数服从泊松分布，时刻在段内均匀分布；各段不重叠，整体排序即可
+        counts = self.rng.poisson(self.rates[states] * durations)
+        segment = np.repeat(np.arange(segments), counts)
+        times = np.sort(starts[segment] + self.rng.random(len(segment)) * durations[segment])
+        if not len(times):
+            return times
+        if self.last_time is None:
+            gaps = np.diff(times)   # 第一个包立即发送
+        else:
+            gaps = np.diff(times, prepend=self.last_time)
+        self.last_time = times[-1]
+        return gaps
+
+    def describe(self):
+        return {'model': self.spec, 'mean_bps': self.mean_pps * self.frame_bits}
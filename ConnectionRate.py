@@ -0,0 +1,325 @@
+"""新建连接速率（CPS）测试：测防火墙、负载均衡器每秒能新建多少TCP连接，而不是吞吐量。
+
+客户端在事件循环中用非阻塞connect不断新建连接：三次握手完成后，可选地发送N字节并关闭写方向、
+等服务器收完后关闭，然后关闭连接。--cps-workers K时K个进程各运行一个事件循环，目标速率和并发上限平分。
+统计每秒新建的连接数、握手时延（connect到可写）和完整事务时延的百分位数，以及按错误码分类的失败数。
+
+客户端先建立一个控制连接并发送CPS_MAGIC，测试期间一直保持：服务器把这段时间内的所有连接算作一个测试，
+并在每个统计区间给出接受连接的速率。
+"""
+import errno
+import multiprocessing
+import os
+import queue
+import selectors
+import socket
+import struct
+import threading
+import time
+from array import array
+from time import perf_counter
+
+from Affinity import pin_thread
+from FlowGenerator import FlowGenerator, MAX_BURST, percentiles
+from MultiFlow import raise_fd_limit, SPARE_FDS, TCP_HEAD_SIZE_V4, TCP_HEAD_SIZE_V6
+
+# 控制连接的请求行
+CPS_MAGIC = b'TGEN-CPS\n'
+# 一个连接从connect到关闭超过这个时间(秒)算作超时失败，覆盖SYN的前两次重传
+CONNECTION_TIMEOUT = 3.0
+# 没有到期的连接要发起时，事件循环最多等待的时间(秒)
+POLL_INTERVAL = 0.01
+# 关闭时发送RST，连接不进入TIME_WAIT（--cps-reset）
+LINGER_RESET = struct.pack('ii', 1, 0)
+
+# 每个工作者在共享计数数组中的计数
+ATTEMPTS, CONNECTS, COMPLETED, FAILURES, TIMEOUTS, BYTES, OPEN = range(7)
+COUNTERS = 7
+
+
+def run_worker(host, port, ipv6, rate, concurrency, exchange, reset, deadline, counters, base, results, cpus=None):
+    """一个事件循环：rate为0时尽快新建连接，同时进行中的连接不超过concurrency；deadline为time.time()时刻。
+    cpus不为None时先把自己绑定到这些CPU上"""
+    try:
+        cpus = pin_thread(cpus)
+    except OSError:
+        cpus = sorted(os.sched_getaffinity(0))
+    family = socket.AF_INET6 if ipv6 else socket.AF_INET
+    address = (host, port)
+    selector = selectors.DefaultSelector()
+    payload = memoryview(b'x' * exchange)
+    # 进行中的连接：socket -> [connect时刻, 已发送字节数, 是否已建立]，按发起顺序排列，最老的在最前
+    pending = {}
+    handshake = array('d')
+    transaction = array('d')
+    errors = {}
+    interval = 1.0 / rate if rate else 0.0
+    now = perf_counter()
+    end = now + (deadline - time.time())
+    next_time = now
+
+    def close(sock):
+        selector.unregister(sock)
+        del pending[sock]
+        if reset:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, LINGER_RESET)
+            except OSError:
+                pass
+        sock.close()
+
+    def fail(sock, code):
+        name = errno.errorcode.get(code, str(code))
+        errors[name] = errors.get(name, 0) + 1
+        counters[base + FAILURES] += 1
+        if sock is not None:
+            close(sock)
+
+    try:
+        while now < end:
+            burst = 0
+            while len(pending) < concurrency and next_time <= now and burst < MAX_BURST:
+                burst += 1
+                next_time += interval
+                counters[base + ATTEMPTS] += 1
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                sock.setblocking(False)
+                start = perf_counter()
+                code = sock.connect_ex(address)
+                if code not in (0, errno.EINPROGRESS):
+                    sock.close()
+                    fail(None, code)
+                    continue
+                pending[sock] = [start, 0, False]
+                selector.register(sock, selectors.EVENT_WRITE)
+            counters[base + OPEN] = len(pending)
+
+            timeout = POLL_INTERVAL
+            if len(pending) < concurrency:
+                timeout = min(timeout, max(0.0, next_time - perf_counter()))
+            for key, _ in selector.select(timeout):
+                sock = key.fileobj
+                state = pending[sock]
+                if not state[2]:
+                    code = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if code:
+                        fail(sock, code)
+                        continue
+                    handshake.append(perf_counter() - state[0])
+                    counters[base + CONNECTS] += 1
+                    state[2] = True
+                    if not exchange:
+                        close(sock)
+                        counters[base + COMPLETED] += 1
+                        continue
+                if state[1] < exchange:
+                    try:
+                        n = sock.send(payload[state[1]:])
+                    except BlockingIOError:
+                        continue
+                    except OSError as e:
+                        fail(sock, e.errno)
+                        continue
+                    state[1] += n
+                    counters[base + BYTES] += n
+                    if state[1] == exchange:
+                        # 写完后关闭写方向，服务器收到EOF后关闭连接
+                        sock.shutdown(socket.SHUT_WR)
+                        selector.modify(sock, selectors.EVENT_READ)
+                    continue
+                try:
+                    data = sock.recv(65536)
+                except BlockingIOError:
+                    continue
+                except OSError as e:
+                    fail(sock, e.errno)
+                    continue
+                if not data:
+                    transaction.append(perf_counter() - state[0])
+                    close(sock)
+                    counters[base + COMPLETED] += 1
+
+            now = perf_counter()
+            while pending:
+                sock = next(iter(pending))
+                if now - pending[sock][0] < CONNECTION_TIMEOUT:
+                    break
+                counters[base + TIMEOUTS] += 1
+                fail(sock, errno.ETIMEDOUT)
+    finally:
+        # 测试结束时仍在进行的连接不计入失败
+        for sock in list(pending):
+            close(sock)
+        counters[base + OPEN] = 0
+        selector.close()
+        results.put((handshake.tobytes(), transaction.tobytes(), errors, cpus))
+
+
+class ConnectionRateGenerator(FlowGenerator):
+    def __init__(self, bind_address, host, port, mode, duration=None, interval=1, json=False, one_test=False,
+                 ipv6=False, rate=0, exchange=0, concurrency=1000, workers=1, reset=False, **kwargs):
+        pkt_head_size = TCP_HEAD_SIZE_V6 if ipv6 else TCP_HEAD_SIZE_V4
+        super().__init__(bind_address, host, port, mode, duration, None, exchange, None, interval,
+                         None, None, None, None, json, one_test, ipv6, False, pkt_head_size, **kwargs)
+        self.type = 'cps'
+        self.rate = rate
+        self.exchange = exchange
+        self.workers = workers
+        self.concurrency = max(1, concurrency // workers)
+        self.reset = reset
+        self.counters = None
+        self.attempts = 0
+        self.connects = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.open_connections = 0
+        self.handshake = array('d')
+        self.transaction = array('d')
+        self.errors = {}
+
+    def collect(self):
+        """把各工作者的计数加总到统计线程读取的属性上"""
+        totals = [0] * COUNTERS
+        counters = self.counters
+        for base in range(0, len(counters), COUNTERS):
+            for i in range(COUNTERS):
+                totals[i] += counters[base + i]
+        self.total_packets = totals[COMPLETED]
+        self.total_sent = totals[BYTES]
+        self.connects = totals[CONNECTS]
+        self.failures = totals[FAILURES]
+        self.timeouts = totals[TIMEOUTS]
+        self.attempts = totals[ATTEMPTS]
+        self.open_connections = totals[OPEN]
+
+    def run_client(self):
+        control = None
+        workers = []
+        try:
+            raise_fd_limit(self.concurrency + SPARE_FDS)
+            socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+            control = socket.socket(socket_family, socket.SOCK_STREAM)
+            control.connect((self.host, self.port))
+            control.sendall(CPS_MAGIC)
+            if not self.json:
+                target = f"{self.rate:g} connections/s" if self.rate else "as fast as possible"
+                print(f"Opening TCP connections to {self.host}:{self.port} {target}, "
+                      f"{self.workers} worker(s), {self.exchange} bytes each")
+
+            self.test_start_time = self.start_time = time.time()
+            deadline = self.start_time + self.duration
+            args = (self.host, self.port, self.ipv6, self.rate / self.workers, self.concurrency, self.exchange,
+                    self.reset, deadline)
+            if self.workers == 1:
+                # 一个工作者时在本进程的线程中运行
+                self.counters = [0] * COUNTERS
+                results = queue.SimpleQueue()
+                workers.append(threading.Thread(target=run_worker,
+                                                args=args + (self.counters, 0, results, self.worker_cpus(0))))
+            else:
+                context = multiprocessing.get_context()
+                self.counters = context.RawArray('q', COUNTERS * self.workers)
+                results = context.Queue()
+                for i in range(self.workers):
+                    workers.append(context.Process(target=run_worker,
+                                                   args=args + (self.counters, i * COUNTERS, results,
+                                                                self.worker_cpus(i))))
+            for worker in workers:
+                worker.daemon = True
+                worker.start()
+
+            self.is_running = True
+            self.stats_thread = threading.Thread(target=self.print_statistics)
+            self.stats_thread.daemon = True
+            self.stats_thread.start()
+
+            # 结果要在join之前取走，否则进程在向已满的队列写入时阻塞
+            for _ in workers:
+                handshake, transaction, errors, cpus = results.get()
+                if self.affinity:
+                    self.affinity.record_worker(cpus)
+                self.handshake.frombytes(handshake)
+                self.transaction.frombytes(transaction)
+                for name, count in errors.items():
+                    self.errors[name] = self.errors.get(name, 0) + count
+            for worker in workers:
+                worker.join()
+
+            self.test_end_time = time.time()
+            self.collect()
+            self.is_running = False
+            self.stats_thread.join()
+            self.print_summary()
+
+        except KeyboardInterrupt:
+            for worker in workers:
+                if isinstance(worker, multiprocessing.process.BaseProcess):
+                    worker.terminate()
+        except Exception as e:
+            self.report_error("Client error", e)
+        finally:
+            self.is_running = False
+            if control:
+                control.close()
+
+    def worker_cpus(self, index):
+        return self.affinity.worker_cpus(index) if self.affinity else None
+
+    def print_statistics(self):
+        last_connects = last_completed = last_failures = last_bytes = 0
+        last_time = start_time = self.start_time
+        self.json_info = {"intervals": [], "end": {}}
+        self.apply_affinity('stats')
+
+        while True:
+            time.sleep(0.005)
+            current_time = time.time()
+            if current_time - last_time > self.interval or not self.is_running:
+                if self.is_running:
+                    self.collect()
+                interval_time = current_time - last_time
+                connects = self.connects - last_connects
+                interval_stats = {
+                    'times': f'{last_time - start_time:.2f}-{current_time - start_time:.2f}',
+                    'connects': connects,
+                    'connects_per_second': connects / interval_time,
+                    'completed': self.total_packets - last_completed,
+                    'failures': self.failures - last_failures,
+                    'open': self.open_connections,
+                    'bytes': self.total_sent - last_bytes,
+                    'total_connects': self.connects,
+                }
+                self.interval_data.append(interval_stats)
+                if self.json:
+                    self.json_info["intervals"].append(interval_stats)
+                else:
+                    print(f"[ {interval_stats['times']} s]  "
+                          f"Connects: {connects} ({interval_stats['connects_per_second']:.0f}/s)  "
+                          f"Failures: {interval_stats['failures']}  "
+                          f"Open: {interval_stats['open']}  "
+                          f"Transfer: {interval_stats['bytes']/(1024*1024):.2f} MB")
+                last_connects = self.connects
+                last_completed = self.total_packets
+                last_failures = self.failures
+                last_bytes = self.total_sent
+                last_time = current_time
+            if not self.is_running:
+                break
+
+    def connection_summary(self):
+        """连接数、速率、握手和事务时延(毫秒)的百分位数、按错误码分类的失败数"""
+        seconds = max(self.test_end_time - self.test_start_time, 1e-9)
+        to_ms = lambda values: {k: v * 1000 for k, v in percentiles(list(values)).items()} if values else None
+        summary = {
+            'attempts': self.attempts,
+            'connects': self.connects,
+            'completed': self.total_packets,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'connects_per_second': self.connects / seconds,
+            'handshake_ms': to_ms(self.handshake),
+            'errors': self.errors,
+        }
+        if self.exchange:
+            summary['transaction_ms'] = to_ms(self.transaction)
+        return summary
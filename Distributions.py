@@ -0,0 +1,200 @@
+"""包长、包间隔和带宽的分布采样。
+
+分布写作`名称`或`名称:参数`，用于-dpps/-dl/-db：
+    exp                  指数分布（由FlowGenerator直接用random采样，不经过本模块）
+    pareto[:a]           帕累托分布，形状a>1，默认1.5
+    lognormal[:sigma]    对数正态分布，默认sigma=1.0
+    weibull[:k]          威布尔分布，形状k，默认1.5
+    uniform[:w]          均匀分布[m(1-w), m(1+w)]，0<=w<=1，默认1.0
+    imix[:64x7,576x4,1500x1]  按权重混合的离散取值（默认为经典IMIX 7:4:1）
+    empirical:FILE       从文件读入的经验分布，每行`取值 权重`（离散）或`下界 上界 权重`（区间内均匀）
+
+参数分布的均值等于命令行给定的均值（-l包长、-b换算的包间隔/带宽）；imix和empirical的取值是绝对值。
+采样按块用NumPy批量生成后转换为Python列表，逐包只做一次列表索引；离散分布使用预先构造的别名表。
+"""
+import math
+
+import numpy as np
+
+# 每次批量生成的样本数
+BLOCK = 4096
+
+# 经典IMIX：64/576/1500字节按7:4:1
+DEFAULT_IMIX = ((64, 7), (576, 4), (1500, 1))
+
+DEFAULT_SHAPES = {
+    'pareto': 1.5,
+    'lognormal': 1.0,
+    'weibull': 1.5,
+    'uniform': 1.0,
+}
+
+
+class AliasTable:
+    """Vose别名表：O(n)构造，每次采样O(1)，批量采样完全向量化"""
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or not len(weights) or np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError("Weights must be non-negative and not all zero")
+        n = len(weights)
+        scaled = weights * n / weights.sum()
+        self.prob = np.ones(n)
+        self.alias = np.arange(n)
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        # 剩余项因浮点误差可能略小于1，按1处理
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng, size):
+        """返回size个下标"""
+        index = rng.integers(len(self.prob), size=size)
+        return np.where(rng.random(size) < self.prob[index], index, self.alias[index])
+
+
+class Sampler:
+    """可调用对象，每次返回一个样本。
+
+    relative为True时样本的均值为1，调用方乘以当前均值（包间隔的均值会随速率变化）；
+    为False时样本已经是最终取值。
+    """
+
+    def __init__(self, draw, relative, mean):
+        self.draw = draw
+        self.relative = relative
+        self.mean = mean
+        self.block = []
+        self.index = 0
+
+    def __call__(self):
+        index = self.index
+        if index >= len(self.block):
+            self.block = self.draw(BLOCK).tolist()
+            index = 0
+        self.index = index + 1
+        return self.block[index]
+
+
+def parse_spec(spec):
+    """'名称:参数' -> (名称, 参数字符串或None)"""
+    name, _, argument = spec.partition(':')
+    return name.lower(), argument or None
+
+
+def parse_imix(argument):
+    """'64x7,576x4,1500x1' -> [(64, 7.0), ...]"""
+    if not argument:
+        return list(DEFAULT_IMIX)
+    mix = []
+    for item in argument.split(','):
+        value, _, weight = item.partition('x')
+        mix.append((float(value), float(weight) if weight else 1.0))
+    return mix
+
+
+def load_histogram(path):
+    """读入经验分布文件，返回(下界数组, 上界数组, 权重数组)；离散取值的上下界相同"""
+    low, high, weights = [], [], []
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.replace(',', ' ').split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            try:
+                values = [float(x) for x in fields]
+            except ValueError:
+                continue    # 表头
+            if len(values) == 2:
+                low.append(values[0])
+                high.append(values[0])
+                weights.append(values[1])
+            elif len(values) == 3:
+                low.append(values[0])
+                high.append(values[1])
+                weights.append(values[2])
+            else:
+                raise ValueError(f"{path}: expected 'value weight' or 'low high weight' per line")
+    if not weights:
+        raise ValueError(f"{path}: no histogram entries")
+    return np.array(low), np.array(high), np.array(weights)
+
+
+def _parametric(name, shape, rng):
+    """均值为1的参数分布的批量采样函数"""
+    if name == 'exp':
+        return lambda n: rng.exponential(1.0, n)
+    if name == 'pareto':
+        if shape <= 1:
+            raise ValueError("Pareto shape must be > 1 for a finite mean")
+        x_m = (shape - 1) / shape
+        return lambda n: (rng.pareto(shape, n) + 1.0) * x_m
+    if name == 'lognormal':
+        mu = -shape * shape / 2
+        return lambda n: rng.lognormal(mu, shape, n)
+    if name == 'weibull':
+        if shape <= 0:
+            raise ValueError("Weibull shape must be > 0")
+        scale = 1.0 / math.gamma(1 + 1 / shape)
+        return lambda n: rng.weibull(shape, n) * scale
+    if name == 'uniform':
+        if not 0 <= shape <= 1:
+            raise ValueError("Uniform width must be between 0 and 1")
+        return lambda n: rng.uniform(1 - shape, 1 + shape, n)
+    raise ValueError(f"Unsupported distribution: {name}")
+
+
+def create_sampler(spec, scale=None, integer=False, low=None, high=None, seed=None):
+    """按spec创建采样器。
+
+    scale为参数分布的均值；为None时返回relative采样器（均值为1，由调用方缩放）。
+    integer、low、high在批量生成时对最终取值取整和截断。
+    """
+    rng = np.random.default_rng(seed)
+    name, argument = parse_spec(spec)
+
+    if name in ('imix', 'empirical'):
+        if name == 'imix':
+            mix = parse_imix(argument)
+            lower = upper = np.array([value for value, _ in mix])
+            weights = [weight for _, weight in mix]
+        else:
+            if not argument:
+                raise ValueError("empirical needs a histogram file: empirical:FILE")
+            lower, upper, weights = load_histogram(argument)
+        table = AliasTable(weights)
+        width = upper - lower
+        probabilities = np.asarray(weights, dtype=np.float64) / np.sum(weights)
+        mean = float(np.sum((lower + upper) / 2 * probabilities))
+
+        def raw(n):
+            index = table.sample(rng, n)
+            values = lower[index]
+            if np.any(width):
+                values = values + rng.random(n) * width[index]
+            return values
+        relative = False
+    else:
+        shape = float(argument) if argument else DEFAULT_SHAPES.get(name, 1.0)
+        unit = _parametric(name, shape, rng)
+        if scale is None:
+            raw, relative, mean = unit, True, 1.0
+        else:
+            raw, relative, mean = (lambda n: unit(n) * scale), False, float(scale)
+
+    def draw(n):
+        values = raw(n)
+        if low is not None or high is not None:
+            values = np.clip(values, low, high)
+        if integer:
+            values = values.astype(np.int64)
+        return values
+
+    return Sampler(draw, relative, mean)
@@ -0,0 +1,137 @@
+"""反向(-R)和双向(--bidir)测试：反向流由服务器发送、客户端接收，双向时两个方向同时进行。
+
+反向流总是由客户端发起：TCP客户端新建一个连接，先发送一行请求`TGEN-REVERSE {发送参数}\\n`；
+UDP客户端用一个新socket发送带`reverse`选项的INIT，服务器再从同一端口向这个socket发起一次普通测试。
+这样只需放行客户端到服务器的方向，NAT和有状态防火墙后的客户端也能测下行。
+
+服务器按请求中的参数（-t/-n/-l/-b、分布、突发模型和-i）创建发送端，两端各自按自己的参数节奏发送和统计，
+每个方向的统计行带[TX]/[RX]前缀，最后打印合并的总结。
+"""
+import json as JSON
+import socket
+import threading
+import time
+
+# TCP反向连接的请求行前缀，普通数据连接的负载不会以它开头
+REVERSE_MAGIC = b'TGEN-REVERSE '
+# 请求行的最大长度和读取超时(秒)
+MAX_REQUEST_SIZE = 65536
+REQUEST_TIMEOUT = 5.0
+# 客户端请求中可以设置的发送参数，与生成器构造函数的参数同名
+SENDER_OPTIONS = ('duration', 'total_size', 'packet_size', 'bandwidth', 'interval',
+                  'distributed_packets_per_second', 'distributed_packet_size', 'distributed_bandwidth',
+                  'bandwidth_reset_interval', 'burst', 'burst_seed')
+# 各方向在合并结果中的名字
+DIRECTIONS = {'TX': 'sent', 'RX': 'received'}
+
+
+def encode_request(options):
+    return REVERSE_MAGIC + JSON.dumps(options).encode() + b'\n'
+
+
+class PendingRequest:
+    """服务器：正在接收的TCP反向请求。连接是非阻塞的，请求行由服务器事件循环中的多次读取拼成，
+    慢的或不完整的请求不会阻塞其他连接"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.data = b''
+        self.deadline = time.time() + REQUEST_TIMEOUT
+
+    def read(self):
+        """读取已到达的部分，请求行收全时返回发送参数，否则返回None"""
+        try:
+            head = self.sock.recv(MAX_REQUEST_SIZE, socket.MSG_PEEK)
+        except BlockingIOError:
+            return None
+        if not head:
+            raise ConnectionError("Reverse request closed before it was complete")
+        # 只取走到换行为止的数据
+        end = head.find(b'\n')
+        self.data += self.sock.recv(end + 1 if end >= 0 else len(head))
+        if end < 0:
+            if len(self.data) > MAX_REQUEST_SIZE:
+                raise ValueError("Reverse request is too long")
+            return None
+        options = JSON.loads(self.data[len(REVERSE_MAGIC):])
+        if not isinstance(options, dict):
+            raise ValueError("Reverse request must be a JSON object")
+        return options
+
+    def expired(self, now):
+        return now > self.deadline
+
+
+def create_sender(server, options, peer):
+    """服务器：按客户端请求的参数创建反向流的发送端，peer为客户端地址"""
+    options = {key: value for key, value in options.items() if key in SENDER_OPTIONS}
+    sender = type(server)(server.bind_address, peer[0], peer[1], 'client', json=server.json, ipv6=server.ipv6,
+                          quiet=server.quiet, **options)
+    sender.direction = 'TX'
+    return sender
+
+
+def create_receiver(client):
+    """客户端：创建接收反向流的生成器，接收调优参数(--sink/--rcvbuf/--rcvlowat/--rxq-ovfl)作用在它上面"""
+    receiver = type(client)(client.bind_address, client.host, client.port, 'server', interval=client.interval,
+                            json=client.json, ipv6=client.ipv6, quiet=client.quiet, sink=client.sink,
+                            rcvbuf=client.rcvbuf, rcvlowat=client.rcvlowat, rxq_ovfl=client.rxq_ovfl)
+    receiver.direction = 'RX'
+    return receiver
+
+
+def run_client(client):
+    """-R：只接收服务器发送的反向流；--bidir：同时在另一个socket上按原方式发送"""
+    receiver = create_receiver(client)
+    try:
+        handle = receiver.request_reverse(dict(client.send_options, bidir=client.bidir))
+    except Exception as e:
+        client.report_error("Client error", e)
+        return
+    if client.bidir:
+        thread = threading.Thread(target=receiver.receive_reverse, args=(handle,))
+        thread.start()
+        client.direction = 'TX'
+        client.run_sender()
+        thread.join()
+    else:
+        receiver.receive_reverse(handle)
+    if client.error is None:
+        client.error = receiver.error
+    report(client, [client, receiver] if client.bidir else [receiver])
+
+
+def report(owner, generators):
+    """合并各方向的结果：JSON模式打印一份合并的结果，文本模式在两个方向都有数据时打印合计"""
+    parts = []
+    for generator in generators:
+        if generator.test_start_time and generator.test_end_time and generator.total_sent > 0:
+            seconds = generator.test_end_time - generator.test_start_time
+            bps = generator.total_sent * 8 / seconds if seconds > 0 else 0
+            parts.append((DIRECTIONS[generator.direction], generator, bps))
+    if not parts:
+        return
+    total_bps = sum(bps for _, _, bps in parts)
+    if owner.json:
+        start = min(generator.test_start_time for _, generator, _ in parts)
+        end = max(generator.test_end_time for _, generator, _ in parts)
+        summary = {'intervals': [], 'end': {
+            'start': start,
+            'end': end,
+            'seconds': end - start,
+            'bytes': sum(generator.total_sent for _, generator, _ in parts),
+            'bits_per_second': total_bps,
+            'data_bits_per_second': sum(bps * generator.packet_size / generator.frame_size
+                                        for _, generator, bps in parts),
+        }}
+        for name, generator, _ in parts:
+            if generator.summary:
+                summary['intervals'].extend(dict(x, direction=name) for x in generator.summary['intervals'])
+                summary['end'][name] = generator.summary['end']
+        owner.summary = summary
+        if not owner.quiet:
+            print(JSON.dumps(summary, indent=4))
+    elif len(parts) > 1:
+        print("\n=== Bidirectional Summary ===")
+        print("  ".join(f"{name.capitalize()}: {bps/1e6:.2f} Mbps" for name, _, bps in parts)
+              + f"  Total: {total_bps/1e6:.2f} Mbps")
@@ -0,0 +1,198 @@
+"""进程内调用接口：不启动main.py、不解析打印输出，直接运行测试并返回结构化结果。
+
+    from FlowAPI import TestConfig, run_test
+    result = run_test(TestConfig(host='10.0.0.2', udp=True, duration=5, bandwidth='100M'))
+    print(result.summary.bits_per_second, result.summary.lost_percent)
+
+run_test不打印、不调用sys.exit、返回前等待所有工作线程结束，可以在同一进程中连续调用。
+"""
+import ipaddress
+from dataclasses import dataclass, field, fields
+from typing import List, Optional
+
+from MultiFlow import MultiFlowGenerator
+from TCPFlowGenerator import TCPFlowGenerator
+from UDPFlowGenerator import UDPFlowGenerator
+
+# 只有多流客户端接受的options，单流生成器和服务器不接受
+MULTI_FLOW_OPTIONS = ('flows', 'flow_file', 'flow_stats')
+
+
+class TestError(Exception):
+    """测试未能完成（连接失败、收发出错或没有传输任何数据）"""
+
+
+@dataclass
+class TestConfig:
+    """与main.py命令行参数一一对应"""
+    host: Optional[str] = None                  # -c，客户端连接的服务器地址
+    port: int = 5001                            # -p
+    mode: str = 'client'                        # 'client'或'server'，服务器只运行一次测试
+    udp: bool = False                           # -u
+    duration: Optional[float] = None            # -t，秒
+    size: Optional[str] = None                  # -n，如'100M'
+    packet_size: Optional[int] = None           # -l，字节
+    bandwidth: Optional[str] = None             # -b，如'10M'
+    interval: float = 1.0                       # -i，统计间隔(秒)
+    dist_pps: Optional[str] = None              # -dpps
+    dist_len: Optional[str] = None              # -dl
+    dist_bw: Optional[str] = None               # -db
+    bandwidth_reset_interval: Optional[float] = None  # -bri
+    bind_address: Optional[str] = None          # -B
+    ipv6: bool = False                          # -6
+    options: dict = field(default_factory=dict)  # 其余生成器参数，如profile=True
+
+    @classmethod
+    def from_dict(cls, data):
+        names = {f.name for f in fields(cls)}
+        unknown = set(data) - names
+        if unknown:
+            raise ValueError(f"Unknown test config keys: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+
+def _from_dict(cls, data):
+    """按dataclass字段取值，其余键放入extra"""
+    names = {f.name for f in fields(cls)} - {'extra'}
+    values = {k: v for k, v in data.items() if k in names}
+    extra = {k: v for k, v in data.items() if k not in names}
+    return cls(**values, extra=extra)
+
+
+@dataclass
+class IntervalStats:
+    """一个统计间隔，速率单位为bps，与-J输出中的intervals一致"""
+    start: float
+    end: float
+    bytes: int
+    bandwidth: float
+    data_rate: float
+    packets: int
+    pps: float
+    total_bytes: int
+    total_packets: int
+    # TCP客户端
+    cwnd: Optional[int] = None
+    retr: Optional[int] = None
+    rtt: Optional[float] = None
+    # UDP服务器
+    lost_packets: Optional[int] = None
+    lost_percent: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    delay_ms: Optional[float] = None
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        start, end = data.pop('times').split('-')
+        data['start'], data['end'] = float(start), float(end)
+        return _from_dict(cls, data)
+
+
+@dataclass
+class TestSummary:
+    """整个测试的汇总，与-J输出中的end一致"""
+    start: float
+    end: float
+    seconds: float
+    bytes: int
+    bits_per_second: float
+    data_bits_per_second: float
+    # TCP客户端
+    max_snd_cwnd: Optional[int] = None
+    mean_rtt: Optional[float] = None
+    retransmits: Optional[int] = None
+    # UDP
+    lost_packets: Optional[int] = None
+    lost_percent: Optional[float] = None
+    jitter_ms: Optional[float] = None
+    delay_ms: Optional[float] = None
+    server: Optional[dict] = None               # UDP客户端：服务器在FIN_ACK中返回的时延/抖动
+    profile: Optional[dict] = None
+    extra: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data):
+        return _from_dict(cls, data)
+
+
+@dataclass
+class TestResult:
+    config: TestConfig
+    intervals: List[IntervalStats]
+    summary: TestSummary
+    raw: dict = field(repr=False, default_factory=dict)
+
+    def to_dict(self):
+        """与`main.py -J`打印的JSON相同"""
+        return self.raw
+
+
+def _check_address(address, ipv6, name):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        ip = None
+    expected = ipaddress.IPv6Address if ipv6 else ipaddress.IPv4Address
+    if not isinstance(ip, expected):
+        raise ValueError(f"{name} address must be a valid IPv{6 if ipv6 else 4} address")
+
+
+def validate(config):
+    """与main.py相同的参数检查，出错时抛出ValueError"""
+    if config.mode not in ('client', 'server'):
+        raise ValueError("mode must be 'client' or 'server'")
+    if config.duration is not None and config.size is not None:
+        raise ValueError("Cannot specify both time and size")
+    if config.mode == 'client':
+        if config.duration is None and config.size is None:
+            raise ValueError("Must specify either time or size")
+        if not config.host:
+            raise ValueError("Client mode requires a host")
+        _check_address(config.host, config.ipv6, 'Client')
+    if config.bind_address:
+        _check_address(config.bind_address, config.ipv6, 'Bind')
+
+
+def create_generator(config):
+    GeneratorClass = UDPFlowGenerator if config.udp else TCPFlowGenerator
+    options = dict(config.options)
+    options['quiet'] = True
+    # options中的flows>1或flow_file：多流客户端，每条流按-b/-l/-dpps/-dl发送
+    if config.mode == 'client' and (options.get('flows', 1) > 1 or options.get('flow_file')):
+        return MultiFlowGenerator(config.bind_address, config.host, config.port, config.mode, config.duration,
+                                  config.size, config.packet_size, config.bandwidth, config.interval,
+                                  config.dist_pps, config.dist_len, None, None, True, True, config.ipv6,
+                                  udp=config.udp, **options)
+    for name in MULTI_FLOW_OPTIONS:
+        options.pop(name, None)
+    return GeneratorClass(config.bind_address, config.host, config.port, config.mode, config.duration, config.size,
+                          config.packet_size, config.bandwidth, config.interval,
+                          config.dist_pps, config.dist_len, config.dist_bw, config.bandwidth_reset_interval,
+                          True, True, config.ipv6, False, **options)
+
+
+def run_test(config):
+    """运行一次测试并返回TestResult；config可以是TestConfig或同名键的dict。
+
+    客户端模式连接config.host上的服务器；服务器模式等待并完成一次测试后返回。
+    """
+    if isinstance(config, dict):
+        config = TestConfig.from_dict(config)
+    validate(config)
+    generator = create_generator(config)
+    if config.mode == 'server':
+        generator.run_server()
+    else:
+        generator.run_client()
+
+    if generator.error is not None:
+        raise TestError(f"{config.mode} error: {generator.error}") from generator.error
+    if not generator.summary:
+        raise TestError("Test finished without transferring any data")
+    raw = generator.summary
+    return TestResult(config=config,
+                      intervals=[IntervalStats.from_dict(x) for x in raw['intervals']],
+                      summary=TestSummary.from_dict(raw['end']),
+                      raw=raw)
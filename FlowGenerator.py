@@ -1,17 +1,45 @@
+import importlib.util
 import socket
 import time
-import numpy as np
-import struct
+import random
 import json
 import sys
+from time import perf_counter_ns
+
+from Profiler import PhaseProfiler
+from TcpInfo import read_tcp_info, COLUMN
 
 # 定义无穷
 INF = float('inf')
+# 发送落后于计划时每轮最多补发的包数，超过后先回到外层循环检查测试是否结束
+MAX_BURST = 256
+# Python的socket模块没有导出SO_RXQ_OVFL，取值见asm-generic/socket.h
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40)
+
+
+def percentiles(values):
+    """最小/中位数/p90/p99/最大值（最近秩）"""
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'min': values[0], 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': values[-1]}
+
+
+def require_numpy(feature):
+    """feature要用到numpy：没有安装时抛出说明是哪个选项需要它的ValueError，而不是导入时的ImportError"""
+    if importlib.util.find_spec('numpy') is None:
+        raise ValueError(f"numpy is required for {feature}; install it with pip install numpy")
+
 
 class FlowGenerator:
     def __init__(self, bind_address, host, port, mode, duration=None, total_size=None, packet_size=None, bandwidth=None,
                  interval=1, distributed_packets_per_second=None, distributed_packet_size=None,
-                 distributed_bandwidth=None, bandwidth_reset_interval=None, json=False, one_test=False, ipv6=False, printpkg=False, pkt_head_size = None):
+                 distributed_bandwidth=None, bandwidth_reset_interval=None, json=False, one_test=False, ipv6=False, printpkg=False, pkt_head_size = None,
+                 profile=False, profile_dump=None, profile_dump_mode='cprofile', quiet=False,
+                 trace=None, trace_time_scale=1.0, trace_rate=1.0, burst=None, burst_seed=None,
+                 zerocopy=False, sink=False, rcvbuf=None, rcvlowat=None, rxq_ovfl=False, tcp_info_interval=None,
+                 tcp_info_dump=None, reverse=False, bidir=False, affinity=None):
         self.bind_address = bind_address
         self.mode = mode
         self.host = host
@@ -20,6 +48,10 @@ class FlowGenerator:
         self.total_size = self.to_bytes(total_size)  # 总大小
         self.packet_size = packet_size  # 包大小
         self.bandwidth = self.to_bps(bandwidth)  # 带宽限制
+        # exp以外的分布使用Distributions中的批量采样器，只在客户端创建
+        self.size_sampler = self.interval_sampler = self.bandwidth_sampler = None
+        if mode == 'client':
+            self.create_samplers(distributed_packets_per_second, distributed_packet_size, distributed_bandwidth)
         self.pkt_head_size = pkt_head_size
         self.frame_size = self.packet_size + self.pkt_head_size
         self.pps = None if self.bandwidth is None else int(self.bandwidth / (self.frame_size * 8))
@@ -29,6 +61,10 @@ class FlowGenerator:
         self.dist_bw = distributed_bandwidth
         self.bandwidth_reset_interval = bandwidth_reset_interval if bandwidth_reset_interval else INF
         self.mean_pkt_interval = 1.0 / self.pps if self.pps else None
+        # 突发模型（--burst），速率由模型决定
+        self.burst = None
+        if mode == 'client' and burst:
+            self.open_burst(burst, burst_seed)
         
         self.total_sent = 0
         self.total_packets = 0
@@ -37,7 +73,11 @@ class FlowGenerator:
         self.start_time = None
         self.socket = None
         self.stats_thread = None
-        self.json = json
+        # quiet：供FlowAPI在进程内调用，不打印任何内容，结果保存在summary/error中
+        self.quiet = quiet
+        self.json = json or quiet
+        self.summary = None
+        self.error = None
         self.one_test = one_test
         
         # 存储统计数据
@@ -47,8 +87,45 @@ class FlowGenerator:
         self.ipv6 = ipv6
         self.printpkg = printpkg
         self.pkg_data = "None"
+        # 抓包回放（--trace），在run_client中打开
+        self.trace_path = trace
+        self.trace_time_scale = trace_time_scale
+        self.trace_rate = trace_rate
+        self.trace = None
+        # MSG_ZEROCOPY发送（--zerocopy），在run_client中开启
+        self.zerocopy = zerocopy
+        self.zerocopy_socket = None
+        # 服务器接收调优：TCP丢弃模式(--sink)、SO_RCVBUF(--rcvbuf)、SO_RCVLOWAT(--rcvlowat)
+        self.sink = sink
+        self.rcvbuf = self.to_bytes(rcvbuf)
+        self.rcvlowat = self.to_bytes(rcvlowat)
+        self.effective_rcvbuf = None
+        # UDP接收端：开启SO_RXQ_OVFL(--rxq-ovfl)，从辅助数据读取本机接收缓冲区溢出丢弃的包数
+        self.rxq_ovfl = rxq_ovfl
+        self.socket_drops = 0   # 内核对这个socket的累计丢包计数
+        self.local_drops = 0    # 本次测试中的丢包数
+        # TCP客户端高频TCP_INFO采样（--tcp-info-interval），在run_client中开启
+        self.tcp_info_interval = tcp_info_interval
+        self.tcp_info_dump = tcp_info_dump
+        self.tcp_info = None
+        # 反向(-R)/双向(--bidir)测试：服务器按send_options发送反向流，见Duplex.py
+        self.reverse = reverse
+        self.bidir = bidir
+        self.send_options = dict(duration=duration, total_size=self.total_size, packet_size=packet_size,
+                                 bandwidth=self.bandwidth, interval=interval,
+                                 distributed_packets_per_second=distributed_packets_per_second,
+                                 distributed_packet_size=distributed_packet_size,
+                                 distributed_bandwidth=distributed_bandwidth,
+                                 bandwidth_reset_interval=bandwidth_reset_interval, burst=burst, burst_seed=burst_seed)
+        # 反向/双向测试中的方向('TX'或'RX')，统计行带此前缀，JSON结果由Duplex合并后打印
+        self.direction = None
+        # CPU亲和性和调度优先级（Affinity.AffinityPlan），未指定时为None，线程不绑定
+        self.affinity = affinity
+        # 热路径剖析（--profile），未开启时为None
+        self.profiler = PhaseProfiler(profile_dump, profile_dump_mode, affinity=affinity) if profile or profile_dump else None
 
-    def to_bps(self, value):
+    @staticmethod
+    def to_bps(value):
         if value is None:
             return None
         if type(value) != str:
@@ -61,7 +138,8 @@ class FlowGenerator:
             return int(value[:-1]) * 1000 * 1000 * 1000
         return int(value)
 
-    def to_bytes(self, value):
+    @staticmethod
+    def to_bytes(value):
         if value is None:
             return None
         if type(value) != str:
@@ -74,29 +152,133 @@ class FlowGenerator:
             return int(value[:-1]) * 1024 * 1024 * 1024
         return int(value)
 
+    def report_error(self, message, error):
+        """记录错误，quiet模式下只保存不打印"""
+        self.error = error
+        if not self.quiet:
+            print(f"{message}: {error}")
+
+    def tune_receive(self, sock):
+        """在服务器socket上设置接收缓冲区和低水位，记录内核实际采用的缓冲区大小"""
+        if self.rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if self.rcvlowat:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVLOWAT, self.rcvlowat)
+        if self.rxq_ovfl:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        self.effective_rcvbuf = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    def apply_affinity(self, role):
+        """在role角色的线程开始时调用，按AffinityPlan绑定CPU和设置调度策略"""
+        if self.affinity:
+            self.affinity.apply(role)
+
+    def stop_clock(self):
+        """客户端发送结束时调用：停止统计并记录结束时刻，之后的FIN/FIN_ACK交换（服务器无响应时可达数秒）不计入测试时长"""
+        if self.is_running:
+            self.is_running = False
+            self.test_end_time = time.time()
+
+    def start_profiler(self, sock):
+        """开启剖析：用计时版本替换热路径上的方法，返回计时版本的sock"""
+        if not self.profiler:
+            return sock
+        if 'create_test_data' not in self.__dict__:
+            self.create_test_data = self.profiler.wrap('build', self.create_test_data)
+            self.return_packet_interval = self.profiler.wrap('sample', self.return_packet_interval)
+            self.reset_bandwidth = self.profiler.wrap('sample', self.reset_bandwidth)
+        self.profiler.start()
+        return sock if hasattr(sock, '_sock') else self.profiler.wrap_socket(sock)
+
+    def stop_profiler(self):
+        if self.profiler:
+            self.profiler.stop()
+
+    def open_zerocopy(self, sock):
+        """开启零拷贝发送：返回包装后的sock，负载改为共用缓冲区的切片"""
+        if not self.zerocopy:
+            return sock
+        from ZeroCopy import ZeroCopySocket
+        self.zerocopy_socket = ZeroCopySocket(sock)
+        create = self.zerocopy_test_data(self.zerocopy_socket.payload)
+        self.create_test_data = self.profiler.wrap('build', create) if self.profiler else create
+        return self.zerocopy_socket
+
+    def zerocopy_test_data(self, payload):
+        next_packet_size = self.next_packet_size
+        return lambda: payload[:next_packet_size()]
+
+    def create_samplers(self, dist_pps, dist_len, dist_bw):
+        """为exp以外的分布创建采样器，并用它们替换包长和包间隔的采样方法"""
+        if all(dist in (None, 'exp') for dist in (dist_pps, dist_len, dist_bw)):
+            return
+        require_numpy("distributions other than exp (-dpps/-dl/-db)")
+        from Distributions import create_sampler  # 只在使用这些分布时导入numpy
+        if dist_len not in (None, 'exp'):
+            self.size_sampler = create_sampler(dist_len, self.packet_size, integer=True, low=1, high=64000)
+            # imix/经验分布的均值与-l无关，按实际均值换算带宽对应的包速率
+            self.packet_size = max(1, int(round(self.size_sampler.mean)))
+            self.next_packet_size = self.size_sampler
+        if dist_pps not in (None, 'exp'):
+            sampler = self.interval_sampler = create_sampler(dist_pps, low=0)
+            if sampler.relative:
+                self.return_packet_interval = lambda: sampler() * self.mean_pkt_interval
+            else:
+                self.return_packet_interval = sampler
+        if dist_bw not in (None, 'exp') and self.bandwidth is not None:
+            self.bandwidth_sampler = create_sampler(dist_bw, self.bandwidth, low=1)
+
+    # exp分布使用标准库random：逐个标量采样比numpy更快，也避免启动时导入numpy
     def reset_bandwidth(self):
         if self.dist_bw == None:
             return
         if self.dist_bw == 'exp' and self.bandwidth != None:
-            bandwidth = int(np.random.exponential(self.bandwidth))
-            self.pps = int(bandwidth / (self.frame_size * 8))
-            self.mean_pkt_interval = 1.0 / self.pps 
+            bandwidth = int(random.expovariate(1.0 / self.bandwidth))
+        elif self.bandwidth_sampler:
+            bandwidth = int(self.bandwidth_sampler())
         else:
             raise ValueError("Unsupported bandwidth distribution")
+        self.pps = max(1, int(bandwidth / (self.frame_size * 8)))
+        self.mean_pkt_interval = 1.0 / self.pps
 
-    def create_test_data(self):
+    def open_trace(self, min_size=1, max_size=64000):
+        """开启回放：用调度替换包长和包间隔的采样方法，发送循环本身不变"""
+        if not self.trace_path:
+            return
+        require_numpy("trace replay (--trace)")
+        from Trace import TraceSchedule  # 只在回放时导入numpy
+        self.trace = TraceSchedule(self.trace_path, self.type, self.ipv6, self.trace_time_scale, self.trace_rate,
+                                   min_size, max_size)
+        self.next_packet_size = self.trace.next_size
+        self.return_packet_interval = self.trace.next_gap
+        # 发送时刻完全由调度决定，走按时间发送的分支
+        self.pps = self.pps or 1
+
+    def open_burst(self, spec, seed=None):
+        """开启突发模型：用预先生成的间隔调度替换包间隔的采样方法，平均速率由模型给出"""
+        require_numpy("burst models (--burst)")
+        from Bursts import BurstSchedule  # 只在使用突发模型时导入numpy
+        self.burst = BurstSchedule(spec, self.frame_size, seed)
+        self.pps = self.burst.mean_pps
+        self.mean_pkt_interval = 1.0 / self.pps
+        self.return_packet_interval = self.burst
+
+    def next_packet_size(self):
         if self.dist_len == None:
-            return b'X' * self.packet_size
+            return self.packet_size
         if self.dist_len == 'exp':
-            return b'X' * min(int(np.random.exponential(self.packet_size)), 64000)
+            return min(int(random.expovariate(1.0 / self.packet_size)), 64000)
         else:
             raise ValueError("Unsupported packet size distribution")
+
+    def create_test_data(self):
+        return b'X' * self.next_packet_size()
     
     def return_packet_interval(self):
         if self.dist_pps == None:
             return self.mean_pkt_interval
         if self.dist_pps == 'exp':
-            return np.random.exponential(self.mean_pkt_interval)
+            return random.expovariate(1.0 / self.mean_pkt_interval)
         else:
             raise ValueError("Unsupported packet interval distribution")
 
@@ -109,13 +291,19 @@ class FlowGenerator:
         self.retr = 0
         last_max_seq_no = 0
         last_jitters = 0
+        last_connections = 0
+        last_local_drops = 0
         pkg_data = "None"
         self.json_info = {"intervals":[], "end":{}}
+        tag = f"[{self.direction}] " if self.direction else ""
+        self.apply_affinity('stats')
 
         while True:
             current_time = time.time()
             time.sleep(0.005)
             if current_time - last_time > self.interval or not self.is_running:
+                if self.profiler:
+                    stats_start = perf_counter_ns()
                 interval_time = current_time - last_time
                 begin_time = last_time - start_time
                 end_time = current_time - start_time
@@ -148,16 +336,14 @@ class FlowGenerator:
 
                 if self.type == 'tcp' and self.mode == 'client':
                     if sys.platform == 'linux':
-                        fmt = "B"*7 + "I"*24
-                        info = self.socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, 104)
-                        x = struct.unpack(fmt, info)
+                        x, _ = read_tcp_info(self.socket)
                         
-                        mss = x[26]      # advmss字段
-                        cwnd = x[25]     # snd_cwnd字段
+                        mss = x[COLUMN['advmss'] - 1]
+                        cwnd = x[COLUMN['snd_cwnd'] - 1]
                         cwnd = cwnd * mss if cwnd > 0 else 0  # cwnd(字节)
-                        retr = x[14] - self.retr  # retrans重传计数
-                        self.retr = x[14]
-                        rtt = x[22]      # rtt (微秒)
+                        retr = x[COLUMN['retrans'] - 1] - self.retr  # retrans重传计数
+                        self.retr = x[COLUMN['retrans'] - 1]
+                        rtt = x[COLUMN['rtt'] - 1]      # rtt (微秒)
                     elif sys.platform == 'win32':
                         cwnd =  0
                         retr = 0
@@ -168,6 +354,8 @@ class FlowGenerator:
                         'retr': retr,    # 重传次数
                         'rtt': rtt,      # RTT(微秒)
                     })
+                    if self.tcp_info:
+                        interval_stats['tcp_info'] = self.tcp_info.interval_summary()
                 elif self.type == 'udp' and self.mode == 'server':
                     lost_packets = real_sent_packets_diff - packets_diff
                     lost_percent = 100 * (lost_packets / real_sent_packets_diff if real_sent_packets_diff > 0 else 0)
@@ -179,6 +367,20 @@ class FlowGenerator:
                         'jitter_ms': avg_jitter,    # 平均抖动
                         'delay_ms': avg_delay,      # 平均延迟
                     })
+                    if self.rxq_ovfl:
+                        # 本机接收缓冲区溢出丢弃的包，其余的丢包才发生在网络中
+                        local_drops = self.local_drops
+                        interval_stats['local_drops'] = local_drops - last_local_drops
+                        interval_stats['network_lost_packets'] = max(0, lost_packets - interval_stats['local_drops'])
+                        last_local_drops = local_drops
+                elif self.type == 'tcp' and self.mode == 'server' and self.cps_test:
+                    # 新建连接速率测试：这个区间内接受的连接数
+                    connections = self.connections
+                    interval_stats['connections'] = connections - last_connections
+                    interval_stats['connections_per_second'] = (connections - last_connections) / interval_time
+                    last_connections = connections
+                elif self.type == 'udp' and self.mode == 'client' and self.rate_controller:
+                    interval_stats['target_bps'] = self.pps * self.frame_size * 8  # 速率控制器当前的目标速率
 
 
                 self.interval_data.append(interval_stats)
@@ -186,36 +388,42 @@ class FlowGenerator:
                     self.json_info["intervals"].append(interval_stats)
                 else:
                     if self.type == 'tcp' and self.mode == 'client':
-                        print(f"[ {begin_time:.2f}-{end_time:.2f} s]  "
+                        print(f"{tag}[ {begin_time:.2f}-{end_time:.2f} s]  "
                             f"Transfer: {bytes_diff/(1024*1024):.2f} MB  "
                             f"Bandwidth: {current_bandwidth:.2f} Mbps  "
                             f"Datarate: {current_data_rate:.2f} Mbps  "
                             f"Cwnd: {cwnd}  "
                             f"Retr: {retr}  "
                             f"RTT: {rtt:.2f}  ")
+                        if interval_stats.get('tcp_info'):
+                            print("            " + self.describe_tcp_info(interval_stats['tcp_info']))
                     elif self.type == 'tcp' and self.mode == 'server':
-                        print(f"[ {begin_time:.2f}-{end_time:.2f} s]  "
+                        print(f"{tag}[ {begin_time:.2f}-{end_time:.2f} s]  "
                             f"Received: {bytes_diff/(1024*1024):.2f} MB  "
                             f"Bandwidth: {current_bandwidth:.2f} Mbps  "
-                            f"Datarate: {current_data_rate:.2f} Mbps  ")
+                            f"Datarate: {current_data_rate:.2f} Mbps  "
+                            + (f"Accepts: {interval_stats['connections_per_second']:.0f}/s  "
+                               if 'connections' in interval_stats else ""))
                     elif self.type == 'udp' and self.mode == 'client':
-                        print(f"[ {begin_time:.2f}-{end_time:.2f} s]  "
+                        print(f"{tag}[ {begin_time:.2f}-{end_time:.2f} s]  "
                             f"Transfer: {bytes_diff/(1024*1024):.2f} MB  "
                             f"Bandwidth: {current_bandwidth:.2f} Mbps  "
                             f"Datarate: {current_data_rate:.2f} Mbps  "
                             f"Total Datagrams: {packets_diff}  "
-                            f"Package Data: {pkg_data} ")
+                            + (f"Target: {interval_stats['target_bps']/1e6:.2f} Mbps  " if 'target_bps' in interval_stats else "")
+                            + f"Package Data: {pkg_data} ")
                     elif self.type == 'udp' and self.mode == 'server':
-                        print(f"[ {begin_time:.2f}-{end_time:.2f} s]  "
+                        print(f"{tag}[ {begin_time:.2f}-{end_time:.2f} s]  "
                             f"Transfer: {bytes_diff/(1024*1024):.2f} MB  "
                             f"Bitrate: {current_bandwidth:.2f} Mbps  "
                             f"Datarate: {current_data_rate:.2f} Mbps  "
                             f"Jitters: {avg_jitter:.3f} ms  "
                             f"Delay: {avg_delay:.3f} ms  "
                             f"Lost/Total Datagrams: {lost_packets}/{real_sent_packets_diff} ({lost_percent:.0f}%)  "
-                            f"Package Data: {pkg_data} ")
+                            + (f"Local Drops: {interval_stats['local_drops']}  " if 'local_drops' in interval_stats else "")
+                            + f"Package Data: {pkg_data} ")
                     else:
-                        print(f"[ {begin_time:.2f}-{end_time:.2f} s]  "
+                        print(f"{tag}[ {begin_time:.2f}-{end_time:.2f} s]  "
                             f"Transfer: {bytes_diff/(1024*1024):.2f} MB  "
                             f"Bandwidth: {current_bandwidth:.2f} Mbps  "
                             f"Datarate: {current_data_rate:.2f} Mbps  "
@@ -229,9 +437,37 @@ class FlowGenerator:
                     last_jitters = last_jitters + jitters_diff
                     last_delay = last_delay + delay_diff
                     last_max_seq_no = last_max_seq_no + real_sent_packets_diff
+                if self.profiler:
+                    self.profiler.record('stats', perf_counter_ns() - stats_start)
             if not self.is_running:
                 break
 
+    @staticmethod
+    def describe_tcp_info(info):
+        """一行文字描述TcpInfoSampler的汇总"""
+        if not info:
+            return "no samples"
+        text = f"rtt {info['rtt_ms']:.3f} ms"
+        if 'min_rtt_ms' in info:
+            text += f" (min {info['min_rtt_ms']:.3f})"
+        if 'delivery_rate_bps' in info:
+            text += f"  delivery {info['delivery_rate_bps']/1e6:.2f} Mbps"
+        if 'pacing_rate_bps' in info:
+            text += f"  pacing {info['pacing_rate_bps']/1e6:.2f} Mbps"
+        if 'limited_by' in info:
+            text += (f"  limited rwnd/sndbuf {100*info['rwnd_limited']:.0f}%/{100*info['sndbuf_limited']:.0f}%"
+                     f"  app {100*info.get('app_limited', 0):.0f}%  -> {info['limited_by']}")
+        return text
+
+    @staticmethod
+    def describe_flows(flows):
+        """一行文字描述服务器端按流汇总的结果(flow_table_summary)"""
+        text = f"Flows seen: {flows['flows_seen']} from {flows['sources_seen']} source tuples"
+        if flows['lost_percent']:
+            text += (f", {flows['flows_with_loss']} with loss, per-flow loss median "
+                     f"{flows['lost_percent']['p50']:.2f}% / p99 {flows['lost_percent']['p99']:.2f}%")
+        return text
+
     def print_summary(self):
         """打印测试总结"""
         if not self.interval_data:
@@ -250,7 +486,7 @@ class FlowGenerator:
                         "data_bits_per_second": avg_data_rate * 1000000
                     }
         else:
-            print("\n=== Test Summary ===")
+            print(f"\n=== Test Summary{f' ({self.direction})' if self.direction else ''} ===")
             print(f"Duration: {test_duration:.2f} seconds")
             print(f"Total Data: {self.total_sent/(1024*1024):.2f} MB")
             print(f"Average Bandwidth: {avg_bandwidth:.2f} Mbps")
@@ -258,12 +494,18 @@ class FlowGenerator:
         if self.type == 'tcp' and self.mode == 'client':
             if self.json:
                 sum_info["max_snd_cwnd"] = max([x['cwnd'] for x in self.interval_data])
-                sum_info["mean_rtt"] = np.mean([x['rtt'] for x in self.interval_data])
+                sum_info["mean_rtt"] = sum(x['rtt'] for x in self.interval_data) / len(self.interval_data)
                 sum_info["retransmits"] = self.retr
             else:
                 print(f"Max_cwnd: {max([x['cwnd'] for x in self.interval_data])} bytes")
-                print(f"Mean_RTT: {np.mean([x['rtt'] for x in self.interval_data]):.2f}") 
+                print(f"Mean_RTT: {sum(x['rtt'] for x in self.interval_data) / len(self.interval_data):.2f}") 
                 print(f"Retransmissions: {self.retr}")
+            if self.tcp_info:
+                tcp_info = self.tcp_info.total_summary()
+                if self.json:
+                    sum_info["tcp_info"] = tcp_info
+                elif tcp_info:
+                    print("TCP_INFO: " + self.describe_tcp_info(tcp_info))
         elif self.type == 'udp' and self.mode == 'server':
             lost_packets = self.total_sent_packets - self.total_packets
             avg_jitter = self.total_jitters / self.total_packets if self.total_packets > 0 else 0
@@ -277,15 +519,152 @@ class FlowGenerator:
                 print("Jitters: {:.3f} ms".format(avg_jitter))
                 print("Delay: {:.3f} ms".format(avg_delay))
                 print(f"Lost/Total Datagrams: {lost_packets}/{self.total_sent_packets} ({lost_packets/self.total_sent_packets*100:.0f}%)")
+            if self.rcvbuf or self.rxq_ovfl:
+                receive = {'rcvbuf': self.effective_rcvbuf}
+                if self.rxq_ovfl:
+                    receive['local_drops'] = self.local_drops
+                    receive['network_lost_packets'] = max(0, lost_packets - self.local_drops)
+                    # 一半以上的丢包发生在本机接收缓冲区：瓶颈是接收端，而不是被测设备或网络
+                    receive['receiver_bottleneck'] = lost_packets > 0 and 2 * self.local_drops >= lost_packets
+                if self.json:
+                    sum_info["receive"] = receive
+                else:
+                    print(f"Receive: rcvbuf {self.effective_rcvbuf} bytes"
+                          + (f", local drops {receive['local_drops']}, network loss {receive['network_lost_packets']}"
+                             if self.rxq_ovfl else ""))
+                    if receive.get('receiver_bottleneck'):
+                        print(f"Warning: this host's receive buffer dropped {self.local_drops} datagrams "
+                              f"({min(100, 100 * self.local_drops / lost_packets):.0f}% of the loss), the receiver is "
+                              f"the bottleneck (raise --rcvbuf and net.core.rmem_max)")
+            if self.flow_received:
+                flows = self.flow_table_summary()
+                if self.json:
+                    sum_info["flows"] = flows
+                else:
+                    print(self.describe_flows(flows))
         elif self.type == 'udp' and self.mode == 'client':
             lost_packets = self.total_packets - self.total_received_packets
             if self.json:
                 sum_info["lost_packets"] = lost_packets
                 sum_info["lost_percent"] = 100 * (lost_packets / self.total_packets)
+                if self.server_report:
+                    sum_info["server"] = self.server_report
+                if self.rate_controller:
+                    sum_info["rate_control"] = self.rate_control_summary()
+                if self.tx_ring:
+                    sum_info["tx_ring"] = self.tx_ring.summary()
             else:
                 print(f"Lost/Total Datagrams: {lost_packets}/{self.total_packets} ({lost_packets/self.total_packets*100:.0f}%)")
+                if self.server_report:
+                    print("Server Delay: {:.3f} ms  Jitters: {:.3f} ms".format(self.server_report.get('delay_ms', 0),
+                                                                           self.server_report.get('jitter_ms', 0))
+                          + (f"  Local Drops: {self.server_report['local_drops']}"
+                             if 'local_drops' in self.server_report else ""))
+                if self.rate_controller:
+                    rc = self.rate_control_summary()
+                    print(f"Rate control ({rc['controller']}): final {rc['final_bps']/1e6:.2f} Mbps, "
+                          f"{rc['reports']} reports, {rc['timeouts']} timeouts")
+                if self.tx_ring:
+                    ring = self.tx_ring.summary()
+                    print(f"TX ring ({ring['interface']}): {ring['frames']} frames in {ring['flushes']} sends "
+                          f"({ring['frames_per_flush']:.1f} per send)")
+
+        elif self.type == 'tcp' and self.mode == 'server':
+            if self.connections > 1:
+                if self.json:
+                    sum_info["connections"] = self.connections
+                    if self.cps_test:
+                        sum_info["connections_per_second"] = self.connections / test_duration
+                else:
+                    print(f"Connections: {self.connections}"
+                          + (f" ({self.connections / test_duration:.0f}/s)" if self.cps_test else ""))
+            if self.sink or self.rcvbuf or self.rcvlowat:
+                receive = {'sink': self.sink, 'rcvbuf': self.effective_rcvbuf, 'rcvlowat': self.rcvlowat}
+                if self.json:
+                    sum_info["receive"] = receive
+                else:
+                    print(f"Receive: {'sink (MSG_TRUNC)' if self.sink else 'copy'}, rcvbuf {self.effective_rcvbuf} bytes"
+                          + (f", rcvlowat {self.rcvlowat} bytes" if self.rcvlowat else ""))
+        elif self.type == 'cps':
+            connections = self.connection_summary()
+            if self.json:
+                sum_info["connections"] = connections
+            else:
+                print(f"Connections: {connections['connects']}/{connections['attempts']} established, "
+                      f"{connections['failures']} failed ({connections['timeouts']} timeouts), "
+                      f"{connections['connects_per_second']:.0f} connects/s")
+                for name in ('handshake_ms', 'transaction_ms'):
+                    latency = connections.get(name)
+                    if latency:
+                        print(f"{'Handshake' if name == 'handshake_ms' else 'Transaction'} latency: "
+                              f"min {latency['min']:.3f} / p50 {latency['p50']:.3f} / p90 {latency['p90']:.3f} / "
+                              f"p99 {latency['p99']:.3f} / max {latency['max']:.3f} ms")
+                if connections['errors']:
+                    print("Errors: " + ", ".join(f"{name} {count}" for name, count in connections['errors'].items()))
+        elif self.type == 'multi':
+            flows = self.flow_summary()
+            if flows['protocol'] == 'udp':
+                lost_packets = self.total_packets - self.total_received_packets
+                flows['lost_packets'] = lost_packets
+                flows['total_packets'] = self.total_packets
+            if self.json:
+                sum_info["flows"] = flows
+                if self.server_report:
+                    sum_info["server"] = self.server_report
+            else:
+                rates = flows['bits_per_second']
+                print(f"Flows: {flows['active_flows']}/{flows['flows']} active, per-flow rate "
+                      f"min {rates['min']/1e6:.3f} / median {rates['p50']/1e6:.3f} / max {rates['max']/1e6:.3f} Mbps")
+                if 'lost_packets' in flows:
+                    print(f"Lost/Total Datagrams: {lost_packets}/{self.total_packets} "
+                          f"({100 * lost_packets / max(self.total_packets, 1):.0f}%)")
+                if 'lost_percent' in flows:
+                    print(f"Flows with loss: {flows['flows_with_loss']}, per-flow loss "
+                          f"median {flows['lost_percent']['p50']:.2f}% / p99 {flows['lost_percent']['p99']:.2f}%")
+                if 'stalls' in flows:
+                    print(f"Send buffer stalls: {flows['stalls']}")
+        elif self.type == 'flowtable':
+            table = self.flow_table_report()
+            if self.json:
+                sum_info["flow_table"] = table
+            else:
+                print(f"Flows: {table['flows']} ({table['source_ports']} source ports x {table['destinations']} "
+                      f"destinations, {table['skipped_ports']} ports in use skipped), send errors {table['send_errors']}")
+                print(f"Lost/Total Datagrams: {table['lost_packets']}/{self.total_packets} ({table['lost_percent']:.0f}%)")
+                for report in table['servers']:
+                    if report.get('flow_summary'):
+                        print(f"{report['destination']}: " + self.describe_flows(report['flow_summary']))
+
+        if self.zerocopy_socket:
+            zc = self.zerocopy_socket.summary()
+            if self.json:
+                sum_info["zerocopy"] = zc
+            else:
+                print(f"Zero-copy sends: {zc['zerocopy']}/{zc['sends']} without copy, {zc['copied']} copied, "
+                      f"{zc['pending']} pending")
+
+        if self.burst and self.mode == 'client':
+            if self.json:
+                sum_info["burst"] = self.burst.describe()
+            else:
+                print(f"Burst model: {self.burst.spec} (mean {self.burst.describe()['mean_bps']/1e6:.2f} Mbps)")
+
+        if self.affinity:
+            affinity = self.affinity.summary()
+            if self.json:
+                sum_info["affinity"] = affinity
+            else:
+                print(self.affinity.describe(affinity))
+
+        if self.profiler:
+            if self.json:
+                sum_info["profile"] = self.profiler.summary()
+            else:
+                self.profiler.print_summary()
 
         if self.json:
             self.json_info["end"] = sum_info
-            print(json.dumps(self.json_info, indent=4))
+            self.summary = self.json_info
+            if not self.quiet and not self.direction:
+                print(json.dumps(self.json_info, indent=4))
         self.json_info = {}
\ No newline at end of file
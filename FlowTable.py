@@ -0,0 +1,241 @@
+"""流表压力测试：把流量分散到成千上万个五元组上，填满NAT和conntrack表，观察设备随流数增长的退化。
+
+预先创建一组UDP socket，分别绑定源端口范围(--src-ports)中的每个端口，可选地给出多个目的地址(--destinations)。
+每个(源端口, 目的地址)是一个流，发送循环按-b的总速率轮流(rr)或随机(random)地选择流发包。
+每个流有独立的序列号，包头的total_packets字段携带流编号，服务器据此按流汇总收包数和丢包率，
+在FIN_ACK中回报汇总结果（flow_summary），多个目的地址时分别回报。
+"""
+import errno
+import json as JSON
+import random
+import socket
+import threading
+import time
+
+from FlowGenerator import FlowGenerator, MAX_BURST
+from MultiFlow import raise_fd_limit, SPARE_FDS
+from UDPFlowGenerator import UDPPacket, PKT_HEAD_SIZE_V4, PKT_HEAD_SIZE_V6
+
+SPREADS = ('rr', 'random')
+
+
+def parse_port_range(spec):
+    """'20000-29999' -> range(20000, 30000)，单个端口也可以"""
+    first, _, last = spec.partition('-')
+    first = int(first)
+    last = int(last) if last else first
+    if not 1 <= first <= last <= 65535:
+        raise ValueError(f"Invalid source port range: {spec}")
+    return range(first, last + 1)
+
+
+def resolve(host, port, ipv6):
+    """解析为socket地址：FIN_ACK的来源地址要与它比较，名字和非规范的IPv6写法必须先转换"""
+    family = socket.AF_INET6 if ipv6 else socket.AF_INET
+    try:
+        return socket.getaddrinfo(host, port, family, socket.SOCK_DGRAM)[0][4]
+    except socket.gaierror as e:
+        raise ValueError(f"Cannot resolve destination {host}: {e}")
+
+
+def parse_destinations(spec, default_host, default_port, ipv6=False):
+    """逗号分隔的`地址[:端口]`，IPv6地址写作`[地址]:端口`；以@开头时从文件读取，每行一个。返回解析后的socket地址"""
+    if spec is None:
+        return [resolve(default_host, default_port, ipv6)]
+    if spec.startswith('@'):
+        with open(spec[1:], 'r') as f:
+            items = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    else:
+        items = [item.strip() for item in spec.split(',') if item.strip()]
+    destinations = []
+    for item in items:
+        if item.startswith('['):
+            host, _, port = item[1:].partition(']')
+            port = port.lstrip(':')
+        elif item.count(':') == 1:
+            host, _, port = item.partition(':')
+        else:
+            host, port = item, ''
+        destinations.append(resolve(host, int(port) if port else default_port, ipv6))
+    if not destinations:
+        raise ValueError("Destination list is empty")
+    return destinations
+
+
+class FlowTableGenerator(FlowGenerator):
+    def __init__(self, bind_address, host, port, mode, duration=None, total_size=None, packet_size=None, bandwidth=None,
+                 interval=1, json=False, one_test=False, ipv6=False, src_ports=None, destinations=None, spread='rr',
+                 **kwargs):
+        if bandwidth is None:
+            bandwidth = "1M"
+        if packet_size is None:
+            packet_size = max(80, min(1450, int(self.to_bps(bandwidth) * 0.005)))
+        pkt_head_size = PKT_HEAD_SIZE_V6 if ipv6 else PKT_HEAD_SIZE_V4
+        super().__init__(bind_address, host, port, mode, duration, total_size, packet_size, bandwidth, interval,
+                         None, None, None, None, json, one_test, ipv6, False, pkt_head_size, **kwargs)
+        self.type = 'flowtable'
+        if spread not in SPREADS:
+            raise ValueError(f"Spread must be one of {', '.join(SPREADS)}")
+        self.spread = spread
+        self.src_ports = parse_port_range(src_ports)
+        self.destinations = parse_destinations(destinations, host, port, ipv6)
+        self.sockets = []
+        self.skipped_ports = 0
+        self.send_errors = 0
+        self.seq = []
+        self.total_received_packets = 0
+        self.server_reports = []
+
+    def open_sockets(self):
+        """每个源端口一个socket；端口已被占用时跳过"""
+        raise_fd_limit(len(self.src_ports) + SPARE_FDS)
+        socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+        bind_address = self.bind_address or ''
+        for port in self.src_ports:
+            sock = socket.socket(socket_family, socket.SOCK_DGRAM)
+            try:
+                sock.bind((bind_address, port))
+            except OSError as e:
+                sock.close()
+                if e.errno != errno.EADDRINUSE:
+                    raise
+                self.skipped_ports += 1
+                continue
+            self.sockets.append(sock)
+        if not self.sockets:
+            raise ValueError("No port in the source port range could be bound")
+
+    def close_sockets(self):
+        for sock in self.sockets:
+            sock.close()
+        self.sockets = []
+
+    def handshake(self):
+        """用第一个socket向每个目的地址发送INIT，告知服务器流数"""
+        control = self.sockets[0]
+        options = JSON.dumps({'flows': len(self.sockets) * len(self.destinations)}).encode()
+        control.settimeout(0.1)
+        for destination in self.destinations:
+            for _ in range(10):  # 重试10次
+                init_packet = UDPPacket(UDPPacket.TYPE_INIT, int(time.time() * 1000000), 0, options)
+                control.sendto(init_packet.to_bytes(), destination)
+                try:
+                    data, addr = control.recvfrom(65535)
+                except socket.timeout:
+                    continue
+                if UDPPacket.from_bytes(data).seq_no == UDPPacket.TYPE_INIT_ACK:
+                    break
+            else:
+                raise Exception(f"Failed to establish connection with {destination[0]}:{destination[1]}")
+        control.settimeout(None)
+
+    def finish(self):
+        """向每个目的地址发送FIN（带发往该地址的包数），收集服务器的回报"""
+        control = self.sockets[0]
+        control.settimeout(0.1)
+        count = len(self.destinations)
+        for index, destination in enumerate(self.destinations):
+            # 流编号为 socket序号 * 目的地址数 + 目的地址序号
+            sent = sum(self.seq[index::count])
+            for _ in range(40):
+                fin_packet = UDPPacket(UDPPacket.TYPE_FIN, int(time.time() * 1000000), sent)
+                control.sendto(fin_packet.to_bytes(), destination)
+                try:
+                    data, addr = control.recvfrom(65535)
+                except (socket.timeout, OSError):
+                    continue
+                packet = UDPPacket.from_bytes(data)
+                if packet.seq_no != UDPPacket.TYPE_FIN_ACK or addr[:2] != destination[:2]:
+                    continue
+                self.total_received_packets += packet.total_packets
+                try:
+                    report = JSON.loads(packet.data) if packet.data else {}
+                except ValueError:
+                    report = {}
+                if isinstance(report, dict):
+                    report.pop('flows', None)
+                    report['destination'] = f"{destination[0]}:{destination[1]}"
+                    self.server_reports.append(report)
+                break
+
+    def run_client(self):
+        self.apply_affinity('send')
+        try:
+            self.open_sockets()
+            tuples = [(sock.sendto, destination) for sock in self.sockets for destination in self.destinations]
+            if not self.json:
+                print(f"UDP Client spreading packets over {len(tuples)} flows ({len(self.sockets)} source ports x "
+                      f"{len(self.destinations)} destinations, {self.spread})")
+            self.handshake()
+            if not self.json:
+                print("Connection established")
+
+            count = len(tuples)
+            seq = self.seq = [0] * count
+            pack = UDPPacket.HEADER.pack
+            payload = b'x' * max(0, self.packet_size - UDPPacket.HEADER_SIZE)
+            size = len(payload) + UDPPacket.HEADER_SIZE + self.pkt_head_size
+            randrange = random.randrange
+            index = -1
+
+            self.is_running = True
+            self.test_start_time = self.start_time = time.time()
+            self.stats_thread = threading.Thread(target=self.print_statistics)
+            self.stats_thread.daemon = True
+            self.stats_thread.start()
+
+            interval = self.mean_pkt_interval
+            next_send_time = time.time()
+            try:
+                while True:
+                    current_time = time.time()
+                    if self.duration and current_time - self.start_time >= self.duration:
+                        break
+                    if self.total_size and self.total_sent >= self.total_size:
+                        break
+                    burst = 0
+                    while burst < MAX_BURST and current_time > next_send_time:
+                        burst += 1
+                        next_send_time += interval
+                        if self.spread == 'rr':
+                            index = index + 1 if index + 1 < count else 0
+                        else:
+                            index = randrange(count)
+                        sendto, destination = tuples[index]
+                        s = seq[index] + 1
+                        try:
+                            sendto(pack(s, int(time.time() * 1000000), index) + payload, destination)
+                        except OSError:
+                            self.send_errors += 1
+                            continue
+                        seq[index] = s
+                        self.total_sent += size
+                        self.total_packets += 1
+            except KeyboardInterrupt:
+                pass
+
+            self.stop_clock()
+            self.finish()
+            if self.stats_thread:
+                self.stats_thread.join()
+
+            self.print_summary()
+
+        except Exception as e:
+            self.report_error("Client error", e)
+        finally:
+            self.close_sockets()
+
+    def flow_table_report(self):
+        lost_packets = self.total_packets - self.total_received_packets
+        return {
+            'flows': len(self.sockets) * len(self.destinations),
+            'source_ports': len(self.sockets),
+            'skipped_ports': self.skipped_ports,
+            'destinations': len(self.destinations),
+            'spread': self.spread,
+            'send_errors': self.send_errors,
+            'lost_packets': lost_packets,
+            'lost_percent': 100 * lost_packets / self.total_packets if self.total_packets else 0,
+            'servers': self.server_reports,
+        }
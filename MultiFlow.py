@@ -0,0 +1,362 @@
+"""多流客户端：在一个进程、一个发送循环中模拟成千上万条UDP/TCP流。
+
+每条流有自己的socket（源端口）、速率、包长/包间隔分布和序列号空间，一个最小堆按下一次发送时刻
+决定哪条流发包。流组写在JSON文件中（--flow-file），或用--flows N把命令行的单流参数复制N份：
+
+    [
+        {"count": 900, "bandwidth": "64K", "packet_size": 200, "dist_pps": "exp"},
+        {"count": 100, "bandwidth": "2M", "dist_len": "imix"}
+    ]
+
+bandwidth是每条流的速率。UDP数据包的total_packets字段携带流编号，服务器据此按流统计丢包；
+TCP每条流是一个连接，服务器同时接受所有连接。
+"""
+import heapq
+import json as JSON
+import random
+import socket
+import threading
+import time
+
+from FlowGenerator import FlowGenerator, MAX_BURST, percentiles, require_numpy
+from UDPFlowGenerator import UDPPacket, PKT_HEAD_SIZE_V4, PKT_HEAD_SIZE_V6
+
+FLOW_KEYS = ('count', 'bandwidth', 'packet_size', 'dist_pps', 'dist_len')
+HEADER = UDPPacket.HEADER
+# TCP每个消息附加的以太网/IP/TCP头，与TCPFlowGenerator一致
+TCP_HEAD_SIZE_V4 = 54
+TCP_HEAD_SIZE_V6 = 74
+# 除流socket之外预留的文件描述符
+SPARE_FDS = 64
+
+
+class Flow:
+    """一条流的状态和计数"""
+    __slots__ = ('id', 'sock', 'bandwidth', 'packet_size', 'pps', 'interval', 'size', 'seq',
+                 'packets', 'bytes', 'errors', 'stalls', 'pending', 'received')
+
+    def __init__(self, flow_id, bandwidth, packet_size, pps):
+        self.id = flow_id
+        self.sock = None
+        self.bandwidth = bandwidth
+        self.packet_size = packet_size
+        self.pps = pps
+        self.interval = None
+        self.size = None
+        self.seq = 0
+        self.packets = 0
+        self.bytes = 0
+        self.errors = 0
+        self.stalls = 0         # TCP：发送缓冲区已满，这次发送时刻被跳过
+        self.pending = None     # TCP：没写完的消息剩余部分
+        self.received = None    # UDP：服务器回报的收包数
+
+
+def load_flow_groups(path):
+    with open(path, 'r') as f:
+        groups = JSON.load(f)
+    if not isinstance(groups, list) or not groups:
+        raise ValueError(f"{path}: expected a non-empty list of flow groups")
+    for group in groups:
+        unknown = set(group) - set(FLOW_KEYS)
+        if unknown:
+            raise ValueError(f"{path}: unknown flow keys: {', '.join(sorted(unknown))}")
+    return groups
+
+
+def raise_fd_limit(needed):
+    """每条流占用一个socket，默认1024个文件描述符不够时提高软限制"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft >= needed:
+        return
+    new = needed if hard == resource.RLIM_INFINITY else min(hard, needed)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (new, hard))
+
+
+class MultiFlowGenerator(FlowGenerator):
+    def __init__(self, bind_address, host, port, mode, duration=None, total_size=None, packet_size=None, bandwidth=None,
+                 interval=1, distributed_packets_per_second=None, distributed_packet_size=None,
+                 distributed_bandwidth=None, bandwidth_reset_interval=None, json=False, one_test=False, ipv6=False,
+                 printpkg=False, udp=True, flows=1, flow_file=None, flow_stats=None, **kwargs):
+        self.protocol = 'udp' if udp else 'tcp'
+        if udp:
+            pkt_head_size = PKT_HEAD_SIZE_V6 if ipv6 else PKT_HEAD_SIZE_V4
+        else:
+            pkt_head_size = TCP_HEAD_SIZE_V6 if ipv6 else TCP_HEAD_SIZE_V4
+        if flow_file:
+            groups = load_flow_groups(flow_file)
+        else:
+            groups = [{'count': flows, 'bandwidth': bandwidth, 'packet_size': packet_size,
+                       'dist_pps': distributed_packets_per_second, 'dist_len': distributed_packet_size}]
+        self.flows = self.create_flows(groups, bandwidth, packet_size, pkt_head_size)
+        # 基类的带宽、包长用于统计输出：所有流的总速率和平均包长
+        total_bandwidth = sum(flow.bandwidth for flow in self.flows)
+        mean_size = int(sum(flow.packet_size for flow in self.flows) / len(self.flows))
+        super().__init__(bind_address, host, port, mode, duration, total_size, mean_size, total_bandwidth, interval,
+                         None, None, None, None, json, one_test, ipv6, printpkg, pkt_head_size, **kwargs)
+        self.type = 'multi'
+        self.flow_stats = flow_stats
+        self.total_received_packets = 0
+        self.server_report = None
+        self.forced_quit = False
+
+    def create_flows(self, groups, bandwidth, packet_size, pkt_head_size):
+        """按流组创建流；同一组的流共用分布采样器，各自维护序列号和计数"""
+        flows = []
+        for group in groups:
+            count = int(group.get('count', 1))
+            if count < 1:
+                raise ValueError("Flow count must be at least 1")
+            group_bw = self.to_bps(group.get('bandwidth') or bandwidth or '1M')
+            group_size = group.get('packet_size') or packet_size
+            if group_size is None:
+                limit = 1450 if self.protocol == 'udp' else 64000
+                group_size = max(80, min(limit, int(group_bw * 0.005)))
+            interval_of, size_of, group_size = self.group_samplers(group.get('dist_pps'), group.get('dist_len'),
+                                                                   int(group_size))
+            pps = group_bw / ((group_size + pkt_head_size) * 8)
+            if pps <= 0:
+                raise ValueError("Flow bandwidth must be positive")
+            for _ in range(count):
+                flow = Flow(len(flows), group_bw, group_size, pps)
+                flow.interval = interval_of(1.0 / pps)
+                flow.size = size_of
+                flows.append(flow)
+        return flows
+
+    def group_samplers(self, dist_pps, dist_len, packet_size):
+        """返回(按平均间隔生成间隔函数的工厂, 包长函数, 平均包长)"""
+        if dist_pps is None:
+            interval_of = lambda mean: (lambda: mean)
+        elif dist_pps == 'exp':
+            expovariate = random.expovariate
+            interval_of = lambda mean: (lambda: expovariate(1.0 / mean))
+        else:
+            require_numpy("distributions other than exp (-dpps/-dl)")
+            from Distributions import create_sampler  # 只在使用这些分布时导入numpy
+            sampler = create_sampler(dist_pps, low=0)
+            if sampler.relative:
+                interval_of = lambda mean: (lambda: sampler() * mean)
+            else:
+                interval_of = lambda mean: sampler
+
+        if dist_len is None:
+            size_of = lambda: packet_size
+        elif dist_len == 'exp':
+            expovariate = random.expovariate
+            size_of = lambda: min(int(expovariate(1.0 / packet_size)), 64000)
+        else:
+            require_numpy("distributions other than exp (-dpps/-dl)")
+            from Distributions import create_sampler
+            size_of = create_sampler(dist_len, packet_size, integer=True, low=1, high=64000)
+            packet_size = max(1, int(round(size_of.mean)))
+        return interval_of, size_of, packet_size
+
+    def open_sockets(self):
+        raise_fd_limit(len(self.flows) + SPARE_FDS)
+        socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+        for flow in self.flows:
+            if self.protocol == 'udp':
+                flow.sock = socket.socket(socket_family, socket.SOCK_DGRAM)
+                flow.sock.connect((self.host, self.port))
+            else:
+                flow.sock = socket.socket(socket_family, socket.SOCK_STREAM)
+                flow.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                flow.sock.connect((self.host, self.port))
+                flow.sock.setblocking(False)
+
+    def close_sockets(self):
+        for flow in self.flows:
+            if flow.sock:
+                flow.sock.close()
+                flow.sock = None
+
+    def handshake(self):
+        """UDP：通过第一条流的socket建立测试，INIT中告知服务器流数"""
+        control = self.flows[0].sock
+        options = JSON.dumps({'flows': len(self.flows)}).encode()
+        control.settimeout(0.1)
+        for _ in range(10):  # 重试10次
+            init_packet = UDPPacket(UDPPacket.TYPE_INIT, int(time.time() * 1000000), 0, options)
+            try:
+                control.send(init_packet.to_bytes())
+                packet = UDPPacket.from_bytes(control.recv(65535))
+            except socket.timeout:
+                continue
+            except OSError:
+                # 已连接的socket收到ICMP端口不可达后，下一次send或recv立即报错；
+                # 等满一个重试间隔，与单流客户端一样重试约1秒
+                time.sleep(0.1)
+                continue
+            if packet.seq_no == UDPPacket.TYPE_INIT_ACK:
+                break
+        else:
+            raise Exception("Failed to establish connection")
+        control.settimeout(None)
+
+    def finish(self):
+        """UDP：发送FIN并读取服务器回报的总收包数和各流收包数"""
+        control = self.flows[0].sock
+        control.settimeout(0.1)
+        for _ in range(40):
+            fin_packet = UDPPacket(UDPPacket.TYPE_FIN, int(time.time() * 1000000), self.total_packets)
+            try:
+                control.send(fin_packet.to_bytes())
+                packet = UDPPacket.from_bytes(control.recv(65535))
+            except socket.timeout:
+                continue
+            except OSError:
+                continue
+            if packet.seq_no != UDPPacket.TYPE_FIN_ACK:
+                continue
+            self.total_received_packets = packet.total_packets
+            try:
+                report = JSON.loads(packet.data) if packet.data else None
+            except ValueError:
+                report = None
+            if isinstance(report, dict):
+                for flow_id, received in report.pop('flows', {}).items():
+                    if int(flow_id) < len(self.flows):
+                        self.flows[int(flow_id)].received = received
+                self.server_report = report
+            break
+
+    def send_udp(self, flow):
+        seq = flow.seq + 1
+        data = HEADER.pack(seq, int(time.time() * 1000000), flow.id) + b'x' * max(0, flow.size() - 16)
+        try:
+            flow.sock.send(data)
+        except OSError:
+            flow.errors += 1
+            return
+        flow.seq = seq
+        sent = len(data) + self.pkt_head_size
+        flow.packets += 1
+        flow.bytes += sent
+        self.total_sent += sent
+        self.total_packets += 1
+
+    def send_tcp(self, flow):
+        data = flow.pending
+        if data is None:
+            data = b'x' * flow.size()
+        try:
+            n = flow.sock.send(data)
+        except BlockingIOError:
+            # 发送缓冲区已满：保留消息，这一次发送时刻不再生成新数据
+            flow.pending = data
+            flow.stalls += 1
+            return
+        except OSError:
+            flow.errors += 1
+            return
+        flow.bytes += n
+        self.total_sent += n
+        if n < len(data):
+            flow.pending = data[n:]
+            return
+        flow.pending = None
+        flow.bytes += self.pkt_head_size
+        flow.packets += 1
+        self.total_sent += self.pkt_head_size
+        self.total_packets += 1
+
+    def run_client(self):
+        self.apply_affinity('send')
+        try:
+            if not self.json:
+                print(f"{self.protocol.upper()} Client opening {len(self.flows)} flows to {self.host}:{self.port}")
+            self.open_sockets()
+            if self.protocol == 'udp':
+                self.handshake()
+            if not self.json:
+                print("Connection established")
+
+            flows = self.flows
+            send = self.send_udp if self.protocol == 'udp' else self.send_tcp
+            self.is_running = True
+            self.test_start_time = self.start_time = time.time()
+            # 各流的第一个包在一个平均间隔内随机错开，避免所有流同相发送
+            heap = [(self.start_time + random.random() / flow.pps, flow.id) for flow in flows]
+            heapq.heapify(heap)
+            heapreplace = heapq.heapreplace
+
+            self.stats_thread = threading.Thread(target=self.print_statistics)
+            self.stats_thread.daemon = True
+            self.stats_thread.start()
+
+            try:
+                while True:
+                    current_time = time.time()
+                    if self.duration and current_time - self.start_time >= self.duration:
+                        break
+                    if self.total_size and self.total_sent >= self.total_size:
+                        break
+                    burst = 0
+                    while burst < MAX_BURST:
+                        next_send_time, flow_id = heap[0]
+                        if next_send_time > current_time:
+                            break
+                        flow = flows[flow_id]
+                        send(flow)
+                        heapreplace(heap, (next_send_time + flow.interval(), flow_id))
+                        burst += 1
+            except KeyboardInterrupt:
+                self.forced_quit = True
+
+            self.stop_clock()
+            if self.protocol == 'udp':
+                self.finish()
+            if self.stats_thread:
+                self.stats_thread.join()
+
+            self.print_summary()
+            if self.flow_stats:
+                self.write_flow_stats(self.flow_stats)
+
+        except Exception as e:
+            self.report_error("Client error", e)
+        finally:
+            self.close_sockets()
+
+    def flow_summary(self):
+        """各流的统计分布：速率、包数和（UDP）丢包率的百分位数"""
+        seconds = max(self.test_end_time - self.test_start_time, 1e-9)
+        summary = {
+            'protocol': self.protocol,
+            'flows': len(self.flows),
+            'active_flows': sum(1 for flow in self.flows if flow.packets),
+            'errors': sum(flow.errors for flow in self.flows),
+            'bits_per_second': percentiles([flow.bytes * 8 / seconds for flow in self.flows]),
+            'packets': percentiles([flow.packets for flow in self.flows]),
+        }
+        if self.protocol == 'tcp':
+            summary['stalls'] = sum(flow.stalls for flow in self.flows)
+        else:
+            reported = [flow for flow in self.flows if flow.received is not None]
+            if reported:
+                losses = [100 * max(0, flow.packets - flow.received) / flow.packets
+                          for flow in reported if flow.packets]
+                summary['lost_percent'] = percentiles(losses)
+                summary['flows_with_loss'] = sum(1 for loss in losses if loss > 0)
+            elif self.server_report and 'flow_summary' in self.server_report:
+                # 流太多，服务器只回报了按流汇总的结果
+                server_summary = self.server_report['flow_summary']
+                summary['lost_percent'] = server_summary['lost_percent']
+                summary['flows_with_loss'] = server_summary['flows_with_loss']
+        return summary
+
+    def write_flow_stats(self, path):
+        """每条流一行的CSV"""
+        seconds = max(self.test_end_time - self.test_start_time, 1e-9)
+        with open(path, 'w') as f:
+            f.write("flow,local_port,bandwidth,packet_size,packets,bytes,bps,received,errors,stalls\n")
+            for flow in self.flows:
+                received = '' if flow.received is None else flow.received
+                f.write(f"{flow.id},{flow.sock.getsockname()[1] if flow.sock else ''},{flow.bandwidth},"
+                        f"{flow.packet_size},{flow.packets},{flow.bytes},{flow.bytes * 8 / seconds:.1f},"
+                        f"{received},{flow.errors},{flow.stalls}\n")
@@ -0,0 +1,179 @@
+"""AF_PACKET TX环（PACKET_MMAP, TPACKET_V2）发送，用于小包线速测试（Linux，需要CAP_NET_RAW）。
+
+环中的每一帧预先写好完整的以太网/IPv4/UDP头和负载，负载开头是UDPPacket的16字节包头，
+发送时只在原位改写序列号和时间戳、把帧标记为待发送，一批帧用一次send交给内核，没有逐包的系统调用和复制。
+
+源地址和源端口与握手用的UDP socket相同，服务器按普通UDP数据报接收，控制包（INIT/FIN等）仍走UDP socket。
+UDP校验和填0（IPv4允许不校验），IP头在各帧间不变，只计算一次。
+"""
+import mmap
+import socket
+import struct
+
+from UDPFlowGenerator import UDPPacket
+
+# Python的socket模块没有导出这些常量，取值见linux/socket.h和linux/if_packet.h
+SOL_PACKET = getattr(socket, 'SOL_PACKET', 263)
+PACKET_VERSION = 10
+PACKET_TX_RING = 13
+TPACKET_V2 = 1
+TP_STATUS_AVAILABLE = 0
+TP_STATUS_SEND_REQUEST = 1
+# struct tpacket_req: tp_block_size, tp_block_nr, tp_frame_size, tp_frame_nr
+TPACKET_REQ = struct.Struct('=IIII')
+TP_STATUS = struct.Struct('=I')
+TP_LEN = struct.Struct('=I')
+TP_LEN_OFFSET = 4
+# TX帧的数据从TPACKET_ALIGN(sizeof(struct tpacket2_hdr))开始
+TP_DATA_OFFSET = 32
+
+# 每帧2KB可容纳1500字节MTU的完整帧；一个环的帧数是每次最多发送的包数(MAX_BURST)的两倍
+FRAME_SIZE = 2048
+BLOCK_SIZE = 1 << 16
+RING_FRAMES = 512
+
+ETH_HEADER = struct.Struct('!6s6sH')
+IP_HEADER = struct.Struct('!BBHHHBBH4s4s')
+UDP_HEADER = struct.Struct('!HHHH')
+ETH_P_IP = 0x0800
+IFF_LOOPBACK = 0x8
+# UDPPacket包头在帧中的偏移
+HEADER_OFFSET = ETH_HEADER.size + IP_HEADER.size + UDP_HEADER.size
+
+
+def ip_checksum(header):
+    total = sum(struct.unpack(f'!{len(header) // 2}H', header))
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def parse_mac(text):
+    mac = bytes(int(part, 16) for part in text.split(':'))
+    if len(mac) != 6:
+        raise ValueError(f"Invalid MAC address: {text}")
+    return mac
+
+
+def read_sysfs(interface, name):
+    try:
+        with open(f'/sys/class/net/{interface}/{name}', 'r') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        raise ValueError(f"No such network interface: {interface}")
+
+
+def interface_mac(interface):
+    return parse_mac(read_sysfs(interface, 'address'))
+
+
+def route_source(host, port):
+    """内核为到host的路由选择的源地址"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.connect((host, port))
+        return probe.getsockname()[0]
+
+
+def resolve_mac(interface, host):
+    """host或其所在路由的网关在interface上的MAC地址，从/proc/net/arp中查找；回环接口为全0"""
+    if int(read_sysfs(interface, 'flags'), 16) & IFF_LOOPBACK:
+        return bytes(6)
+    neighbours = {}
+    with open('/proc/net/arp', 'r') as f:
+        for line in f.readlines()[1:]:
+            fields = line.split()
+            if len(fields) >= 6 and fields[5] == interface and fields[3] != '00:00:00:00:00:00':
+                neighbours[fields[0]] = fields[3]
+    if host in neighbours:
+        return parse_mac(neighbours[host])
+    # 不在同一网段：找interface上的网关
+    target = struct.unpack('=I', socket.inet_aton(host))[0]
+    with open('/proc/net/route', 'r') as f:
+        routes = [line.split() for line in f.readlines()[1:]]
+    best = None
+    for fields in routes:
+        if fields[0] != interface:
+            continue
+        destination, gateway, mask = (int(x, 16) for x in (fields[1], fields[2], fields[7]))
+        if target & mask == destination and gateway and (best is None or mask > best[1]):
+            best = (gateway, mask)
+    if best:
+        gateway = socket.inet_ntoa(struct.pack('=I', best[0]))
+        if gateway in neighbours:
+            return parse_mac(neighbours[gateway])
+    raise ValueError(f"No ARP entry for {host} on {interface}, specify --raw-dst-mac")
+
+
+def build_frame(src_mac, dst_mac, src, dst, packet_size):
+    """完整的以太网帧，UDP负载为packet_size字节，开头是序列号和时间戳为0的UDPPacket包头"""
+    udp_length = UDP_HEADER.size + packet_size
+    ip_length = IP_HEADER.size + udp_length
+    ip_header = IP_HEADER.pack(0x45, 0, ip_length, 0, 0x4000, 64, socket.IPPROTO_UDP, 0,
+                               socket.inet_aton(src[0]), socket.inet_aton(dst[0]))
+    ip_header = ip_header[:10] + struct.pack('!H', ip_checksum(ip_header)) + ip_header[12:]
+    payload = UDPPacket.HEADER.pack(0, 0, 0) + b'x' * (packet_size - UDPPacket.HEADER_SIZE)
+    return (ETH_HEADER.pack(dst_mac, src_mac, ETH_P_IP) + ip_header
+            + UDP_HEADER.pack(src[1], dst[1], udp_length, 0) + payload)
+
+
+class TxRing:
+    """预先填好帧的TX环；send(seq_no, count, timestamp)改写count个帧的包头并一次交给内核"""
+
+    def __init__(self, interface, frame):
+        mtu = int(read_sysfs(interface, 'mtu'))
+        if len(frame) - ETH_HEADER.size > mtu:
+            raise ValueError(f"Packet does not fit the {mtu} byte MTU of {interface}")
+        self.interface = interface
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)  # 协议为0：只发送，不接收
+        try:
+            self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V2)
+            self.sock.setsockopt(SOL_PACKET, PACKET_TX_RING,
+                                 TPACKET_REQ.pack(BLOCK_SIZE, RING_FRAMES * FRAME_SIZE // BLOCK_SIZE,
+                                                  FRAME_SIZE, RING_FRAMES))
+            self.sock.bind((interface, 0))
+            self.ring = mmap.mmap(self.sock.fileno(), RING_FRAMES * FRAME_SIZE,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except Exception:
+            self.sock.close()
+            raise
+        for i in range(RING_FRAMES):
+            offset = i * FRAME_SIZE
+            self.ring[offset + TP_DATA_OFFSET:offset + TP_DATA_OFFSET + len(frame)] = frame
+            TP_LEN.pack_into(self.ring, offset + TP_LEN_OFFSET, len(frame))
+        self.index = 0
+        self.frames = 0
+        self.flushes = 0
+
+    def send(self, seq_no, count, timestamp):
+        """从seq_no开始发送count个包(count不超过环的帧数)，返回发送的包数"""
+        ring = self.ring
+        pack_header = UDPPacket.HEADER.pack_into
+        pack_status = TP_STATUS.pack_into
+        index = self.index
+        for i in range(count):
+            offset = index * FRAME_SIZE
+            # 阻塞的send返回时帧已发送完，正常情况下环中的帧总是可用的
+            if ring[offset] != TP_STATUS_AVAILABLE:
+                self.flush()
+                if ring[offset] != TP_STATUS_AVAILABLE:
+                    count = i
+                    break
+            pack_header(ring, offset + TP_DATA_OFFSET + HEADER_OFFSET, seq_no + i, timestamp, 0)
+            pack_status(ring, offset, TP_STATUS_SEND_REQUEST)
+            index = index + 1 if index + 1 < RING_FRAMES else 0
+        self.index = index
+        self.flush()
+        self.frames += count
+        return count
+
+    def flush(self):
+        self.sock.send(b'')
+        self.flushes += 1
+
+    def summary(self):
+        return {'interface': self.interface, 'frames': self.frames, 'flushes': self.flushes,
+                'frames_per_flush': self.frames / self.flushes if self.flushes else 0}
+
+    def close(self):
+        self.ring.close()
+        self.sock.close()
@@ -0,0 +1,212 @@
+import sys
+import threading
+import time
+from time import perf_counter_ns
+
+# 直方图按2的幂划分桶：第b个桶统计耗时在[2^(b-1), 2^b)纳秒内的次数
+BUCKETS = 64
+# 不在发送/接收线程中记录的阶段，不计入该线程的时间占比
+BACKGROUND_PHASES = ('stats',)
+
+
+class _TimedSocket:
+    """包装socket，统计收发系统调用的耗时，其余属性直接转发"""
+
+    def __init__(self, sock, profiler):
+        self._sock = sock
+        self._record = profiler.record
+
+    def __getattr__(self, name):
+        return getattr(self._sock, name)
+
+    def sendto(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.sendto(*args)
+        finally:
+            self._record('send', perf_counter_ns() - t0)
+
+    def sendall(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.sendall(*args)
+        finally:
+            self._record('send', perf_counter_ns() - t0)
+
+    def send(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.send(*args)
+        finally:
+            self._record('send', perf_counter_ns() - t0)
+
+    def setblocking(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.setblocking(*args)
+        finally:
+            self._record('control', perf_counter_ns() - t0)
+
+    def recv(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.recv(*args)
+        finally:
+            self._record('recv', perf_counter_ns() - t0)
+
+    def recvfrom(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.recvfrom(*args)
+        finally:
+            self._record('recv', perf_counter_ns() - t0)
+
+    def recv_into(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.recv_into(*args)
+        finally:
+            self._record('recv', perf_counter_ns() - t0)
+
+    def recvfrom_into(self, *args):
+        t0 = perf_counter_ns()
+        try:
+            return self._sock.recvfrom_into(*args)
+        finally:
+            self._record('recv', perf_counter_ns() - t0)
+
+
+class PhaseProfiler:
+    """按阶段统计发送/接收循环的耗时。
+
+    只在开启--profile时创建；通过包装方法和socket计时，不开启时热路径没有任何额外开销。
+    """
+
+    def __init__(self, dump_path=None, dump_mode='cprofile', sample_interval=0.001, affinity=None):
+        self.histograms = {}
+        self.totals = {}    # phase -> [次数, 总耗时ns, 最大耗时ns]
+        self.dump_path = dump_path
+        self.dump_mode = dump_mode
+        self.sample_interval = sample_interval
+        self.affinity = affinity
+        self.cprofile = None
+        self.sampler_thread = None
+        self.sampling = False
+        self.samples = {}
+        self.start_ns = None
+        self.end_ns = None
+
+    def record(self, phase, ns):
+        totals = self.totals.get(phase)
+        if totals is None:
+            totals = self.totals[phase] = [0, 0, 0]
+            self.histograms[phase] = [0] * BUCKETS
+        self.histograms[phase][min(ns.bit_length(), BUCKETS - 1)] += 1
+        totals[0] += 1
+        totals[1] += ns
+        if ns > totals[2]:
+            totals[2] = ns
+
+    def wrap(self, phase, func):
+        """返回计时版本的func，用于替换实例上的方法"""
+        record = self.record
+
+        def timed(*args, **kwargs):
+            t0 = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(phase, perf_counter_ns() - t0)
+        return timed
+
+    def wrap_socket(self, sock):
+        return _TimedSocket(sock, self)
+
+    def start(self):
+        """在测试开始时调用（在运行发送/接收循环的线程中）"""
+        self.histograms = {}
+        self.totals = {}
+        self.samples = {}
+        self.end_ns = None
+        self.start_ns = perf_counter_ns()
+        if not self.dump_path:
+            return
+        if self.dump_mode == 'cprofile':
+            import cProfile
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+        else:
+            self.sampling = True
+            self.sampler_thread = threading.Thread(target=self._sample, args=(threading.get_ident(),), daemon=True)
+            self.sampler_thread.start()
+
+    def stop(self):
+        self.end_ns = perf_counter_ns()
+        if self.cprofile:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.dump_path)
+            self.cprofile = None
+        if self.sampler_thread:
+            self.sampling = False
+            self.sampler_thread.join()
+            self.sampler_thread = None
+            # 折叠栈格式，可直接交给flamegraph.pl/speedscope
+            with open(self.dump_path, 'w') as f:
+                for stack, count in sorted(self.samples.items(), key=lambda x: -x[1]):
+                    f.write(f"{stack} {count}\n")
+
+    def _sample(self, thread_id):
+        """采样式剖析：定期记录被测线程的调用栈"""
+        if self.affinity:
+            self.affinity.apply('stats')
+        while self.sampling:
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+            time.sleep(self.sample_interval)
+
+    @staticmethod
+    def _percentile(histogram, count, fraction):
+        """由直方图估计分位数，返回所在桶的上界(ns)"""
+        target = count * fraction
+        cumulative = 0
+        for bucket, n in enumerate(histogram):
+            cumulative += n
+            if cumulative >= target:
+                return 1 << bucket
+        return 1 << (BUCKETS - 1)
+
+    def summary(self):
+        wall_ns = (self.end_ns or perf_counter_ns()) - (self.start_ns or 0)
+        phases = {}
+        for phase, (count, total_ns, max_ns) in self.totals.items():
+            histogram = self.histograms[phase]
+            phases[phase] = {
+                'count': count,
+                'total_ms': total_ns / 1e6,
+                'percent': 100 * total_ns / wall_ns if wall_ns > 0 else 0,
+                'mean_ns': total_ns / count if count else 0,
+                'p50_ns': self._percentile(histogram, count, 0.5),
+                'p99_ns': self._percentile(histogram, count, 0.99),
+                'max_ns': max_ns,
+                'histogram': {f'<{1 << b}ns': n for b, n in enumerate(histogram) if n},
+            }
+        return {'wall_ms': wall_ns / 1e6, 'phases': phases}
+
+    def print_summary(self):
+        summary = self.summary()
+        print("\n=== Profile ===")
+        print(f"{'phase':<10}{'count':>12}{'total ms':>12}{'% wall':>9}{'mean ns':>11}{'p50 ns':>11}{'p99 ns':>11}{'max ns':>12}")
+        for phase, x in sorted(summary['phases'].items(), key=lambda item: -item[1]['total_ms']):
+            print(f"{phase:<10}{x['count']:>12}{x['total_ms']:>12.1f}{x['percent']:>8.1f}%{x['mean_ns']:>11.0f}"
+                  f"{'<' + str(x['p50_ns']):>11}{'<' + str(x['p99_ns']):>11}{x['max_ns']:>12}")
+        accounted = sum(x['percent'] for phase, x in summary['phases'].items() if phase not in BACKGROUND_PHASES)
+        print(f"Unaccounted (pacing wait, loop overhead): {max(0.0, 100 - accounted):.1f}% of {summary['wall_ms']:.0f} ms")
+        if self.dump_path:
+            print(f"Profile dump written to {self.dump_path}")
@@ -0,0 +1,127 @@
+"""闭环速率控制：UDP服务器定期回报接收情况，客户端的控制器据此调整发送速率(pps)。
+
+服务器报告（TYPE_REPORT包的JSON负载）包含：
+    interval      距上一次报告的秒数
+    received      该区间收到的包数
+    expected      该区间最大序列号的增量，即按序列号应收到的包数
+    lost          该区间按序列号推算的丢包数
+    loss_percent  该区间丢包率(%)
+    delay_ms      该区间平均单向时延，未收到包时为None
+    rate_bps      该区间接收速率（含包头）
+
+客户端在交给控制器之前加上：
+    sent          客户端在上一个报告之后发送的包数
+
+一个包也没收到时：expected和sent都为0说明区间内没有发送（如突发之间的空闲），保持速率；
+发送了却一个也没收到说明全部丢失，按on_timeout降速。没有sent的报告（直接调用控制器时）按全部丢失处理。
+
+自定义控制器继承RateController并实现on_report，通过`--rate-control 模块名.类名`加载。
+"""
+import importlib
+
+
+class RateController:
+    """根据接收端报告返回新的发送速率(pps)，结果限制在[min_pps, max_pps]内"""
+
+    name = 'base'
+
+    def __init__(self, initial_pps, min_pps=1, max_pps=None):
+        self.initial_pps = initial_pps
+        self.min_pps = min_pps
+        self.max_pps = max_pps
+
+    def clamp(self, pps):
+        if self.max_pps is not None:
+            pps = min(pps, self.max_pps)
+        return max(pps, self.min_pps)
+
+    def on_report(self, report, pps):
+        raise NotImplementedError
+
+    def on_timeout(self, pps):
+        """长时间没有收到报告（报告本身丢失或路径中断）时调用，默认减半"""
+        return self.clamp(pps * 0.5)
+
+    def on_empty(self, report, pps):
+        """报告中一个包也没收到：区间内没有发送时保持速率，否则是全部丢失，按超时处理"""
+        if not report.get('expected') and not report.get('sent', 1):
+            return pps
+        return self.on_timeout(pps)
+
+
+class AIMDController(RateController):
+    """加性增、乘性减：丢包率超过阈值时乘以decrease，否则每次报告增加initial_pps * increase"""
+
+    name = 'aimd'
+
+    def __init__(self, initial_pps, min_pps=1, max_pps=None, increase=0.05, decrease=0.7, loss_threshold=0.5):
+        super().__init__(initial_pps, min_pps, max_pps)
+        self.step = max(1.0, initial_pps * increase)
+        self.decrease = decrease
+        self.loss_threshold = loss_threshold
+        # 降速后的下一个报告仍反映降速前的发送，不再重复降速
+        self.holdoff = 0
+
+    def on_report(self, report, pps):
+        if not report['received']:
+            return self.on_empty(report, pps)
+        if report['loss_percent'] > self.loss_threshold:
+            if self.holdoff:
+                self.holdoff -= 1
+                return pps
+            self.holdoff = 1
+            return self.clamp(pps * self.decrease)
+        self.holdoff = 0
+        return self.clamp(pps + self.step)
+
+
+class DelayController(RateController):
+    """基于时延：以观察到的最小时延为基准估计排队时延，超过target_ms时按超出比例降速，
+    低于目标时按余量加速；丢包率超过阈值时与AIMD一样乘性减速。
+
+    单向时延中主机间的固定时钟偏差会在减去基准时抵消。
+    """
+
+    name = 'delay'
+
+    def __init__(self, initial_pps, min_pps=1, max_pps=None, target_ms=5.0, increase=0.05, decrease=0.7,
+                 loss_threshold=0.5):
+        super().__init__(initial_pps, min_pps, max_pps)
+        self.target_ms = target_ms
+        self.step = max(1.0, initial_pps * increase)
+        self.decrease = decrease
+        self.loss_threshold = loss_threshold
+        self.base_delay = None
+
+    def on_report(self, report, pps):
+        delay = report.get('delay_ms')
+        if not report['received'] or delay is None:
+            return self.on_empty(report, pps)
+        if self.base_delay is None or delay < self.base_delay:
+            self.base_delay = delay
+        if report['loss_percent'] > self.loss_threshold:
+            return self.clamp(pps * self.decrease)
+        queue = delay - self.base_delay
+        if queue > self.target_ms:
+            return self.clamp(pps * max(self.decrease, 1 - 0.5 * (queue - self.target_ms) / self.target_ms))
+        return self.clamp(pps + self.step * (1 - queue / self.target_ms))
+
+
+CONTROLLERS = {
+    'aimd': AIMDController,
+    'delay': DelayController,
+}
+
+
+def create_controller(spec, initial_pps, min_pps=1, max_pps=None):
+    """spec为CONTROLLERS中的名称、`模块名.类名`或已创建的控制器实例"""
+    if isinstance(spec, RateController):
+        return spec
+    if spec in CONTROLLERS:
+        cls = CONTROLLERS[spec]
+    else:
+        module_name, _, class_name = spec.rpartition('.')
+        if not module_name:
+            raise ValueError(f"Unknown rate controller: {spec}")
+        cls = getattr(importlib.import_module(module_name), class_name)
+    return cls(initial_pps, min_pps=min_pps, max_pps=max_pps)
@@ -1,13 +1,29 @@
+import selectors
 import socket
 import time
 import threading
 
-from FlowGenerator import FlowGenerator
+import Duplex
+from ConnectionRate import CPS_MAGIC
+from FlowGenerator import FlowGenerator, MAX_BURST
+from TcpInfo import TcpInfoSampler
+
+# 多流客户端会同时建立上千个连接
+LISTEN_BACKLOG = 4096
+# 丢弃模式每次最多丢弃的字节数
+SINK_CHUNK = 1024 * 1024
+# 超过这个数量的连接不再逐个打印
+MAX_PRINTED_CONNECTIONS = 16
+# 新连接开头的请求行，其余连接都是数据连接
+REQUESTS = ((Duplex.REVERSE_MAGIC, 'reverse'), (CPS_MAGIC, 'cps'))
+PEEK_SIZE = max(len(magic) for magic, _ in REQUESTS)
+# 有反向流在发送时，事件循环按这个间隔检查发送线程是否结束
+REVERSE_POLL_INTERVAL = 0.1
 
 class TCPFlowGenerator(FlowGenerator):
     def __init__(self, bind_address, host, port, mode, duration=None, total_size=None, packet_size=None, bandwidth=None,
                     interval=1, distributed_packets_per_second=None, distributed_packet_size=None,
-                    distributed_bandwidth=None, bandwidth_reset_interval=None, json=False, one_test=False, ipv6=False, printpkg=False):
+                    distributed_bandwidth=None, bandwidth_reset_interval=None, json=False, one_test=False, ipv6=False, printpkg=False, **kwargs):
         if packet_size is None:
             if bandwidth is not None:
                 bandwidth = self.to_bps(bandwidth)
@@ -21,10 +37,21 @@ class TCPFlowGenerator(FlowGenerator):
             pkt_head_size = 54
         super().__init__(bind_address, host, port, mode, duration, total_size, packet_size, bandwidth, interval,
                         distributed_packets_per_second, distributed_packet_size, distributed_bandwidth,
-                        bandwidth_reset_interval, json, one_test, ipv6, printpkg, pkt_head_size)
+                        bandwidth_reset_interval, json, one_test, ipv6, printpkg, pkt_head_size, **kwargs)
         self.type = 'tcp'
+        self.connections = 0
+        # 服务器：当前测试是新建连接速率测试（客户端--cps）
+        self.cps_test = False
+        # 服务器：当前测试中正在发送或已发送完的反向流
+        self.reverse_senders = []
 
     def run_server(self):
+        """一个测试从第一个连接建立开始，到所有连接都关闭、所有反向流发送完为止；多流客户端的连接同时接入。
+
+        新连接第一次可读时才区分：以反向请求开头的连接交给一个发送线程，其余的是数据连接。
+        """
+        self.apply_affinity('send')
+        server_socket = None
         try:
             if not self.bind_address:
                 self.bind_address = '0.0.0.0' if not self.ipv6 else '::'
@@ -32,67 +59,288 @@ class TCPFlowGenerator(FlowGenerator):
             server_socket = socket.socket(socket_family, socket.SOCK_STREAM)
             server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             server_socket.bind((self.bind_address, self.port))
-            server_socket.listen(1)
+            # 在listen之前设置，接受的连接继承这些选项，窗口扩大因子也按此协商
+            self.tune_receive(server_socket)
+            server_socket.listen(LISTEN_BACKLOG)
+            server_socket.setblocking(False)
             if not self.json:
                 print(f"TCP Server listening on {self.bind_address}:{self.port}")
 
+            # 丢弃模式：MSG_TRUNC让内核丢弃数据只返回长度，缓冲区不会被写入，所有连接共用
+            sink_buffer = bytearray(SINK_CHUNK) if self.sink else None
+            selector = selectors.DefaultSelector()
+            selector.register(server_socket, selectors.EVENT_READ)
+            self.connections = 0
+            active = 0          # 连接数，包括正在发送的反向流
+            receiving = 0       # 其中的数据连接数
+            reverse_threads = []
+            pending_requests = []   # 还没收全的反向请求（Duplex.PendingRequest）
             while True:
-                client_socket, address = server_socket.accept()
-                if not self.json:
-                    print(f"Connection from {address}")
-                
-                self.total_sent = 0
-                self.total_packets = 0
-                self.interval_data = []
-                
-                self.is_running = True
-                self.test_start_time = self.start_time = time.time()
-                
-                # 启动统计信息打印线程
-                self.stats_thread = threading.Thread(target=self.print_statistics)
-                self.stats_thread.daemon = True
-                self.stats_thread.start()
-                
-                try:
-                    while True:
-                        data = client_socket.recv(65535)
-                        self.packet_size = len(data) # 跟新报文长度
-                        self.frame_size = self.packet_size + self.pkt_head_size
-                        if not data:
-                            break
-                        self.total_sent += self.packet_size + self.pkt_head_size
+                timeout = REVERSE_POLL_INTERVAL if reverse_threads or pending_requests else None
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is server_socket:
+                        while True:
+                            try:
+                                client_socket, address = server_socket.accept()
+                            except BlockingIOError:
+                                break
+                            client_socket.setblocking(False)
+                            if not active:
+                                self.connections = 0
+                                self.reverse_senders = []
+                                self.direction = None
+                                self.test_start_time = None
+                                self.cps_test = False
+                            if not self.json and self.connections < MAX_PRINTED_CONNECTIONS:
+                                print(f"Connection from {address}")
+                            # 数据为None：还没区分是数据连接还是反向请求
+                            selector.register(client_socket, selectors.EVENT_READ, None)
+                            active += 1
+                            self.connections += 1
+                        continue
+
+                    client_socket = key.data
+                    if isinstance(client_socket, Duplex.PendingRequest):
+                        request = client_socket
+                        try:
+                            options = request.read()
+                        except (OSError, ValueError) as e:
+                            selector.unregister(key.fileobj)
+                            pending_requests.remove(request)
+                            self.reject_reverse(key.fileobj, e)
+                            active -= 1
+                            continue
+                        if options is None:
+                            continue
+                        selector.unregister(key.fileobj)
+                        pending_requests.remove(request)
+                        thread = self.start_reverse(key.fileobj, options)
+                        if thread:
+                            reverse_threads.append(thread)
+                        else:
+                            active -= 1
+                        continue
+                    if client_socket is None:
+                        kind = self.classify_connection(key.fileobj)
+                        if kind is None:
+                            continue
+                        if kind == 'reverse':
+                            # 请求行在之后的事件中逐步读取
+                            request = Duplex.PendingRequest(key.fileobj)
+                            pending_requests.append(request)
+                            selector.modify(key.fileobj, selectors.EVENT_READ, request)
+                            continue
+                        client_socket = key.fileobj
+                        if kind == 'cps':
+                            # 新建连接速率测试的控制连接：保持到测试结束，统计中给出接受连接的速率
+                            client_socket.recv(len(CPS_MAGIC))
+                            self.cps_test = True
+                        receiving += 1
+                        if not self.is_running:
+                            self.start_test()
+                            client_socket = self.start_profiler(client_socket)
+                        elif self.profiler:
+                            client_socket = self.profiler.wrap_socket(client_socket)
+                        selector.modify(key.fileobj, selectors.EVENT_READ, client_socket)
+                    try:
+                        if sink_buffer:
+                            nbytes = client_socket.recv_into(sink_buffer, SINK_CHUNK, socket.MSG_TRUNC)
+                        else:
+                            nbytes = len(client_socket.recv(65535))
+                            if nbytes:
+                                self.packet_size = nbytes # 跟新报文长度
+                                self.frame_size = self.packet_size + self.pkt_head_size
+                    except BlockingIOError:
+                        continue
+                    except ConnectionResetError:
+                        # 新建连接速率测试的客户端可以用RST关闭连接
+                        nbytes = 0
+                    except OSError as e:
+                        self.report_error("Error receiving data", e)
+                        nbytes = 0
+                    if nbytes:
+                        self.total_sent += nbytes + self.pkt_head_size
                         self.total_packets += 1
+                        continue
 
-                except Exception as e:
-                    print(f"Error receiving data: {e}")
-                finally:
-                    self.is_running = False
-                    self.test_end_time = time.time()
-                    if self.stats_thread:
-                        self.stats_thread.join()
+                    selector.unregister(key.fileobj)
                     client_socket.close()
-                    if self.total_sent > 0:
-                        self.print_summary()
-                    
-                    if self.one_test:
-                        break
+                    receiving -= 1
+                    active -= 1
+                    # 接收统计在最后一个数据连接关闭时结束，不等待反向流
+                    if not receiving:
+                        self.stop_receiving()
+                    if not active:
+                        self.finish_test()
+                        if self.one_test:
+                            return
+
+                now = time.time()
+                for request in [r for r in pending_requests if r.expired(now)]:
+                    selector.unregister(request.sock)
+                    pending_requests.remove(request)
+                    self.reject_reverse(request.sock, TimeoutError("Reverse request was not complete in time"))
+                    active -= 1
+                    if not active:
+                        self.finish_test()
+                        if self.one_test:
+                            return
+
+                for thread in [t for t in reverse_threads if not t.is_alive()]:
+                    reverse_threads.remove(thread)
+                    active -= 1
+                    if not active:
+                        self.finish_test()
+                        if self.one_test:
+                            return
 
         except Exception as e:
-            print(f"Server error: {e}")
+            self.report_error("Server error", e)
         finally:
-            server_socket.close()
+            if self.is_running or self.reverse_senders:
+                self.finish_test()
+            if server_socket:
+                server_socket.close()
+
+    @staticmethod
+    def classify_connection(sock):
+        """新连接第一次可读时查看开头的数据：'reverse'、'cps'或'data'，请求还没收全时返回None"""
+        try:
+            head = sock.recv(PEEK_SIZE, socket.MSG_PEEK)
+        except BlockingIOError:
+            return None
+        except OSError:
+            # 连接已被重置，按数据连接处理，由接收循环关闭
+            return 'data'
+        for magic, kind in REQUESTS:
+            if head.startswith(magic):
+                return kind
+            if head and magic.startswith(head):
+                return None
+        return 'data'
+
+    def start_reverse(self, sock, options):
+        """在一个线程中按反向请求的参数向这个连接发送；请求无效时关闭连接"""
+        try:
+            sender = Duplex.create_sender(self, options, sock.getpeername())
+            sock.setblocking(True)
+        except (OSError, ValueError) as e:
+            self.reject_reverse(sock, e)
+            return None
+        self.direction = 'RX'
+        self.reverse_senders.append(sender)
+        thread = threading.Thread(target=sender.run_sender, args=(sock,))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def reject_reverse(self, sock, error):
+        self.report_error("Invalid reverse request", error)
+        sock.close()
+
+    def start_test(self):
+        self.total_sent = 0
+        self.total_packets = 0
+        self.interval_data = []
+
+        self.is_running = True
+        self.test_start_time = self.start_time = time.time()
+
+        # 启动统计信息打印线程
+        self.stats_thread = threading.Thread(target=self.print_statistics)
+        self.stats_thread.daemon = True
+        self.stats_thread.start()
+
+    def stop_receiving(self):
+        self.is_running = False
+        self.test_end_time = time.time()
+        self.stop_profiler()
+        if self.stats_thread:
+            self.stats_thread.join()
+        if self.total_sent > 0 or self.cps_test:
+            self.print_summary()
+
+    def finish_test(self):
+        """结束一个测试：有反向流时合并各方向的结果，只有反向流时本机没有接收统计"""
+        if self.is_running:
+            self.stop_receiving()
+        if self.reverse_senders:
+            Duplex.report(self, self.reverse_senders + [self])
+            self.reverse_senders = []
+
+    def finish_client(self):
+        if self.tcp_info:
+            self.tcp_info.stop()
+        self.is_running = False
+        self.test_end_time = time.time()
+        self.stop_profiler()
+
+        if self.stats_thread:
+            self.stats_thread.join()
+
+        self.print_summary()
+        if self.tcp_info and self.tcp_info_dump:
+            self.tcp_info.dump(self.tcp_info_dump)
+
+    def request_reverse(self, options):
+        """客户端：新建一个连接并发送反向请求，返回这个连接"""
+        socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+        sock = socket.socket(socket_family, socket.SOCK_STREAM)
+        # 在connect之前设置，窗口扩大因子按此协商
+        self.tune_receive(sock)
+        sock.connect((self.host, self.port))
+        sock.sendall(Duplex.encode_request(options))
+        if not self.json:
+            print(f"Reverse connection to {self.host}:{self.port}")
+        return sock
+
+    def receive_reverse(self, sock):
+        """客户端：接收服务器在反向连接上发送的数据，直到服务器关闭连接"""
+        sink_buffer = bytearray(SINK_CHUNK) if self.sink else None
+        self.connections = 1
+        self.start_test()
+        try:
+            while True:
+                if sink_buffer:
+                    nbytes = sock.recv_into(sink_buffer, SINK_CHUNK, socket.MSG_TRUNC)
+                else:
+                    nbytes = len(sock.recv(65535))
+                    if nbytes:
+                        self.packet_size = nbytes
+                        self.frame_size = self.packet_size + self.pkt_head_size
+                if not nbytes:
+                    break
+                self.total_sent += nbytes + self.pkt_head_size
+                self.total_packets += 1
+        except OSError as e:
+            self.report_error("Error receiving data", e)
+        finally:
+            self.finish_test()
+            sock.close()
 
     def run_client(self):
+        self.apply_affinity('send')
+        if self.reverse or self.bidir:
+            Duplex.run_client(self)
+            return
+        self.run_sender()
+
+    def run_sender(self, sock=None):
+        """按参数发送直到测试结束；sock为服务器上客户端发起的反向连接，否则连接到host:port"""
         try:
-            socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
-            self.socket = socket.socket(socket_family, socket.SOCK_STREAM)
-            self.socket.connect((self.host, self.port))
+            self.open_trace()
+            if sock is None:
+                socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+                self.socket = socket.socket(socket_family, socket.SOCK_STREAM)
+                self.socket.connect((self.host, self.port))
+            else:
+                self.socket = sock
             
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 0)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 0)
             self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             if not self.json:
-                print(f"Connected to {self.host}:{self.port}")
+                print(f"{'Sending reverse flow to' if sock else 'Connected to'} {self.host}:{self.port}")
             
             self.is_running = True
             self.test_start_time = self.start_time = time.time()
@@ -101,6 +349,11 @@ class TCPFlowGenerator(FlowGenerator):
             self.stats_thread = threading.Thread(target=self.print_statistics)
             self.stats_thread.daemon = True
             self.stats_thread.start()
+            self.socket = self.start_profiler(self.socket)
+            self.socket = self.open_zerocopy(self.socket)
+            if self.tcp_info_interval:
+                self.tcp_info = TcpInfoSampler(self.socket, self.tcp_info_interval, affinity=self.affinity)
+                self.tcp_info.start()
 
             self.reset_bandwidth()
 
@@ -120,8 +373,10 @@ class TCPFlowGenerator(FlowGenerator):
                 try:
                     if self.pps:
                         current_time = time.time()
-                        while True:
+                        burst = 0
+                        while burst < MAX_BURST:
                             if current_time > next_send_time:
+                                burst += 1
                                 test_data = self.create_test_data()
                                 self.socket.sendall(test_data)
                                 self.total_sent += len(test_data) + self.pkt_head_size
@@ -136,27 +391,19 @@ class TCPFlowGenerator(FlowGenerator):
                         self.total_packets += 1
                             
                 except socket.error as e:
-                    print(f"Send error: {e}")
+                    self.report_error("Send error", e)
                     break
 
-            self.is_running = False
-            self.test_end_time = time.time()
-            
-            if self.stats_thread:
-                self.stats_thread.join()
-
-            self.print_summary()
+            if self.zerocopy_socket:
+                self.zerocopy_socket.flush()
+            self.finish_client()
 
         except Exception as e:
-            print(f"Client error: {e}")
+            self.report_error("Client error", e)
         except KeyboardInterrupt:
-            self.is_running = False
-            self.test_end_time = time.time()
-            
-            if self.stats_thread:
-                self.stats_thread.join()
-
-            self.print_summary()
+            self.finish_client()
         finally:
+            if self.tcp_info:
+                self.tcp_info.stop()
             if self.socket:
                 self.socket.close()
@@ -0,0 +1,178 @@
+"""TCP_INFO采样：按linux/tcp.h中完整的struct tcp_info解码，可在后台线程中高频采样到NumPy环形缓冲区。
+
+旧内核返回的结构较短，缺少的字段补零，并且不出现在统计结果中。
+速率字段单位为字节/秒，时延单位为微秒，busy_time/rwnd_limited/sndbuf_limited为累计微秒。
+"""
+import socket
+import struct
+import threading
+import time
+
+# (字段名, 格式)，顺序和对齐与struct tcp_info一致
+TCP_INFO_FIELDS = (
+    ('state', 'B'), ('ca_state', 'B'), ('retransmits', 'B'), ('probes', 'B'), ('backoff', 'B'),
+    ('options', 'B'), ('wscale', 'B'), ('app_limited', 'B'),
+    ('rto', 'I'), ('ato', 'I'), ('snd_mss', 'I'), ('rcv_mss', 'I'),
+    ('unacked', 'I'), ('sacked', 'I'), ('lost', 'I'), ('retrans', 'I'), ('fackets', 'I'),
+    ('last_data_sent', 'I'), ('last_ack_sent', 'I'), ('last_data_recv', 'I'), ('last_ack_recv', 'I'),
+    ('pmtu', 'I'), ('rcv_ssthresh', 'I'), ('rtt', 'I'), ('rttvar', 'I'), ('snd_ssthresh', 'I'),
+    ('snd_cwnd', 'I'), ('advmss', 'I'), ('reordering', 'I'),
+    ('rcv_rtt', 'I'), ('rcv_space', 'I'), ('total_retrans', 'I'),
+    ('pacing_rate', 'Q'), ('max_pacing_rate', 'Q'), ('bytes_acked', 'Q'), ('bytes_received', 'Q'),
+    ('segs_out', 'I'), ('segs_in', 'I'),
+    ('notsent_bytes', 'I'), ('min_rtt', 'I'), ('data_segs_in', 'I'), ('data_segs_out', 'I'),
+    ('delivery_rate', 'Q'),
+    ('busy_time', 'Q'), ('rwnd_limited', 'Q'), ('sndbuf_limited', 'Q'),
+    ('delivered', 'I'), ('delivered_ce', 'I'),
+    ('bytes_sent', 'Q'), ('bytes_retrans', 'Q'),
+    ('dsack_dups', 'I'), ('reord_seen', 'I'),
+    ('rcv_ooopack', 'I'), ('snd_wnd', 'I'), ('rcv_wnd', 'I'), ('rehash', 'I'),
+    ('total_rto', 'H'), ('total_rto_recoveries', 'H'), ('total_rto_time', 'I'),
+)
+TCP_INFO_NAMES = tuple(name for name, _ in TCP_INFO_FIELDS)
+TCP_INFO_STRUCT = struct.Struct('=' + ''.join(fmt for _, fmt in TCP_INFO_FIELDS))
+TCP_INFO_SIZE = TCP_INFO_STRUCT.size
+# 每个字段结束处的偏移，用于判断内核返回的长度是否包含该字段
+_FIELD_END = {}
+_offset = 0
+for _name, _fmt in TCP_INFO_FIELDS:
+    _offset += struct.calcsize('=' + _fmt)
+    _FIELD_END[_name] = _offset
+COLUMN = {name: i + 1 for i, name in enumerate(TCP_INFO_NAMES)}  # 第0列为采样时间
+
+# 默认环形缓冲区容量（10ms采样约11分钟）
+RING_SIZE = 65536
+# 受限时间占比超过这个值时认为是主要瓶颈
+LIMITED_THRESHOLD = 0.5
+
+
+def read_tcp_info(sock):
+    """读取一次TCP_INFO，返回(字段值元组, 内核返回的字节数)"""
+    data = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_SIZE)
+    length = len(data)
+    if length < TCP_INFO_SIZE:
+        data += bytes(TCP_INFO_SIZE - length)
+    return TCP_INFO_STRUCT.unpack(data), length
+
+
+def available_fields(length):
+    return {name for name, end in _FIELD_END.items() if end <= length}
+
+
+class TcpInfoSampler:
+    """后台线程每interval秒读取一次TCP_INFO，写入预分配的NumPy环形缓冲区，按统计区间汇总"""
+
+    def __init__(self, sock, interval=0.01, capacity=RING_SIZE, affinity=None):
+        from FlowGenerator import require_numpy
+        require_numpy("TCP_INFO sampling (--tcp-info-interval/--tcp-info-dump)")
+        import numpy as np  # 只在开启高频采样时导入
+        self.np = np
+        self.sock = sock
+        self.interval = interval
+        self.capacity = capacity
+        self.affinity = affinity
+        self.ring = np.zeros((capacity, len(TCP_INFO_NAMES) + 1))
+        self.count = 0
+        self.last_count = 0
+        self.available = set()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        if self.affinity:
+            self.affinity.apply('stats')
+        ring = self.ring
+        capacity = self.capacity
+        getsockopt = self.sock.getsockopt
+        unpack = TCP_INFO_STRUCT.unpack
+        next_time = time.perf_counter()
+        try:
+            _, length = read_tcp_info(self.sock)
+            self.available = available_fields(length)
+            padding = bytes(TCP_INFO_SIZE - length)
+            while not self.stop_event.is_set():
+                row = ring[self.count % capacity]
+                row[0] = time.time()
+                row[1:] = unpack(getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_SIZE) + padding)
+                self.count += 1
+                next_time += self.interval
+                self.stop_event.wait(max(0.0, next_time - time.perf_counter()))
+        except OSError as e:
+            # 连接已关闭
+            self.error = e
+
+    def samples(self, start=0):
+        """第start个以后（最多capacity个）的样本，按时间排序"""
+        end = self.count
+        start = max(start, end - self.capacity)
+        if start >= end:
+            return self.ring[:0]
+        first, last = start % self.capacity, end % self.capacity
+        if first < last:
+            return self.ring[first:last]
+        return self.np.concatenate((self.ring[first:], self.ring[:last]))
+
+    def summarize(self, samples):
+        """一段样本的汇总：速率为bps，时延为毫秒，受限时间为该段时长的占比"""
+        if len(samples) < 2:
+            return None
+        np = self.np
+        column = lambda name: samples[:, COLUMN[name]]
+        elapsed = samples[-1, 0] - samples[0, 0]
+        summary = {'samples': len(samples)}
+        have = self.available
+        if 'delivery_rate' in have:
+            summary['delivery_rate_bps'] = float(np.mean(column('delivery_rate'))) * 8
+            summary['delivery_rate_max_bps'] = float(np.max(column('delivery_rate'))) * 8
+            summary['app_limited'] = float(np.mean(column('app_limited') % 2))  # 最低位为delivery_rate_app_limited
+        if 'pacing_rate' in have:
+            summary['pacing_rate_bps'] = float(np.mean(column('pacing_rate'))) * 8
+        if 'bytes_acked' in have and elapsed > 0:
+            summary['acked_bps'] = float(column('bytes_acked')[-1] - column('bytes_acked')[0]) * 8 / elapsed
+        summary['rtt_ms'] = float(np.mean(column('rtt'))) / 1000
+        if 'min_rtt' in have:
+            summary['min_rtt_ms'] = float(np.min(column('min_rtt'))) / 1000
+        summary['cwnd_max'] = int(np.max(column('snd_cwnd')))
+        summary['retrans'] = int(column('total_retrans')[-1] - column('total_retrans')[0])
+        if 'notsent_bytes' in have:
+            summary['notsent_bytes'] = float(np.mean(column('notsent_bytes')))
+        if 'sndbuf_limited' in have and elapsed > 0:
+            for name in ('busy_time', 'rwnd_limited', 'sndbuf_limited'):
+                summary[name] = float(column(name)[-1] - column(name)[0]) / 1e6 / elapsed
+            summary['limited_by'] = self.limited_by(summary)
+        return summary
+
+    @staticmethod
+    def limited_by(summary):
+        """粗略判断发送速率受什么限制"""
+        if summary.get('rwnd_limited', 0) > LIMITED_THRESHOLD:
+            return 'receive window'
+        if summary.get('sndbuf_limited', 0) > LIMITED_THRESHOLD:
+            return 'send buffer'
+        if summary.get('app_limited', 0) > LIMITED_THRESHOLD:
+            return 'application'
+        return 'congestion window'
+
+    def interval_summary(self):
+        """上一次调用以来的样本汇总，供统计线程每个区间调用"""
+        start, self.last_count = self.last_count, self.count
+        # 包含上一区间的最后一个样本，使累计量的差值覆盖整个区间
+        return self.summarize(self.samples(max(0, start - 1)))
+
+    def total_summary(self):
+        return self.summarize(self.samples())
+
+    def dump(self, path):
+        """保存全部样本：columns为列名，samples每行一个样本"""
+        self.np.savez(path, columns=('time',) + TCP_INFO_NAMES, samples=self.samples())
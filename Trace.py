@@ -0,0 +1,179 @@
+"""流量回放：把pcap/CSV抓包中的包长和包间隔编译成紧凑的NumPy调度文件，回放时内存映射读取。
+
+调度文件是一维结构化数组的.npy文件，每个包12字节：
+    gap   距上一个包的间隔(秒)，第一个包为0
+    size  帧长（pcap中的原始帧长，CSV中的第二列）
+
+编译只需进行一次；回放循环按块把调度转换为Python列表，逐包只做列表索引，不做任何解析。
+
+    python3 Trace.py capture.pcap -o capture.npy
+"""
+import argparse
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+import numpy as np
+
+TRACE_DTYPE = np.dtype([('gap', '<f8'), ('size', '<u4')])
+_RECORD = struct.Struct('<dI')
+# 编译时每次写出的包数，回放时每次转换的包数
+BLOCK = 65536
+
+# pcap文件头魔数 -> (字节序, 时间戳小数部分的单位)
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+
+# 帧长中以太网/IP/传输层头的长度，回放时从帧长中减去得到负载长度
+HEADER_BYTES = {
+    ('udp', False): 14 + 20 + 8,
+    ('udp', True): 14 + 40 + 8,
+    ('tcp', False): 14 + 20 + 20,
+    ('tcp', True): 14 + 40 + 20,
+}
+
+
+def read_pcap(path):
+    """逐个返回(时间戳秒, 原始帧长)"""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+        if len(header) < 24 or header[:4] not in PCAP_MAGIC:
+            raise ValueError(f"{path} is not a pcap file (pcapng is not supported, convert it with editcap -F pcap)")
+        endian, unit = PCAP_MAGIC[header[:4]]
+        record = struct.Struct(endian + 'IIII')
+        while True:
+            data = f.read(16)
+            if len(data) < 16:
+                return
+            ts_sec, ts_frac, incl_len, orig_len = record.unpack(data)
+            f.seek(incl_len, os.SEEK_CUR)
+            yield ts_sec + ts_frac * unit, orig_len
+
+
+def read_csv(path):
+    """逐个返回(时间戳秒, 帧长)；跳过表头、空行和#注释"""
+    with open(path, 'r') as f:
+        for line in f:
+            fields = line.replace(',', ' ').split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            try:
+                yield float(fields[0]), int(float(fields[1]))
+            except (ValueError, IndexError):
+                continue
+
+
+def compile_trace(path, output):
+    """编译抓包文件为调度文件，返回包数。只顺序读取一遍，内存占用与抓包大小无关"""
+    with open(path, 'rb') as f:
+        is_pcap = f.read(4) in PCAP_MAGIC
+    packets = read_pcap(path) if is_pcap else read_csv(path)
+
+    count = 0
+    last = None
+    chunk = []
+    with tempfile.TemporaryFile(dir=os.path.dirname(os.path.abspath(output))) as body:
+        for timestamp, size in packets:
+            gap = 0.0 if last is None else max(0.0, timestamp - last)
+            last = timestamp
+            chunk.append(_RECORD.pack(gap, size))
+            if len(chunk) >= BLOCK:
+                body.write(b''.join(chunk))
+                count += len(chunk)
+                chunk = []
+        body.write(b''.join(chunk))
+        count += len(chunk)
+        if not count:
+            raise ValueError(f"{path} contains no packets")
+
+        body.seek(0)
+        with open(output, 'wb') as out:
+            np.lib.format.write_array_header_1_0(out, {
+                'descr': np.lib.format.dtype_to_descr(TRACE_DTYPE),
+                'fortran_order': False,
+                'shape': (count,),
+            })
+            shutil.copyfileobj(body, out)
+    return count
+
+
+def load_schedule(path):
+    """返回内存映射的调度数组；path不是.npy时先编译到`<path>.npy`（已是最新则直接使用）"""
+    if not path.endswith('.npy'):
+        compiled = path + '.npy'
+        if not os.path.exists(compiled) or os.path.getmtime(compiled) < os.path.getmtime(path):
+            compile_trace(path, compiled)
+        path = compiled
+    schedule = np.load(path, mmap_mode='r')
+    if schedule.dtype != TRACE_DTYPE or schedule.ndim != 1 or not len(schedule):
+        raise ValueError(f"{path} is not a trace schedule")
+    return schedule
+
+
+class _Cursor:
+    """按块把内存映射数组的一列转换为Python列表，到末尾后从头循环"""
+
+    def __init__(self, column, convert, start=0):
+        self.column = column
+        self.convert = convert
+        self.position = start % len(column)
+        self.block = []
+        self.index = 0
+
+    def next(self):
+        index = self.index
+        if index >= len(self.block):
+            end = min(self.position + BLOCK, len(self.column))
+            self.block = self.convert(self.column[self.position:end])
+            self.position = end % len(self.column)
+            index = 0
+        self.index = index + 1
+        return self.block[index]
+
+
+class TraceSchedule:
+    """回放调度：next_size()返回下一个包的负载长度，next_gap()返回发送它之后到下一个包的间隔。
+
+    time_scale拉伸时间（2表示慢一倍），rate将包速率乘以给定倍数，两者都只作用于间隔。
+    """
+
+    def __init__(self, path, protocol='udp', ipv6=False, time_scale=1.0, rate=1.0, min_size=1, max_size=65507):
+        schedule = load_schedule(path)
+        self.packets = len(schedule)
+        scale = time_scale / rate
+        header = HEADER_BYTES[(protocol, ipv6)]
+        self.gaps = _Cursor(schedule['gap'], lambda block: (block * scale).tolist(), start=1)
+        self.sizes = _Cursor(schedule['size'],
+                             lambda block: np.clip(block.astype(np.int64) - header, min_size, max_size).tolist())
+
+    def next_size(self):
+        return self.sizes.next()
+
+    def next_gap(self):
+        return self.gaps.next()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compile a pcap or CSV (timestamp,frame_length) trace into a replay schedule')
+    parser.add_argument('trace', help='pcap or CSV file')
+    parser.add_argument('-o', '--output', type=str, help='Schedule file (default: <trace>.npy)')
+    args = parser.parse_args()
+    output = args.output or args.trace + '.npy'
+    try:
+        count = compile_trace(args.trace, output)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    schedule = np.load(output, mmap_mode='r')
+    duration = float(schedule['gap'].sum())
+    print(f"{count} packets, {duration:.3f} seconds, mean size {float(schedule['size'].mean()):.1f} bytes -> {output}")
+
+
+if __name__ == '__main__':
+    main()
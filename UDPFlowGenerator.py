@@ -3,11 +3,12 @@ import time
 import threading
 import struct
 import sys
-import subprocess
 import re
 import json as JSON
 
-from FlowGenerator import FlowGenerator
+import Duplex
+from FlowGenerator import FlowGenerator, MAX_BURST, SO_RXQ_OVFL, percentiles
+from RateControl import create_controller
 
 def convert_to_us(value: float, unit: str) -> float:
     """将不同时间单位转换为u秒(us)"""
@@ -22,8 +23,27 @@ def convert_to_us(value: float, unit: str) -> float:
         return value * 1e6  # 秒转换为微秒
     else:
         raise ValueError(f"未知的时间单位: {unit}")
+
+# 连续这么多个报告间隔没有收到服务器报告时，按超时处理
+FEEDBACK_TIMEOUT = 3
+
+# 服务器接收缓冲区大小，能容纳最大的UDP数据报
+RECV_BUFFER_SIZE = 65535
+
+# FIN_ACK负载的最大字节数：FIN_ACK只发送一次，加上包头要在常见MTU下不分片（IPv6头也计算在内）
+MAX_REPORT_SIZE = 1400
+
+# SO_RXQ_OVFL辅助数据：socket因接收缓冲区满累计丢弃的包数(u32)
+DROP_COUNTER = struct.Struct('=I')
+
+# 计算带宽时每个包附加的头部长度：以太网/IP/UDP头 + 流发生器伪包头(16字节)
+PKT_HEAD_SIZE_V4 = 42 + 16
+PKT_HEAD_SIZE_V6 = 62 + 16
         
 class UDPPacket:
+    # 包头：序列号、发送时间戳(us)、总包数（数据包中为流编号）
+    HEADER = struct.Struct('!IQI')
+    HEADER_SIZE = HEADER.size
     # 添加包类型常量
     TYPE_INIT = 0xFFFFFFF0  # 建立连接请求
     TYPE_INIT_ACK = 0xFFFFFFF1  # 建立连接确认  
@@ -32,6 +52,9 @@ class UDPPacket:
     TYPE_FIN_ACK = 0xFFFFFFFE  # 结束确认包
     TYPE_FORCE_QUIT = 0xFFFFFFF2  # 强制退出类型
     TYPE_FORCE_QUIT_ACK = 0xFFFFFFF3  # 强制退出确认类型
+    TYPE_REPORT = 0xFFFFFFF4  # 服务器定期回报的接收情况（闭环速率控制）
+    # 不小于该值的序列号都是控制包
+    TYPE_CONTROL = TYPE_INIT
 
     def __init__(self, seq_no, timestamp, total_packets=0, data=b''):
         self.seq_no = seq_no
@@ -40,19 +63,19 @@ class UDPPacket:
         self.data = data
         
     def to_bytes(self):
-        header = struct.pack('!IQI', self.seq_no, self.timestamp, self.total_packets)
-        return header + self.data
+        return UDPPacket.HEADER.pack(self.seq_no, self.timestamp, self.total_packets) + self.data
         
     @staticmethod 
     def from_bytes(data):
-        header = data[:16]  # 4+8+4=16字节的包头
-        seq_no, timestamp, total_packets = struct.unpack('!IQI', header)
-        return UDPPacket(seq_no, timestamp, total_packets, data[16:])
+        seq_no, timestamp, total_packets = UDPPacket.HEADER.unpack_from(data)
+        return UDPPacket(seq_no, timestamp, total_packets, data[UDPPacket.HEADER_SIZE:])
     
 class UDPFlowGenerator(FlowGenerator):
     def __init__(self, bind_address, host, port, mode, duration=None, total_size=None, packet_size=None, bandwidth=None,
                  interval=1, distributed_packets_per_second=None, distributed_packet_size=None,
-                 distributed_bandwidth=None, bandwidth_reset_interval=None, json=False, one_test=False, ipv6=False, printpkg = False):
+                 distributed_bandwidth=None, bandwidth_reset_interval=None, json=False, one_test=False, ipv6=False, printpkg = False,
+                 sock=None, rate_control=None, feedback_interval=0.1, max_bandwidth=None, raw=None, raw_dst_mac=None,
+                 **kwargs):
         if bandwidth is None:
             bandwidth = "1M"
         if packet_size is None:
@@ -61,16 +84,39 @@ class UDPFlowGenerator(FlowGenerator):
             else:
                 packet_size = 1450
             packet_size = max(80, packet_size)  # UDP最小包大小为64字节
-        if ipv6:
-            pkt_head_size = 62 + 16 #16为流发生器所需伪包头
-        else:
-            pkt_head_size = 42 + 16
+        pkt_head_size = PKT_HEAD_SIZE_V6 if ipv6 else PKT_HEAD_SIZE_V4
         super().__init__(bind_address, host, port, mode, duration, total_size, packet_size, bandwidth, interval,
                          distributed_packets_per_second, distributed_packet_size, distributed_bandwidth,  
-                         bandwidth_reset_interval, json, one_test, ipv6, printpkg, pkt_head_size)
+                         bandwidth_reset_interval, json, one_test, ipv6, printpkg, pkt_head_size, **kwargs)
         self.type = 'udp'
+        # 调用方传入的socket在多次测试间复用（源端口不变），测试结束时不关闭
+        self.external_socket = sock
+        self.server_report = None
+        self.flow_received = None
+        # 服务器：当前测试中正在发送或已发送完的反向流
+        self.reverse_senders = []
+        # 闭环速率控制：客户端在INIT中请求服务器每feedback_interval秒回报一次
+        self.rate_control = rate_control
+        self.feedback_interval = feedback_interval
+        self.max_bandwidth = self.to_bps(max_bandwidth)
+        self.rate_controller = None
+        # AF_PACKET TX环发送（--raw 接口名），在run_sender中握手之后打开，见PacketRing.py
+        self.raw = raw
+        self.raw_dst_mac = raw_dst_mac
+        self.tx_ring = None
+        self.feedback_reports = 0
+        self.feedback_timeouts = 0
+        self.feedback_sent = 0
+        # 客户端：请求反向流时代替确认收到的服务器INIT，见handshake
+        self.reverse_init = None
         self.delay_offset = 0
         self.running = True
+        self.offset_thread = None
+        self.offset_stop = threading.Event()
+        # 在时钟偏移测量线程中读取config.json，不占用启动时间
+        self.offset_fix_rate = 1.0
+
+    def load_offset_fix_rate(self):
         try:
             # 读取config.json文件
             with open('config.json', 'r') as f:
@@ -80,12 +126,23 @@ class UDPFlowGenerator(FlowGenerator):
             self.offset_fix_rate = 1.0
         
     def create_test_data(self, seq_no):
-        payload_size = self.packet_size - 16  # 减去包头大小
+        payload_size = max(0, self.next_packet_size() - 16)  # 减去包头大小
         test_data = b'x' * payload_size
         packet = UDPPacket(seq_no, int(time.time() * 1000000 + self.delay_offset), 0, test_data)
         return packet.to_bytes()
     
+    def zerocopy_test_data(self, payload):
+        """零拷贝发送时包头单独打包，负载是共用缓冲区的切片，由sendmsg分散/聚集发送"""
+        next_packet_size = self.next_packet_size
+        pack = UDPPacket.HEADER.pack
+
+        def create_test_data(seq_no):
+            return [pack(seq_no, int(time.time() * 1000000 + self.delay_offset), 0),
+                    payload[:max(0, next_packet_size() - UDPPacket.HEADER_SIZE)]]
+        return create_test_data
+
     def get_delay_offset(self):
+        import subprocess  # 只在后台测量线程中用到，不在启动时导入
         try:
             if sys.platform == 'win32':
                 output = subprocess.check_output(["ntpq", "-np"], text=True)
@@ -121,12 +178,38 @@ class UDPFlowGenerator(FlowGenerator):
             return None
         except ValueError as e:
             return None
+        except OSError:
+            return None
 
 
+    def start_offset_measurement(self):
+        """在测试流量开始后调用，探测chronyd/ntpq和读取配置都在后台线程中进行，不推迟第一个包"""
+        if self.offset_thread:
+            return
+        self.running = True
+        self.offset_stop.clear()
+        self.offset_thread = threading.Thread(target=self.delay_offset_measurement)
+        self.offset_thread.start()
+
+    def stop_offset_measurement(self):
+        """结束时钟偏移测量线程并等待其退出，避免测试结束后残留线程"""
+        self.running = False
+        self.offset_stop.set()
+        if self.offset_thread:
+            self.offset_thread.join()
+            self.offset_thread = None
+
     def delay_offset_measurement(self):
+        import subprocess
+        self.apply_affinity('stats')
+        self.load_offset_fix_rate()
         if sys.platform == 'linux':
-            # 监测是否运行了 chronyd
-            output = subprocess.check_output(["systemctl", "is-active", "chronyd"], text=True)
+            # 监测是否运行了 chronyd（未运行时systemctl返回非0，未安装时抛出OSError）
+            try:
+                output = subprocess.check_output(["systemctl", "is-active", "chronyd"], text=True,
+                                                 stderr=subprocess.DEVNULL)
+            except (subprocess.CalledProcessError, OSError):
+                return
             if output != "active\n":
                 return 
         elif sys.platform == 'win32':
@@ -139,118 +222,60 @@ class UDPFlowGenerator(FlowGenerator):
             self.delay_offset = self.get_delay_offset()
             if self.delay_offset is None:
                 self.delay_offset = 0   
-            time.sleep(0.5)
+            self.offset_stop.wait(0.5)
             
+    def wait_for_init(self, server_socket):
+        """等待INIT并确认，返回(客户端地址, INIT中的选项)"""
+        while True:
+            data, addr = server_socket.recvfrom(65535)
+            packet = UDPPacket.from_bytes(data)
+            if packet.seq_no == UDPPacket.TYPE_INIT:
+                return self.accept_init(server_socket, packet, addr)
+
+    def accept_init(self, server_socket, packet, addr):
+        """确认收到的INIT，返回(客户端地址, INIT中的选项)"""
+        ack_packet = UDPPacket(UDPPacket.TYPE_INIT_ACK, int(time.time() * 1000000 + self.delay_offset))
+        server_socket.sendto(ack_packet.to_bytes(), addr)
+        return addr, self.parse_init_options(packet.data)
+
     def run_server(self):
-        m_t = threading.Thread(target=self.delay_offset_measurement)
-        m_t.start()
+        self.apply_affinity('send')
+        server_socket = None
         try:
             if not self.bind_address:
                 self.bind_address = '0.0.0.0' if not self.ipv6 else '::'
             socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
             server_socket = socket.socket(socket_family, socket.SOCK_DGRAM)
             server_socket.bind((self.bind_address, self.port))
+            # 反向流的发送socket绑定同一端口并连接到客户端，内核把该客户端的包优先交给已连接的socket。
+            # 在bind之后才设置：内核在后来的socket绑定时检查已有socket的这个选项，
+            # 端口已被另一个服务器占用时本次bind照常失败，不会两个服务器分摊同一个测试的流量
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.tune_receive(server_socket)
             if not self.json:
                 print(f"UDP Server listening on {self.bind_address}:{self.port}")
 
+            reverse_threads = {}
             while True:
                 # 等待客户端发起连接
-                if not self.json:
+                if not self.json and not reverse_threads:
                     print("Waiting for client connection...")
-                while True:
-                    data, addr = server_socket.recvfrom(65535)
-                    packet = UDPPacket.from_bytes(data)
-                    if packet.seq_no == UDPPacket.TYPE_INIT:
-                        # 发送确认包
-                        ack_packet = UDPPacket(UDPPacket.TYPE_INIT_ACK, int(time.time() * 1000000 + self.delay_offset))
-                        server_socket.sendto(ack_packet.to_bytes(), addr)
-                        break
-                if not self.json:
-                    print("Client connected, starting test...")
-                self.received_packets_seq_no = set()
-                self.total_sent = 0
-                self.total_packets = 0
-                self.max_seq_no = 0         # 最大的包序列号
-                self.total_jitters = 0      # 总抖动
-                self.total_delay = 0        # 总延迟
-                
-                self.is_running = True
-                self.test_start_time = self.start_time = time.time()
-                
-                self.stats_thread = threading.Thread(target=self.print_statistics)
-                self.stats_thread.daemon = True
-                self.stats_thread.start()
-                
-                self.total_received_packets = 0
-                self.total_sent_packets = 0
-                self.forced_quit = False
-                last_transit = 0
-                
-                try:
-                    while self.is_running:
-                        try:
-                            data, addr = server_socket.recvfrom(65535)
-                            now_time = time.time()
-                            packet = UDPPacket.from_bytes(data)
-
-                            if packet.seq_no == UDPPacket.TYPE_FORCE_QUIT:
-                                self.total_sent_packets = packet.total_packets
-                                # 发送确认
-                                ack_packet = UDPPacket(UDPPacket.TYPE_FORCE_QUIT_ACK, int(time.time() * 1000000 + self.delay_offset), self.total_packets)
-                                server_socket.sendto(ack_packet.to_bytes(), addr)
-                                self.is_running = False
-                                break
-                            
-                            if packet.seq_no == UDPPacket.TYPE_FIN:
-                                self.total_sent_packets = packet.total_packets
-                                ack_packet = UDPPacket(UDPPacket.TYPE_FIN_ACK, int(time.time() * 1000000 + self.delay_offset), self.total_packets)
-                                server_socket.sendto(ack_packet.to_bytes(), addr)
-                                break
-                                
-                            self.max_seq_no = max(self.max_seq_no, packet.seq_no)
-                            self.packet_size = len(data) # 跟新报文长度
-                            self.frame_size = self.packet_size + self.pkt_head_size
-                            self.total_sent += len(data) + self.pkt_head_size
-                            self.total_packets += 1
-                            transit = (now_time + self.delay_offset / 1000000 - packet.timestamp / 1000000) * 1000  # 单位ms
-                            # if transit < self.total_delay / self.total_packets * 0.5:
-                            #     transit = self.total_delay / self.total_packets
-                            self.total_jitters += abs(transit - last_transit)
-                            last_transit = transit
-                            self.total_delay += transit # 单位ms
-                            if self.pkg_data == "None" and self.printpkg:
-                                self.pkg_data = data.hex()
-
-                        except Exception as e:
-                            print(f"Error receiving data: {e}")
+                client_addr, init_options = self.wait_for_init(server_socket)
+                if 'reverse' in init_options:
+                    # 重传的反向请求只需再次确认
+                    if client_addr not in reverse_threads:
+                        thread = self.start_reverse(init_options['reverse'], client_addr)
+                        if thread:
+                            reverse_threads[client_addr] = thread
+                    if reverse_threads and not init_options['reverse'].get('bidir'):
+                        self.finish_reverse(reverse_threads, received=False)
+                        if self.one_test:
                             break
+                    continue
+                self.receive_test(server_socket, client_addr, init_options)
+                if reverse_threads:
+                    self.finish_reverse(reverse_threads, received=True)
 
-                except KeyboardInterrupt:
-                    self.forced_quit = True
-                    for _ in range(10):
-                        if 'addr' in locals():
-                            # 发送强制退出信号给客户端
-                            quit_packet = UDPPacket(UDPPacket.TYPE_FORCE_QUIT, int(time.time() * 1000000 + self.delay_offset), total_packets=self.total_packets)
-                            server_socket.sendto(quit_packet.to_bytes(), addr)
-                            # 等待确认
-                            try:
-                                server_socket.settimeout(0.1)
-                                data, _ = server_socket.recvfrom(65535)
-                                packet = UDPPacket.from_bytes(data)
-                                if packet.seq_no == UDPPacket.TYPE_FORCE_QUIT_ACK:
-                                    self.total_sent_packets = packet.total_packets
-                                    break
-                            except socket.timeout:
-                                continue
-                
-                self.is_running = False
-                self.test_end_time = time.time()
-                if self.stats_thread:
-                    self.stats_thread.join()
-                
-                if self.total_sent > 0:
-                    self.print_summary()
-                
                 if self.one_test:
                     break
 
@@ -258,39 +283,405 @@ class UDPFlowGenerator(FlowGenerator):
                     break
 
         except Exception as e:
-            print(f"Server error: {e}")
+            self.report_error("Server error", e)
         finally:
-            self.running = False
-            server_socket.close()
+            self.stop_offset_measurement()
+            if server_socket:
+                server_socket.close()
+
+    def start_reverse(self, options, client_addr):
+        """用绑定同一端口、连接到客户端的socket在线程中发送反向流，请求无效时返回None"""
+        sock = None
+        try:
+            if not isinstance(options, dict):
+                raise ValueError("Reverse request must be a JSON object")
+            sender = Duplex.create_sender(self, options, client_addr)
+            sock = socket.socket(socket.AF_INET6 if self.ipv6 else socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((self.bind_address, self.port))
+            sock.connect(client_addr)
+        except (OSError, ValueError) as e:
+            self.report_error("Invalid reverse request", e)
+            if sock:
+                sock.close()
+            return None
+        self.reverse_senders.append(sender)
+        self.direction = 'RX'
+        thread = threading.Thread(target=sender.run_sender, args=(sock,))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def finish_reverse(self, reverse_threads, received):
+        """等待反向流发送完，打印合并的结果；received：本机同时接收了正向流(--bidir)"""
+        for thread in reverse_threads.values():
+            thread.join()
+        Duplex.report(self, self.reverse_senders + ([self] if received else []))
+        reverse_threads.clear()
+        self.reverse_senders = []
+        self.direction = None
+
+    def receive_test(self, server_socket, client_addr, init_options):
+        """接收一个测试的数据包，直到收到FIN或强制退出"""
+        feedback = init_options.get('feedback_interval')
+        flows = init_options.get('flows', 1)
+        if not self.json:
+            print("Client connected, starting test...")
+        self.start_offset_measurement()
+        self.received_packets_seq_no = set()
+        self.total_sent = 0
+        self.total_packets = 0
+        self.max_seq_no = 0         # 各流最大包序列号之和，即应收到的包数
+        # 数据包的total_packets字段是流编号，每个流有独立的序列号空间；单流客户端固定为0
+        flow_seq = self.flow_seq = {}
+        self.flow_received = {} if flows > 1 else None
+        # 服务器看到的源地址（经过NAT后可能与客户端的五元组不同）
+        self.flow_sources = set() if flows > 1 else None
+        self.total_jitters = 0      # 总抖动
+        self.total_delay = 0        # 总延迟
+        
+        self.is_running = True
+        self.test_start_time = self.start_time = time.time()
+        
+        self.stats_thread = threading.Thread(target=self.print_statistics)
+        self.stats_thread.daemon = True
+        self.stats_thread.start()
+        server_socket = self.start_profiler(server_socket)
+        # 数据包接收到复用的缓冲区中，只解析16字节包头，不复制负载、不创建包对象
+        buffer = bytearray(RECV_BUFFER_SIZE)
+        recv_into = server_socket.recvfrom_into
+        decode = UDPPacket.HEADER.unpack_from
+        if self.profiler:
+            decode = self.profiler.wrap('decode', decode)
+        if self.rxq_ovfl:
+            recv_into = self.counting_drops(server_socket)
+        
+        self.total_received_packets = 0
+        self.total_sent_packets = 0
+        self.forced_quit = False
+        last_transit = 0
+        if feedback:
+            # 没有包到达时也要按时回报，客户端据此判断路径拥塞或中断
+            server_socket.settimeout(feedback)
+            self.reset_feedback(self.start_time)
+            next_report = self.start_time + feedback
+        
+        try:
+            while self.is_running:
+                try:
+                    nbytes, addr = recv_into(buffer)
+                    now_time = time.time()
+                    if nbytes < UDPPacket.HEADER_SIZE:
+                        continue
+                    seq_no, timestamp, flow_id = decode(buffer)
+
+                    if seq_no >= UDPPacket.TYPE_CONTROL:
+                        if seq_no == UDPPacket.TYPE_FORCE_QUIT:
+                            self.total_sent_packets = flow_id
+                            # 发送确认
+                            ack_packet = UDPPacket(UDPPacket.TYPE_FORCE_QUIT_ACK, int(time.time() * 1000000 + self.delay_offset), self.total_packets)
+                            server_socket.sendto(ack_packet.to_bytes(), addr)
+                            self.is_running = False
+                            break
+
+                        if seq_no == UDPPacket.TYPE_FIN:
+                            self.total_sent_packets = flow_id
+                            ack_packet = UDPPacket(UDPPacket.TYPE_FIN_ACK, int(time.time() * 1000000 + self.delay_offset), self.total_packets,
+                                                   self.server_report_bytes())
+                            server_socket.sendto(ack_packet.to_bytes(), addr)
+                            break
+                        # 重传的INIT等其他控制包不计入统计
+                        continue
+
+                    last_seq = flow_seq.get(flow_id, 0)
+                    if seq_no > last_seq:
+                        self.max_seq_no += seq_no - last_seq
+                        flow_seq[flow_id] = seq_no
+                    if self.flow_received is not None:
+                        self.flow_received[flow_id] = self.flow_received.get(flow_id, 0) + 1
+                        self.flow_sources.add(addr)
+                    self.packet_size = nbytes # 跟新报文长度
+                    self.frame_size = nbytes + self.pkt_head_size
+                    self.total_sent += nbytes + self.pkt_head_size
+                    self.total_packets += 1
+                    transit = (now_time + self.delay_offset / 1000000 - timestamp / 1000000) * 1000  # 单位ms
+                    # if transit < self.total_delay / self.total_packets * 0.5:
+                    #     transit = self.total_delay / self.total_packets
+                    self.total_jitters += abs(transit - last_transit)
+                    last_transit = transit
+                    self.total_delay += transit # 单位ms
+                    if self.pkg_data == "None" and self.printpkg:
+                        self.pkg_data = buffer[:nbytes].hex()
+                    if feedback and now_time >= next_report:
+                        self.send_feedback(server_socket, client_addr, now_time)
+                        next_report = now_time + feedback
+
+                except socket.timeout:
+                    if feedback:
+                        now_time = time.time()
+                        self.send_feedback(server_socket, client_addr, now_time)
+                        next_report = now_time + feedback
+                except Exception as e:
+                    self.report_error("Error receiving data", e)
+                    break
+
+        except KeyboardInterrupt:
+            self.forced_quit = True
+            for _ in range(10):
+                if 'addr' in locals():
+                    # 发送强制退出信号给客户端
+                    quit_packet = UDPPacket(UDPPacket.TYPE_FORCE_QUIT, int(time.time() * 1000000 + self.delay_offset), total_packets=self.total_packets)
+                    server_socket.sendto(quit_packet.to_bytes(), addr)
+                    # 等待确认
+                    try:
+                        server_socket.settimeout(0.1)
+                        data, _ = server_socket.recvfrom(65535)
+                        packet = UDPPacket.from_bytes(data)
+                        if packet.seq_no == UDPPacket.TYPE_FORCE_QUIT_ACK:
+                            self.total_sent_packets = packet.total_packets
+                            break
+                    except socket.timeout:
+                        continue
+        
+        self.is_running = False
+        self.test_end_time = time.time()
+        self.stop_profiler()
+        if feedback:
+            server_socket.settimeout(None)
+        if self.stats_thread:
+            self.stats_thread.join()
+        
+        if self.total_sent > 0:
+            self.print_summary()
+
+    def counting_drops(self, sock):
+        """开启SO_RXQ_OVFL时的recvfrom_into：从辅助数据中读取内核的累计丢包计数，更新本次测试的local_drops"""
+        recvmsg_into = sock.recvmsg_into
+        ancbufsize = socket.CMSG_SPACE(DROP_COUNTER.size)
+        baseline = self.socket_drops
+        self.local_drops = 0
+
+        def recv_into(buffer):
+            nbytes, ancdata, _, addr = recvmsg_into([buffer], ancbufsize)
+            # 还没有丢过包时内核不附带计数
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL:
+                    self.socket_drops = DROP_COUNTER.unpack(data)[0]
+                    self.local_drops = (self.socket_drops - baseline) & 0xffffffff
+            return nbytes, addr
+        return recv_into
+
+    def server_report_bytes(self):
+        """FIN_ACK的负载：服务器端测得的时延和抖动，旧版本客户端会忽略包头之后的数据"""
+        packets = self.total_packets
+        report = {
+            'received': packets,
+            'delay_ms': self.total_delay / packets if packets else 0,
+            'jitter_ms': self.total_jitters / packets if packets else 0,
+        }
+        if self.flow_received:
+            report['flow_summary'] = self.flow_table_summary()
+        if self.rxq_ovfl:
+            report['local_drops'] = self.local_drops
+        data = JSON.dumps(report).encode()
+        # 多流测试：各流收到的包数放得下时才逐个回报，否则只有flow_summary
+        if self.flow_received:
+            report['flows'] = self.flow_received
+            with_flows = JSON.dumps(report, separators=(',', ':')).encode()
+            if len(with_flows) <= MAX_REPORT_SIZE:
+                data = with_flows
+        return data
+
+    def flow_table_summary(self):
+        """服务器：各流收到的包数和丢包率的分布，流很多时代替逐流回报"""
+        losses = []
+        for flow_id, received in self.flow_received.items():
+            expected = self.flow_seq.get(flow_id, 0)
+            if expected:
+                losses.append(100 * max(0, expected - received) / expected)
+        return {
+            'flows_seen': len(self.flow_received),
+            'sources_seen': len(self.flow_sources),
+            'flows_with_loss': sum(1 for loss in losses if loss > 0),
+            'packets': percentiles(list(self.flow_received.values())),
+            'lost_percent': percentiles(losses),
+        }
+
+    @staticmethod
+    def parse_init_options(data):
+        """INIT包负载中客户端请求的选项(JSON)，旧版本客户端不带负载"""
+        if not data:
+            return {}
+        try:
+            options = JSON.loads(data)
+        except ValueError:
+            return {}
+        return options if isinstance(options, dict) else {}
+
+    def reset_feedback(self, now):
+        self.feedback_seq = 0
+        self.feedback_last = (now, self.total_packets, self.max_seq_no, self.total_sent, self.total_delay)
+
+    def send_feedback(self, sock, addr, now):
+        """向客户端发送上一个报告之后的接收情况"""
+        last_time, last_packets, last_seq, last_bytes, last_delay = self.feedback_last
+        elapsed = max(now - last_time, 1e-6)
+        received = self.total_packets - last_packets
+        lost = max(0, (self.max_seq_no - last_seq) - received)
+        self.feedback_seq += 1
+        report = {
+            'seq': self.feedback_seq,
+            'interval': elapsed,
+            'received': received,
+            'expected': self.max_seq_no - last_seq,
+            'lost': lost,
+            'loss_percent': 100 * lost / (received + lost) if received + lost else 0,
+            'delay_ms': (self.total_delay - last_delay) / received if received else None,
+            'rate_bps': (self.total_sent - last_bytes) * 8 / elapsed,
+        }
+        self.feedback_last = (now, self.total_packets, self.max_seq_no, self.total_sent, self.total_delay)
+        packet = UDPPacket(UDPPacket.TYPE_REPORT, int(now * 1000000 + self.delay_offset), self.total_packets,
+                           JSON.dumps(report).encode())
+        sock.sendto(packet.to_bytes(), addr)
+
+    def set_pps(self, pps):
+        self.pps = pps
+        self.mean_pkt_interval = 1.0 / pps
+
+    def apply_feedback(self, data):
+        """客户端：把服务器报告交给控制器，更新发送速率"""
+        try:
+            report = JSON.loads(data)
+        except ValueError:
+            return
+        if not isinstance(report, dict):
+            return
+        # 服务器只知道收到了什么，区间内的发包数由客户端补上，控制器据此区分没有发送和全部丢失
+        report['sent'] = self.total_packets - self.feedback_sent
+        self.feedback_sent = self.total_packets
+        self.feedback_reports += 1
+        self.last_feedback_time = time.time()
+        self.set_pps(self.rate_controller.on_report(report, self.pps))
+
+    def rate_control_summary(self):
+        return {
+            'controller': self.rate_controller.name,
+            'reports': self.feedback_reports,
+            'timeouts': self.feedback_timeouts,
+            'final_bps': self.pps * self.frame_size * 8,
+        }
+
+    def open_tx_ring(self):
+        """在握手之后打开TX环：此时UDP socket已绑定源端口，到服务器的ARP也已解析"""
+        from PacketRing import TxRing, build_frame, interface_mac, parse_mac, resolve_mac, route_source
+        interface = self.raw
+        src_mac = interface_mac(interface)
+        dst_mac = parse_mac(self.raw_dst_mac) if self.raw_dst_mac else resolve_mac(interface, self.host)
+        source = (self.bind_address or route_source(self.host, self.port), self.socket.getsockname()[1])
+        frame = build_frame(src_mac, dst_mac, source, (self.host, self.port), self.packet_size)
+        self.tx_ring = TxRing(interface, frame)
+
+    def drain_socket(self):
+        """丢弃复用socket中上一次测试残留的包（如重复的FIN_ACK）"""
+        self.socket.setblocking(False)
+        try:
+            while True:
+                self.socket.recvfrom(65535)
+        except (BlockingIOError, OSError):
+            pass
+        self.socket.setblocking(True)
+
+    def handshake(self, init_options, reverse=False):
+        """发送INIT直到收到确认；reverse：请求反向流时服务器发起反向流的INIT也算作确认"""
+        for _ in range(10):  # 重试10次
+            try:
+                init_packet = UDPPacket(UDPPacket.TYPE_INIT, int(time.time() * 1000000 + self.delay_offset), 0, init_options)
+                self.socket.sendto(init_packet.to_bytes(), (self.host, self.port))
+                
+                self.socket.settimeout(0.1)
+                data, addr = self.socket.recvfrom(65535)
+                packet = UDPPacket.from_bytes(data)
+                if packet.seq_no == UDPPacket.TYPE_INIT_ACK:
+                    if not self.json:
+                        print("Connection established")
+                    break
+                if reverse and packet.seq_no == UDPPacket.TYPE_INIT:
+                    # 确认丢失了，服务器已经开始发送反向流；重传的请求会交给服务器的发送socket而不再被确认，
+                    # 这个INIT留给receive_reverse处理
+                    self.reverse_init = (packet, addr)
+                    if not self.json:
+                        print("Connection established")
+                    break
+            except socket.timeout:
+                continue
+        else:
+            raise Exception("Failed to establish connection")
+        
+        self.socket.settimeout(None)  # 恢复为阻塞模式
+
+    def request_reverse(self, options):
+        """客户端：用一个新socket请求反向流，返回这个socket"""
+        socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+        self.socket = socket.socket(socket_family, socket.SOCK_DGRAM)
+        self.tune_receive(self.socket)
+        if not self.json:
+            print(f"UDP Client requesting a reverse flow from {self.host}:{self.port}")
+        try:
+            self.handshake(JSON.dumps({'reverse': options}).encode(), reverse=True)
+        except Exception:
+            self.socket.close()
+            raise
+        return self.socket
+
+    def receive_reverse(self, sock):
+        """客户端：等待服务器从同一端口发起反向流，按服务器的方式接收直到FIN"""
+        try:
+            sock.settimeout(Duplex.REQUEST_TIMEOUT)
+            try:
+                if self.reverse_init:
+                    client_addr, init_options = self.accept_init(sock, *self.reverse_init)
+                    self.reverse_init = None
+                else:
+                    client_addr, init_options = self.wait_for_init(sock)
+            except socket.timeout:
+                raise Exception("Server did not start the reverse flow")
+            sock.settimeout(None)
+            self.receive_test(sock, client_addr, init_options)
+        except Exception as e:
+            self.report_error("Client error", e)
+        finally:
+            self.stop_offset_measurement()
+            sock.close()
 
     def run_client(self):
-        m_t = threading.Thread(target=self.delay_offset_measurement)
-        m_t.start()
+        self.apply_affinity('send')
+        if self.reverse or self.bidir:
+            Duplex.run_client(self)
+            return
+        self.run_sender()
+
+    def run_sender(self, sock=None):
+        """按参数发送直到测试结束；sock为服务器上连接到客户端的反向流socket"""
         try:
+            self.open_trace(min_size=16, max_size=65507)
             socket_family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
-            self.socket = socket.socket(socket_family, socket.SOCK_DGRAM)
+            if sock is not None:
+                self.socket = sock
+            elif self.external_socket:
+                self.socket = self.external_socket
+                self.drain_socket()
+            else:
+                self.socket = socket.socket(socket_family, socket.SOCK_DGRAM)
             if not self.json:
-                print(f"UDP Client connecting to {self.host}:{self.port}")
+                print(f"{'Sending reverse flow to' if sock else 'UDP Client connecting to'} {self.host}:{self.port}")
+            init_options = b''
+            if self.rate_control:
+                init_options = JSON.dumps({'feedback_interval': self.feedback_interval}).encode()
             
             # 发送建立连接请求
-            for _ in range(10):  # 重试10次
-                try:
-                    init_packet = UDPPacket(UDPPacket.TYPE_INIT, int(time.time() * 1000000 + self.delay_offset))
-                    self.socket.sendto(init_packet.to_bytes(), (self.host, self.port))
-                    
-                    self.socket.settimeout(0.1)
-                    data, _ = self.socket.recvfrom(65535)
-                    packet = UDPPacket.from_bytes(data)
-                    if packet.seq_no == UDPPacket.TYPE_INIT_ACK:
-                        if not self.json:
-                            print("Connection established")
-                        break
-                except socket.timeout:
-                    continue
-            else:
-                raise Exception("Failed to establish connection")
-            
-            self.socket.settimeout(None)  # 恢复为阻塞模式
+            self.handshake(init_options)
+            if self.raw:
+                self.open_tx_ring()
             
             self.is_running = True
             self.test_start_time = self.start_time = time.time()
@@ -299,10 +690,20 @@ class UDPFlowGenerator(FlowGenerator):
             self.stats_thread = threading.Thread(target=self.print_statistics)
             self.stats_thread.daemon = True
             self.stats_thread.start()
+            self.socket = self.start_profiler(self.socket)
+            self.socket = self.open_zerocopy(self.socket)
+            self.start_offset_measurement()
 
             self.reset_bandwidth()
             seq_no = 1
             self.forced_quit = False
+            self.total_received_packets = 0
+            if self.rate_control:
+                max_pps = self.max_bandwidth / (self.frame_size * 8) if self.max_bandwidth else None
+                self.rate_controller = create_controller(self.rate_control, self.pps, max_pps=max_pps)
+                self.last_feedback_time = time.time()
+                self.feedback_sent = self.total_packets
+                feedback_timeout = FEEDBACK_TIMEOUT * self.feedback_interval
 
             if self.pps:
                 next_send_time = time.time()
@@ -329,17 +730,38 @@ class UDPFlowGenerator(FlowGenerator):
                             self.socket.sendto(ack_packet.to_bytes(), (self.host, self.port))
                             self.forced_quit = True
                             break
+                        if packet.seq_no == UDPPacket.TYPE_REPORT and self.rate_controller:
+                            self.apply_feedback(packet.data)
                     except (socket.error, BlockingIOError):
                         pass
                     self.socket.setblocking(True)
+                    # 一个报告都没收到说明服务器不支持回报，保持原速率
+                    if self.feedback_reports and time.time() - self.last_feedback_time > feedback_timeout:
+                        self.feedback_timeouts += 1
+                        self.last_feedback_time = time.time()
+                        self.set_pps(self.rate_controller.on_timeout(self.pps))
                         
-                    if self.pps:
+                    if self.tx_ring:
+                        # 到期的包改写环中预先填好的帧，一批只调用一次send
+                        current_time = time.time()
+                        burst = 0
+                        while burst < MAX_BURST and current_time > next_send_time:
+                            burst += 1
+                            next_send_time += self.return_packet_interval()
+                        if burst:
+                            sent = self.tx_ring.send(seq_no, burst, int(current_time * 1000000 + self.delay_offset))
+                            self.total_sent += sent * self.frame_size
+                            self.total_packets += sent
+                            seq_no += sent
+                    elif self.pps:
                         current_time = time.time()
-                        while True:
+                        burst = 0
+                        while burst < MAX_BURST:
                             if current_time > next_send_time:
+                                burst += 1
                                 test_data = self.create_test_data(seq_no)
-                                self.socket.sendto(test_data, (self.host, self.port))
-                                self.total_sent += len(test_data) + self.pkt_head_size
+                                sent = self.socket.sendto(test_data, (self.host, self.port))
+                                self.total_sent += sent + self.pkt_head_size
                                 self.total_packets += 1
                                 seq_no += 1
                                 next_send_time += self.return_packet_interval()
@@ -347,14 +769,17 @@ class UDPFlowGenerator(FlowGenerator):
                                 break
                     else:
                         test_data = self.create_test_data(seq_no)
-                        self.socket.sendto(test_data, (self.host, self.port))
-                        self.total_sent += len(test_data) + self.pkt_head_size
+                        sent = self.socket.sendto(test_data, (self.host, self.port))
+                        self.total_sent += sent + self.pkt_head_size
                         self.total_packets += 1
                         seq_no += 1
 
                     if self.pkg_data == "None" and self.printpkg:
                         self.pkg_data = test_data.hex()
 
+                if self.zerocopy_socket:
+                    self.zerocopy_socket.flush()
+                self.stop_clock()
                 if not self.forced_quit:
                     # 发送FIN包并等待确认
                     for _ in range(40):
@@ -367,12 +792,18 @@ class UDPFlowGenerator(FlowGenerator):
                             packet = UDPPacket.from_bytes(data)
                             if packet.seq_no == UDPPacket.TYPE_FIN_ACK:
                                 self.total_received_packets = packet.total_packets
+                                try:
+                                    report = JSON.loads(packet.data) if packet.data else None
+                                    self.server_report = report if isinstance(report, dict) else None
+                                except ValueError:
+                                    self.server_report = None
                                 break
                         except socket.timeout:
                             continue
 
             except KeyboardInterrupt:
                 self.forced_quit = True
+                self.stop_clock()
                 for _ in range(10):
                     # 发送强制退出信号给服务器
                     quit_packet = UDPPacket(UDPPacket.TYPE_FORCE_QUIT, int(time.time() * 1000000 + self.delay_offset), total_packets=self.total_packets)
@@ -388,8 +819,8 @@ class UDPFlowGenerator(FlowGenerator):
                     except socket.timeout:
                         continue
 
-            self.is_running = False
-            self.test_end_time = time.time()
+            self.stop_clock()
+            self.stop_profiler()
             
             if self.stats_thread:
                 self.stats_thread.join()
@@ -397,8 +828,11 @@ class UDPFlowGenerator(FlowGenerator):
             self.print_summary()
 
         except Exception as e:
-            print(f"Client error: {e}")
+            self.report_error("Client error", e)
         finally:
-            self.running = False
-            if self.socket:
+            self.stop_offset_measurement()
+            if self.tx_ring:
+                self.tx_ring.close()
+                self.tx_ring = None
+            if self.socket and not self.external_socket:
                 self.socket.close()
\ No newline at end of file
@@ -0,0 +1,106 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, 'main.py')
+
+# Make the generator modules and the forwarder importable from the benchmark scripts
+for path in (ROOT, os.path.join(ROOT, 'forwarder')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def spawn_main(args, **kwargs):
+    """Start `python main.py <args>` from the repository root"""
+    return subprocess.Popen([sys.executable, MAIN] + [str(a) for a in args], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, **kwargs)
+
+
+def parse_json_output(output):
+    """Return the JSON document printed by `main.py -J`, or None"""
+    start = output.find('{')
+    if start < 0:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(output[start:])[0]
+    except ValueError:
+        return None
+
+
+def percentiles(values, points=(50, 90, 99, 99.9)):
+    if not len(values):
+        return {}
+    import numpy as np
+    result = {f'p{p:g}': float(v) for p, v in zip(points, np.percentile(values, points))}
+    result['min'] = float(np.min(values))
+    result['max'] = float(np.max(values))
+    result['mean'] = float(np.mean(values))
+    return result
+
+
+def host_info():
+    return {
+        'hostname': platform.node(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'time': time.time(),
+    }
+
+
+def write_results(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+
+def to_bps(value):
+    """Same K/M/G suffix handling as `-b` on the command line"""
+    units = {'k': 1000, 'm': 1000 ** 2, 'g': 1000 ** 3}
+    if value[-1].lower() in units:
+        return int(value[:-1]) * units[value[-1].lower()]
+    return int(value)
+
+
+def parse_list(value, convert=str):
+    return [convert(v) for v in value.split(',') if v]
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results, baseline, key_fields, metrics):
+    """Compare result rows with the baseline rows that have the same key.
+
+    metrics maps a metric name to (better, tolerance, absolute): better is
+    'higher' or 'lower', tolerance is the allowed relative change in the worse
+    direction and absolute a minimum allowed change, for metrics close to 0.
+    Returns a list of regression descriptions, empty when everything passed.
+    """
+    def key(row):
+        return tuple(row.get(field) for field in key_fields)
+
+    reference = {key(row): row for row in baseline.get('results', [])}
+    regressions = []
+    for row in results.get('results', []):
+        base = reference.get(key(row))
+        if base is None:
+            continue
+        for metric, (better, tolerance, absolute) in metrics.items():
+            value, expected = row.get(metric), base.get(metric)
+            if value is None or expected is None:
+                continue
+            slack = max(abs(expected) * tolerance, absolute)
+            if better == 'higher':
+                failed = value < expected - slack
+            else:
+                failed = value > expected + slack
+            if failed:
+                name = ' '.join(f'{field}={row.get(field)}' for field in key_fields)
+                regressions.append(f"{name}: {metric} {value:.4g} vs baseline {expected:.4g} (tolerance {tolerance:.0%})")
+    return regressions
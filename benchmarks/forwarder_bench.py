@@ -0,0 +1,170 @@
+import argparse
+import multiprocessing
+import socket
+import struct
+import threading
+import time
+
+from common import spawn_main, percentiles, host_info, write_results, parse_list
+from UDPFlowGenerator import UDPPacket
+from udp_forwarder import UDPForwarder_426, UDPForwarder_624
+from telemetry import PACKETS
+
+HEADER = struct.Struct('!IQI')
+
+# direction -> (forwarder listen family, sink family, forwarder counter direction)
+DIRECTIONS = {
+    '426': ('127.0.0.1', '::1', '4to6'),
+    '624': ('::1', '127.0.0.1', '6to4'),
+}
+
+
+def run_sink(address, port, control):
+    """UDP receiver speaking the generator protocol, reports delay percentiles on request"""
+    family = socket.AF_INET6 if ':' in address else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind((address, port))
+    sock.settimeout(0.05)
+    buf = bytearray(65535)
+    received = {}
+    sent = {}
+    delays = []
+    pending = 0
+
+    while True:
+        if pending >= 4096 or not pending:
+            pending = 0
+            if control.poll():
+                command = control.recv()
+                if command == 'stop':
+                    break
+                control.send({
+                    'received': sum(received.values()),
+                    'sent': sum(sent.values()),
+                    'sessions': len(sent),
+                    'delay_us': percentiles(delays),
+                })
+                received, sent, delays = {}, {}, []
+        try:
+            n, addr = sock.recvfrom_into(buf)
+        except socket.timeout:
+            pending = 0
+            continue
+        now = time.time()
+        pending += 1
+        seq_no, timestamp, total_packets = HEADER.unpack_from(buf)
+        if seq_no == UDPPacket.TYPE_INIT:
+            reply = UDPPacket(UDPPacket.TYPE_INIT_ACK, int(now * 1000000))
+        elif seq_no == UDPPacket.TYPE_FIN or seq_no == UDPPacket.TYPE_FORCE_QUIT:
+            sent[addr] = total_packets
+            ack = UDPPacket.TYPE_FIN_ACK if seq_no == UDPPacket.TYPE_FIN else UDPPacket.TYPE_FORCE_QUIT_ACK
+            reply = UDPPacket(ack, int(now * 1000000), received.get(addr, 0))
+        else:
+            received[addr] = received.get(addr, 0) + 1
+            delays.append(now * 1000000 - timestamp)
+            continue
+        sock.sendto(reply.to_bytes(), addr)
+    sock.close()
+
+
+def forwarded_packets(forwarder, direction):
+    return sum(session['stats'][direction][PACKETS] for session in list(forwarder.sessions.values()))
+
+
+def run_step(client_host, client_port, ipv6, rate, sessions, duration, packet_size, control):
+    args = ['-c', client_host, '-p', client_port, '-u', '-b', rate, '-t', duration, '-l', packet_size, '-J']
+    if ipv6:
+        args.append('-6')
+    clients = [spawn_main(args) for _ in range(sessions)]
+    failures = 0
+    for client in clients:
+        client.communicate(timeout=duration + 30)
+        failures += client.returncode != 0
+    # Let the last datagrams drain through the forwarder queues
+    time.sleep(0.5)
+    control.send('report')
+    report = control.recv()
+    report['client_failures'] = failures
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loopback throughput and latency benchmark for udp_forwarder')
+    parser.add_argument('--directions', type=str, default='426,624', help='Comma separated: 426, 624')
+    parser.add_argument('--rates', type=str, default='10M,50M,100M', help='Per-session bandwidth steps')
+    parser.add_argument('--sessions', type=str, default='1,4', help='Concurrent client session steps')
+    parser.add_argument('-t', '--time', type=int, default=3, help='Seconds per step')
+    parser.add_argument('-l', '--packet-size', type=int, default=512, help='Packet size in bytes')
+    parser.add_argument('-p', '--port', type=int, default=15001, help='First of the 4 loopback ports used')
+    parser.add_argument('--mutation', choices=['none', 'legacy'], default='none',
+                        help='Forward unchanged, or apply the default reserve/new rate handling')
+    parser.add_argument('--rules', type=str, help='Rule file for the forwarder (overrides --mutation)')
+    parser.add_argument('-o', '--output', type=str, default='forwarder_bench.json', help='Results file')
+    args = parser.parse_args()
+
+    handler_config = {'reserve_rate': 0.3, 'new_rate': 0.2, 'new_content': '-uestc-',
+                      'rules_file': args.rules, 'rules': [] if args.mutation == 'none' else None}
+    results = {'host': host_info(), 'config': vars(args), 'results': []}
+
+    for index, direction in enumerate(parse_list(args.directions)):
+        client_host, sink_host, counter = DIRECTIONS[direction]
+        listen_port = args.port + 2 * index
+        sink_port = listen_port + 1
+
+        control, sink_control = multiprocessing.Pipe()
+        sink = multiprocessing.Process(target=run_sink, args=(sink_host, sink_port, sink_control), daemon=True)
+        sink.start()
+
+        forward_config = {'listen_port': listen_port, 'target_address': sink_host, 'target_port': sink_port}
+        ForwarderClass = UDPForwarder_426 if direction == '426' else UDPForwarder_624
+        forwarder = ForwarderClass(forward_config=forward_config, handler_config=handler_config)
+        threading.Thread(target=forwarder.start, daemon=True).start()
+
+        for sessions in parse_list(args.sessions, int):
+            for rate in parse_list(args.rates):
+                step = {}
+                for path in ('direct', 'forwarded'):
+                    if path == 'direct':
+                        host, port = sink_host, sink_port
+                    else:
+                        host, port = client_host, listen_port
+                    before = forwarded_packets(forwarder, counter)
+                    report = run_step(host, port, ':' in host, rate, sessions, args.time, args.packet_size, control)
+                    report['forwarded'] = forwarded_packets(forwarder, counter) - before
+                    step[path] = report
+
+                direct, forwarded = step['direct'], step['forwarded']
+                sent = forwarded['sent']
+                result = {
+                    'direction': direction,
+                    'rate': rate,
+                    'sessions': sessions,
+                    'packet_size': args.packet_size,
+                    'seconds': args.time,
+                    'offered_pps': sent / args.time,
+                    'forwarded_pps': forwarded['forwarded'] / args.time,
+                    'received_pps': forwarded['received'] / args.time,
+                    'loss_percent': 100 * (sent - forwarded['received']) / sent if sent else 0,
+                    'direct_loss_percent': 100 * (direct['sent'] - direct['received']) / direct['sent'] if direct['sent'] else 0,
+                    'delay_us': forwarded['delay_us'],
+                    'direct_delay_us': direct['delay_us'],
+                    'added_delay_us': {k: forwarded['delay_us'][k] - direct['delay_us'][k]
+                                       for k in forwarded['delay_us'] if k in direct['delay_us']},
+                    'client_failures': direct['client_failures'] + forwarded['client_failures'],
+                }
+                results['results'].append(result)
+                write_results(args.output, results)
+                print(f"[{direction}] sessions={sessions} rate={rate}: "
+                      f"offered {result['offered_pps']:.0f} pps, forwarded {result['forwarded_pps']:.0f} pps, "
+                      f"loss {result['loss_percent']:.2f}%, "
+                      f"added p50/p99 {result['added_delay_us'].get('p50', 0):.1f}/{result['added_delay_us'].get('p99', 0):.1f} us")
+
+        control.send('stop')
+        sink.join(timeout=5)
+
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import (MAIN, ROOT, spawn_main, parse_json_output, host_info, write_results, parse_list,
+                    load_results, compare_to_baseline, to_bps)
+
+# Distribution mode -> extra client arguments
+DISTRIBUTIONS = {
+    'const': [],
+    'dpps': ['-dpps', 'exp'],
+    'dl': ['-dl', 'exp'],
+    'db': ['-db', 'exp', '-bri', '1'],
+    'all': ['-dpps', 'exp', '-dl', 'exp', '-db', 'exp', '-bri', '1'],
+}
+
+KEY_FIELDS = ('protocol', 'packet_size', 'rate', 'distribution')
+
+
+# metric -> (better, relative tolerance, absolute tolerance)
+def regression_metrics(tolerance, pacing_tolerance):
+    return {
+        'achieved_bps': ('higher', tolerance, 0),
+        'achieved_pps': ('higher', tolerance, 0),
+        'cpu_per_packet_us': ('lower', tolerance, 0),
+        'pacing_error': ('lower', 0, pacing_tolerance),
+    }
+
+
+def run_client(args):
+    """Run a client to completion and return (output, cpu seconds) from its own rusage"""
+    with tempfile.TemporaryFile(mode='w+') as out:
+        client = subprocess.Popen([sys.executable, MAIN] + [str(a) for a in args], cwd=ROOT,
+                                  stdout=out, stderr=subprocess.DEVNULL, text=True)
+        _, status, rusage = os.wait4(client.pid, 0)
+        client.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        out.seek(0)
+        return out.read(), rusage.ru_utime + rusage.ru_stime
+
+
+def run_case(protocol, packet_size, rate, distribution, duration, port):
+    server_args = ['-s', '-p', port, '-J', '-1']
+    client_args = ['-c', '127.0.0.1', '-p', port, '-t', duration, '-l', packet_size, '-J']
+    if protocol == 'udp':
+        server_args.append('-u')
+        client_args.append('-u')
+    if rate != 'max':
+        client_args += ['-b', rate]
+    elif protocol == 'udp':
+        # The UDP client is always paced, ask for more than loopback can carry
+        client_args += ['-b', '100G']
+    client_args += DISTRIBUTIONS[distribution]
+
+    server = spawn_main(server_args)
+    time.sleep(0.7)
+    output, cpu_seconds = run_client(client_args)
+    try:
+        server_output, _ = server.communicate(timeout=10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server_output, _ = server.communicate()
+
+    client_json = parse_json_output(output)
+    server_json = parse_json_output(server_output)
+    result = {
+        'protocol': protocol,
+        'packet_size': packet_size,
+        'rate': rate,
+        'distribution': distribution,
+        'seconds': duration,
+    }
+    if not client_json or not client_json.get('intervals'):
+        result['error'] = output.strip()[-500:] or 'client produced no output'
+        return result
+
+    end = client_json['end']
+    intervals = client_json['intervals']
+    packets = intervals[-1]['total_packets']
+    requested = to_bps(rate) if rate != 'max' else None
+    # The last interval is usually partial, leave it out of the pacing error
+    full = intervals[:-1] or intervals
+    result.update({
+        'requested_bps': requested,
+        'achieved_bps': end['bits_per_second'],
+        'achieved_pps': packets / end['seconds'],
+        'rate_ratio': end['bits_per_second'] / requested if requested else None,
+        'packets': packets,
+        'cpu_seconds': cpu_seconds,
+        'cpu_per_packet_us': cpu_seconds / packets * 1e6 if packets else None,
+        'pacing_error': (sum(abs(x['bandwidth'] - requested) for x in full) / len(full) / requested
+                         if requested else None),
+    })
+    if server_json and server_json.get('end'):
+        result['server_bps'] = server_json['end'].get('bits_per_second')
+        result['loss_percent'] = server_json['end'].get('lost_percent')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Loopback performance benchmark for TCPFlowGenerator/UDPFlowGenerator')
+    parser.add_argument('--protocols', type=str, default='udp,tcp', help='Comma separated: udp, tcp')
+    parser.add_argument('--sizes', type=str, default='80,512,1450', help='Packet sizes in bytes')
+    parser.add_argument('--rates', type=str, default='10M,100M,max', help='Requested rates, "max" for unpaced')
+    parser.add_argument('--distributions', type=str, default='const,all',
+                        help='Comma separated: ' + ', '.join(DISTRIBUTIONS))
+    parser.add_argument('-t', '--time', type=int, default=3, help='Seconds per case')
+    parser.add_argument('-p', '--port', type=int, default=15101, help='Loopback port')
+    parser.add_argument('-o', '--output', type=str, default='generator_bench.json', help='Results file')
+    parser.add_argument('--baseline', type=str, help='Compare against this results file, exit 1 on regression')
+    parser.add_argument('--save-baseline', type=str, help='Also write the results to this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression')
+    parser.add_argument('--pacing-tolerance', type=float, default=0.05, help='Allowed absolute pacing error increase')
+    args = parser.parse_args()
+
+    results = {'host': host_info(), 'config': vars(args), 'results': []}
+    for protocol in parse_list(args.protocols):
+        for packet_size in parse_list(args.sizes, int):
+            for rate in parse_list(args.rates):
+                for distribution in parse_list(args.distributions):
+                    result = run_case(protocol, packet_size, rate, distribution, args.time, args.port)
+                    results['results'].append(result)
+                    write_results(args.output, results)
+                    if 'error' in result:
+                        print(f"[{protocol} {packet_size}B {rate} {distribution}] error: {result['error']}")
+                        continue
+                    ratio = f"{result['rate_ratio']:.3f}" if result['rate_ratio'] is not None else '-'
+                    print(f"[{protocol} {packet_size}B {rate} {distribution}] "
+                          f"{result['achieved_bps']/1e6:.2f} Mbps ({result['achieved_pps']:.0f} pps), "
+                          f"ratio {ratio}, cpu {result['cpu_per_packet_us']:.2f} us/pkt")
+
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        write_results(args.save_baseline, results)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.baseline:
+        regressions = compare_to_baseline(results, load_results(args.baseline), KEY_FIELDS,
+                                          regression_metrics(args.tolerance, args.pacing_tolerance))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import argparse
+import socket
+import subprocess
+import sys
+import time
+
+from common import (MAIN, ROOT, percentiles, host_info, write_results, parse_list, load_results,
+                    compare_to_baseline)
+from UDPFlowGenerator import UDPPacket
+
+CASES = ('version', 'import', 'udp', 'udp_dist', 'tcp')
+
+# Client arguments for the first-packet cases, host and port are prepended
+FIRST_PACKET_ARGS = {
+    'udp': ['-u', '-t', '1', '-b', '1M', '-J'],
+    'udp_dist': ['-u', '-t', '1', '-b', '1M', '-J', '-dpps', 'exp', '-dl', 'exp'],
+    'tcp': ['-t', '1', '-b', '1M', '-J'],
+}
+
+KEY_FIELDS = ('case',)
+
+
+def time_process(args):
+    """Seconds from spawn to exit, and the process output"""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable] + args, cwd=ROOT, capture_output=True, text=True).stdout
+    return time.perf_counter() - start, output
+
+
+def spawn_client(args, port):
+    return subprocess.Popen([sys.executable, MAIN, '-c', '127.0.0.1', '-p', str(port)] + args, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def udp_first_packet(args, port):
+    """Seconds from spawning a UDP client to its first data packet, answering the handshake like a server"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', port))
+    sock.settimeout(10)
+    start = time.perf_counter()
+    client = spawn_client(args, port)
+    first = None
+    received = 0
+    try:
+        while True:
+            data, addr = sock.recvfrom(65535)
+            packet = UDPPacket.from_bytes(data)
+            if packet.seq_no == UDPPacket.TYPE_INIT:
+                sock.sendto(UDPPacket(UDPPacket.TYPE_INIT_ACK, int(time.time() * 1000000)).to_bytes(), addr)
+            elif packet.seq_no == UDPPacket.TYPE_FIN:
+                sock.sendto(UDPPacket(UDPPacket.TYPE_FIN_ACK, int(time.time() * 1000000), received).to_bytes(), addr)
+                break
+            else:
+                if first is None:
+                    first = time.perf_counter() - start
+                received += 1
+    except socket.timeout:
+        client.kill()
+    finally:
+        client.wait()
+        sock.close()
+    return first
+
+
+def tcp_first_packet(args, port):
+    """Seconds from spawning a TCP client to its first bytes arriving"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', port))
+    listener.listen(1)
+    listener.settimeout(10)
+    start = time.perf_counter()
+    client = spawn_client(args, port)
+    first = None
+    try:
+        conn, _ = listener.accept()
+        conn.settimeout(10)
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            if first is None:
+                first = time.perf_counter() - start
+        conn.close()
+    except socket.timeout:
+        client.kill()
+    finally:
+        client.wait()
+        listener.close()
+    return first
+
+
+def run_case(case, port):
+    """One measurement of a case: (seconds or None on failure, extra result fields)"""
+    if case == 'version':
+        return time_process([MAIN, '-v'])[0], {}
+    if case == 'import':
+        seconds, output = time_process(['-c', "import sys, FlowAPI; print('numpy' in sys.modules)"])
+        return seconds, {'numpy_loaded': output.strip() == 'True'}
+    if case == 'tcp':
+        return tcp_first_packet(FIRST_PACKET_ARGS[case], port), {}
+    return udp_first_packet(FIRST_PACKET_ARGS[case], port), {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Startup benchmark: interpreter start, imports and time to first packet')
+    parser.add_argument('--cases', type=str, default=','.join(CASES), help='Comma separated: ' + ', '.join(CASES))
+    parser.add_argument('-n', '--repeat', type=int, default=10, help='Measurements per case')
+    parser.add_argument('-p', '--port', type=int, default=15201, help='Loopback port')
+    parser.add_argument('-o', '--output', type=str, default='startup_bench.json', help='Results file')
+    parser.add_argument('--baseline', type=str, help='Compare against this results file, exit 1 on regression')
+    parser.add_argument('--save-baseline', type=str, help='Also write the results to this baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.20, help='Allowed relative regression')
+    parser.add_argument('--abs-tolerance-ms', type=float, default=10.0,
+                        help='Allowed absolute regression, startup times are noisy at this scale')
+    args = parser.parse_args()
+
+    results = {'host': host_info(), 'config': vars(args), 'results': []}
+    for case in parse_list(args.cases):
+        samples = []
+        extra = {}
+        for _ in range(args.repeat):
+            seconds, extra = run_case(case, args.port)
+            if seconds is not None:
+                samples.append(seconds * 1000)
+        result = {'case': case, 'samples': len(samples), 'failures': args.repeat - len(samples)}
+        result.update(extra)
+        stats = percentiles(samples, points=(50, 90))
+        if stats:
+            result.update({'median_ms': stats['p50'], 'p90_ms': stats['p90'],
+                           'min_ms': stats['min'], 'max_ms': stats['max']})
+        results['results'].append(result)
+        write_results(args.output, results)
+        if not samples:
+            print(f"[{case}] no successful measurements")
+            continue
+        note = f", numpy loaded: {extra['numpy_loaded']}" if 'numpy_loaded' in extra else ''
+        print(f"[{case}] median {result['median_ms']:.1f} ms, p90 {result['p90_ms']:.1f} ms, "
+              f"min {result['min_ms']:.1f} ms{note}")
+
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        write_results(args.save_baseline, results)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.baseline:
+        metrics = {name: ('lower', args.tolerance, args.abs_tolerance_ms) for name in ('median_ms', 'p90_ms')}
+        regressions = compare_to_baseline(results, load_results(args.baseline), KEY_FIELDS, metrics)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import json
+import random
+import struct
+
+# Header fields of the traffic generator's UDPPacket: (offset, struct format)
+HEADER_FIELDS = {
+    'seq_no': (0, '!I'),
+    'timestamp': (4, '!Q'),
+    'total_packets': (12, '!I'),
+}
+
+MAX_DATAGRAM = 65535
+
+
+def _tile(content, length):
+    """Repeat content until it is exactly length bytes long"""
+    if not content or length <= 0:
+        return b''
+    return (content * (length // len(content) + 1))[:length]
+
+
+def _to_bytes(rule, key='content'):
+    if 'hex' in rule:
+        return bytes.fromhex(rule['hex'])
+    value = rule.get(key, '')
+    return value.encode() if isinstance(value, str) else bytes(value)
+
+
+class PacketPipeline:
+    """A rule set compiled into a fixed sequence of slice operations.
+
+    Whatever the number of rules, a packet goes through the same steps in this
+    order: drop, delay, then (only for packets of at least min_length bytes)
+    truncate, pad and byte patches. Rules of one kind are folded together at
+    compile time (truncations keep the shortest, drop probabilities combine,
+    delays add up, overlapping patches merge), so adding rules does not add
+    per-packet work.
+    """
+    __slots__ = ('min_length', 'drop_probability', 'truncate_length', 'truncate_rate',
+                 'pad_rate', 'pad_length', 'pad_fill', 'patches', 'delay', 'jitter',
+                 'resize', 'mutate')
+
+    def __init__(self, rules=(), min_length=0):
+        self.min_length = min_length
+        self.drop_probability = 0.0
+        self.truncate_length = None
+        self.truncate_rate = None
+        self.pad_rate = 0.0
+        self.pad_length = None
+        self.pad_fill = b''
+        self.patches = []
+        self.delay = 0.0
+        self.jitter = 0.0
+        self._compile(rules)
+        self.resize = (self.truncate_length is not None or self.truncate_rate is not None
+                       or self.pad_rate > 0 or self.pad_length is not None)
+        self.mutate = self.resize or bool(self.patches)
+
+    @classmethod
+    def from_legacy(cls, reserve_rate, new_rate, new_content):
+        """Same result as UDPHandler.handle() behind the old `len(data) > 100` check"""
+        return cls([
+            {'type': 'truncate', 'rate': reserve_rate},
+            {'type': 'pad', 'rate': new_rate, 'content': new_content},
+        ], min_length=101)
+
+    def _compile(self, rules):
+        keep = 1.0
+        pad_content = b''
+        byte_map = {}
+        for rule in rules:
+            kind = rule.get('type')
+            if kind == 'drop':
+                keep *= 1.0 - float(rule['probability'])
+            elif kind == 'delay':
+                self.delay += float(rule.get('ms', 0)) / 1000
+                self.jitter += float(rule.get('jitter_ms', 0)) / 1000
+            elif kind == 'truncate':
+                if 'length' in rule:
+                    length = int(rule['length'])
+                    self.truncate_length = length if self.truncate_length is None else min(self.truncate_length, length)
+                if 'rate' in rule:
+                    rate = float(rule['rate'])
+                    self.truncate_rate = rate if self.truncate_rate is None else min(self.truncate_rate, rate)
+            elif kind == 'pad':
+                content = _to_bytes(rule) or b'\x00'
+                pad_content = content
+                if 'rate' in rule:
+                    self.pad_rate += float(rule['rate'])
+                if 'length' in rule:
+                    length = int(rule['length'])
+                    self.pad_length = length if self.pad_length is None else max(self.pad_length, length)
+            elif kind == 'patch':
+                self._add_patch(byte_map, int(rule['offset']), _to_bytes(rule))
+            elif kind == 'field':
+                if 'name' in rule:
+                    if rule['name'] not in HEADER_FIELDS:
+                        raise ValueError(f"Unsupported header field: {rule['name']}")
+                    offset, fmt = HEADER_FIELDS[rule['name']]
+                else:
+                    offset, fmt = int(rule['offset']), rule['format']
+                self._add_patch(byte_map, offset, struct.pack(fmt, int(rule['value'])))
+            else:
+                raise ValueError(f"Unsupported rule type: {kind}")
+
+        self.drop_probability = 1.0 - keep
+        self.pad_fill = _tile(pad_content, MAX_DATAGRAM) if pad_content else b''
+
+        # Merge the byte map into contiguous (start, end, bytes) runs
+        start = None
+        run = bytearray()
+        for offset in sorted(byte_map):
+            if start is not None and offset == start + len(run):
+                run.append(byte_map[offset])
+                continue
+            if start is not None:
+                self.patches.append((start, start + len(run), bytes(run)))
+            start, run = offset, bytearray([byte_map[offset]])
+        if start is not None:
+            self.patches.append((start, start + len(run), bytes(run)))
+
+    @staticmethod
+    def _add_patch(byte_map, offset, data):
+        # Later rules win where patches overlap
+        for i, b in enumerate(data):
+            byte_map[offset + i] = b
+
+    def apply(self, data):
+        """Return (new_data, delay_seconds); new_data is None when the packet is dropped"""
+        if self.drop_probability and random.random() < self.drop_probability:
+            return None, 0.0
+        delay = self.delay + random.random() * self.jitter if self.jitter else self.delay
+        if not self.mutate or len(data) < self.min_length:
+            return data, delay
+
+        if self.resize:
+            original_length = len(data)
+            length = original_length
+            if self.truncate_rate is not None:
+                length = min(length, int(original_length * self.truncate_rate))
+            if self.truncate_length is not None:
+                length = min(length, self.truncate_length)
+            pad = int(original_length * self.pad_rate)
+            if self.pad_length is not None:
+                pad = max(pad, self.pad_length - length)
+            buf = bytearray(data[:length])
+            if pad > 0:
+                buf += self.pad_fill[:pad]
+        else:
+            buf = bytearray(data)
+
+        length = len(buf)
+        for start, end, patch in self.patches:
+            if end <= length:
+                buf[start:end] = patch
+            elif start < length:
+                buf[start:length] = patch[:length - start]
+        return bytes(buf), delay
+
+
+def load_rules(path):
+    """Load and compile a rule file: either a list of rules or {"min_length": N, "rules": [...]}"""
+    with open(path, 'r') as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        return PacketPipeline(config)
+    return PacketPipeline(config.get('rules', []), min_length=config.get('min_length', 0))
@@ -0,0 +1,344 @@
+import errno
+import os
+import selectors
+import socket
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux can move bytes socket -> pipe -> socket without copying them into Python
+SPLICE_SUPPORTED = sys.platform == 'linux' and hasattr(os, 'splice')
+SPLICE_FLAGS = (getattr(os, 'SPLICE_F_MOVE', 0) | getattr(os, 'SPLICE_F_NONBLOCK', 0)) if SPLICE_SUPPORTED else 0
+# fcntl.F_SETPIPE_SZ only exists on Python 3.10+
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031) if fcntl else None
+
+CHUNK_SIZE = 256 * 1024
+ACCEPT_BATCH = 64
+LISTEN_BACKLOG = 4096
+
+
+class _Direction:
+    """One half of a relayed connection: bytes flowing from src to dst"""
+    __slots__ = ('src', 'dst', 'src_fd', 'dst_fd', 'pipe_r', 'pipe_w', 'buf', 'view',
+                 'offset', 'pending', 'eof', 'shut', 'bytes')
+
+    def __init__(self, src, dst, use_splice):
+        self.src = src
+        self.dst = dst
+        self.src_fd = src.fileno()
+        self.dst_fd = dst.fileno()
+        self.pipe_r = self.pipe_w = None
+        self.buf = self.view = None
+        if use_splice:
+            self.pipe_r, self.pipe_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+            if F_SETPIPE_SZ is not None:
+                try:
+                    fcntl.fcntl(self.pipe_w, F_SETPIPE_SZ, CHUNK_SIZE)
+                except OSError:
+                    pass
+        else:
+            self.buf = bytearray(CHUNK_SIZE)
+            self.view = memoryview(self.buf)
+        self.offset = 0
+        self.pending = 0    # bytes read from src but not yet written to dst
+        self.eof = False
+        self.shut = False
+        self.bytes = 0
+
+    @property
+    def done(self):
+        return self.shut
+
+    def pump(self):
+        """Move as much as possible without blocking, raises OSError on a broken peer"""
+        if self.pipe_w is not None:
+            if not self.pending and not self.eof:
+                try:
+                    n = os.splice(self.src_fd, self.pipe_w, CHUNK_SIZE, flags=SPLICE_FLAGS)
+                    if n == 0:
+                        self.eof = True
+                    self.pending += n
+                except BlockingIOError:
+                    pass
+            if self.pending:
+                try:
+                    n = os.splice(self.pipe_r, self.dst_fd, self.pending, flags=SPLICE_FLAGS)
+                    self.pending -= n
+                    self.bytes += n
+                except BlockingIOError:
+                    pass
+        else:
+            if not self.pending and not self.eof:
+                try:
+                    n = self.src.recv_into(self.buf)
+                    if n == 0:
+                        self.eof = True
+                    self.offset = 0
+                    self.pending = n
+                except BlockingIOError:
+                    pass
+            if self.pending:
+                try:
+                    n = self.dst.send(self.view[self.offset:self.offset + self.pending])
+                    self.offset += n
+                    self.pending -= n
+                    self.bytes += n
+                except BlockingIOError:
+                    pass
+        if self.eof and not self.pending and not self.shut:
+            # Propagate the half-close so request/response protocols keep working
+            self.shut = True
+            try:
+                self.dst.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    def close(self):
+        for fd in (self.pipe_r, self.pipe_w):
+            if fd is not None:
+                os.close(fd)
+        self.pipe_r = self.pipe_w = None
+
+
+class _Connection:
+    """A relayed client connection and its byte counters"""
+
+    def __init__(self, conn_id, route, client, client_addr):
+        self.conn_id = conn_id
+        self.route = route
+        self.client = client
+        self.client_addr = client_addr
+        self.upstream = None
+        self.up = None      # client -> target
+        self.down = None    # target -> client
+        self.registered = {}
+        self.open_time = time.time()
+        self.close_time = None
+
+    def stats(self):
+        end_time = self.close_time or time.time()
+        elapsed = max(end_time - self.open_time, 1e-9)
+        bytes_up = self.up.bytes if self.up else 0
+        bytes_down = self.down.bytes if self.down else 0
+        return {
+            'id': self.conn_id,
+            'route': self.route,
+            'client': f"{self.client_addr[0]}:{self.client_addr[1]}",
+            'seconds': elapsed,
+            'bytes_up': bytes_up,
+            'bytes_down': bytes_down,
+            'bps_up': bytes_up * 8 / elapsed,
+            'bps_down': bytes_down * 8 / elapsed,
+        }
+
+
+class TCPForwarder:
+    """In-process TCP 4-to-6 / 6-to-4 relay driven by a single selector loop.
+
+    Drop-in replacement for SocatTCPForwarder: it listens on the same ports but
+    never forks, and keeps per-connection byte and throughput counters.
+    """
+
+    def __init__(self, ipv4_address, ipv4_port, ipv6_address, ipv6_port, use_splice=None):
+        # Debug mode control
+        self.DEBUG = False
+
+        self.ipv4_address = ipv4_address
+        self.ipv4_port = ipv4_port
+        self.ipv6_address = ipv6_address
+        self.ipv6_port = ipv6_port
+        self.use_splice = SPLICE_SUPPORTED if use_splice is None else (use_splice and SPLICE_SUPPORTED)
+
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+        self.connections = {}
+        self.next_conn_id = 1
+
+        # Counters of connections that already finished
+        self.accepted = 0
+        self.closed = 0
+        self.connect_failures = 0
+        self.closed_bytes_up = 0
+        self.closed_bytes_down = 0
+
+        # TCP4-LISTEN -> TCP6 and TCP6-LISTEN -> TCP4, like the two socat processes
+        self.listeners = []
+        self._listen(socket.AF_INET, ('0.0.0.0', self.ipv4_port),
+                     socket.AF_INET6, (self.ipv6_address, self.ipv6_port), '426')
+        self._listen(socket.AF_INET6, ('::', self.ipv6_port),
+                     socket.AF_INET, (self.ipv4_address, self.ipv4_port), '624')
+
+    def _listen(self, family, bind_addr, target_family, target_addr, route):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if family == socket.AF_INET6:
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+        sock.bind(bind_addr)
+        sock.listen(LISTEN_BACKLOG)
+        sock.setblocking(False)
+        self.listeners.append(sock)
+        self.selector.register(sock, selectors.EVENT_READ, (self._accept, (target_family, target_addr, route)))
+
+    def start(self):
+        self.running = True
+        try:
+            while self.running:
+                for key, mask in self.selector.select(timeout=1.0):
+                    callback, arg = key.data
+                    callback(key.fileobj, mask, arg)
+        except KeyboardInterrupt:
+            if self.DEBUG:
+                print("TCP forwarder closed")
+        finally:
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        for conn in list(self.connections.values()):
+            self._close_connection(conn)
+        for sock in self.listeners:
+            try:
+                self.selector.unregister(sock)
+            except (KeyError, ValueError):
+                pass
+            sock.close()
+        self.listeners = []
+
+    def _accept(self, listener, mask, target):
+        target_family, target_addr, route = target
+        # Drain the backlog in one wakeup so bursts of connects do not queue behind data
+        for _ in range(ACCEPT_BATCH):
+            try:
+                client, client_addr = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if self.DEBUG:
+                    print(f"Accept error: {e}")
+                return
+            self.accepted += 1
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            conn = _Connection(self.next_conn_id, route, client, client_addr)
+            self.next_conn_id += 1
+            self.connections[conn.conn_id] = conn
+
+            upstream = socket.socket(target_family, socket.SOCK_STREAM)
+            upstream.setblocking(False)
+            upstream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.upstream = upstream
+            err = upstream.connect_ex(target_addr)
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                self._connect_failed(conn, os.strerror(err))
+                continue
+            self.selector.register(upstream, selectors.EVENT_WRITE, (self._connected, conn))
+            conn.registered[upstream] = selectors.EVENT_WRITE
+
+    def _connected(self, upstream, mask, conn):
+        if conn.close_time is not None:
+            return
+        err = upstream.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if err:
+            self._connect_failed(conn, os.strerror(err))
+            return
+        try:
+            conn.up = _Direction(conn.client, upstream, self.use_splice)
+            conn.down = _Direction(upstream, conn.client, self.use_splice)
+        except OSError as e:
+            # Most likely out of file descriptors for the pipes
+            self._connect_failed(conn, str(e))
+            return
+        self.selector.modify(upstream, selectors.EVENT_READ, (self._relay, conn))
+        conn.registered[upstream] = selectors.EVENT_READ
+        self.selector.register(conn.client, selectors.EVENT_READ, (self._relay, conn))
+        conn.registered[conn.client] = selectors.EVENT_READ
+        if self.DEBUG:
+            print(f"TCP {conn.route} connection {conn.conn_id} from {conn.client_addr[0]}:{conn.client_addr[1]}")
+
+    def _connect_failed(self, conn, reason):
+        self.connect_failures += 1
+        if self.DEBUG:
+            print(f"TCP {conn.route} connect error ({conn.conn_id}): {reason}")
+        self._close_connection(conn)
+
+    def _relay(self, sock, mask, conn):
+        # One select() batch can carry events for both sockets; the first may have closed the connection
+        if conn.close_time is not None:
+            return
+        try:
+            conn.up.pump()
+            conn.down.pump()
+        except Exception as e:
+            # Any failure stays confined to this connection so the relay loop keeps serving the others
+            if self.DEBUG:
+                print(f"TCP relay error ({conn.conn_id}): {e}")
+            self._close_connection(conn)
+            return
+        if conn.up.done and conn.down.done:
+            self._close_connection(conn)
+            return
+        self._update_interest(conn, conn.client, conn.up, conn.down)
+        self._update_interest(conn, conn.upstream, conn.down, conn.up)
+
+    def _update_interest(self, conn, sock, outgoing, incoming):
+        """sock is the source of outgoing and the destination of incoming"""
+        events = 0
+        if not outgoing.eof and not outgoing.pending:
+            events |= selectors.EVENT_READ
+        if incoming.pending:
+            events |= selectors.EVENT_WRITE
+        current = conn.registered.get(sock, 0)
+        if events == current:
+            return
+        if not events:
+            self.selector.unregister(sock)
+        elif not current:
+            self.selector.register(sock, events, (self._relay, conn))
+        else:
+            self.selector.modify(sock, events, (self._relay, conn))
+        conn.registered[sock] = events
+
+    def _close_connection(self, conn):
+        if conn.close_time is not None:
+            return
+        conn.close_time = time.time()
+        for sock in (conn.client, conn.upstream):
+            if sock is None:
+                continue
+            if conn.registered.get(sock):
+                self.selector.unregister(sock)
+            sock.close()
+        conn.registered.clear()
+        for direction in (conn.up, conn.down):
+            if direction is not None:
+                direction.close()
+        self.connections.pop(conn.conn_id, None)
+        self.closed += 1
+        stats = conn.stats()
+        self.closed_bytes_up += stats['bytes_up']
+        self.closed_bytes_down += stats['bytes_down']
+        if self.DEBUG:
+            print(f"TCP {conn.route} connection {conn.conn_id} closed: "
+                  f"up={stats['bytes_up']}B ({stats['bps_up']/1e6:.2f} Mbps) "
+                  f"down={stats['bytes_down']}B ({stats['bps_down']/1e6:.2f} Mbps)")
+
+    def get_stats(self):
+        """Snapshot of connection counters, safe to call from another thread"""
+        active = [conn.stats() for conn in list(self.connections.values())]
+        return {
+            'splice': self.use_splice,
+            'accepted': self.accepted,
+            'active': len(active),
+            'closed': self.closed,
+            'connect_failures': self.connect_failures,
+            'bytes_up': self.closed_bytes_up + sum(c['bytes_up'] for c in active),
+            'bytes_down': self.closed_bytes_down + sum(c['bytes_down'] for c in active),
+            'connections': active,
+        }
@@ -0,0 +1,146 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Index of each counter in a direction's counter list
+PACKETS, BYTES, DROPS = 0, 1, 2
+
+
+def new_counters():
+    """Per-direction counters, plain lists so the hot path only does `c[i] += n`"""
+    return [0, 0, 0]
+
+
+class TelemetryReporter:
+    """Samples forwarder counters periodically and publishes them as JSON.
+
+    The forwarding threads only increment integers; rates, queue depths and
+    formatting are done here, once per interval, never per packet.
+    """
+
+    def __init__(self, interval=1.0, output=None, http_port=None, http_address='127.0.0.1'):
+        self.interval = interval
+        self.output = output
+        self.http_port = http_port
+        self.http_address = http_address
+        self.udp_forwarders = {}
+        self.tcp_forwarders = {}
+        self.previous = {}
+        self.last_time = None
+        self.latest = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.http_server = None
+
+    def add_udp(self, name, forwarder):
+        self.udp_forwarders[name] = forwarder
+
+    def add_tcp(self, name, forwarder):
+        self.tcp_forwarders[name] = forwarder
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        if self.http_port is not None:
+            self.http_server = ThreadingHTTPServer((self.http_address, self.http_port), self._handler_class())
+            self.http_server.daemon_threads = True
+            threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+
+    def _run(self):
+        self.last_time = time.time()
+        while self.running:
+            time.sleep(self.interval)
+            snapshot = self.sample()
+            if self.output is not None:
+                self.output.write(json.dumps(snapshot) + '\n')
+                self.output.flush()
+
+    def sample(self):
+        now = time.time()
+        elapsed = max(now - self.last_time, 1e-9) if self.last_time else self.interval
+        self.last_time = now
+        snapshot = {'time': now, 'interval': elapsed, 'udp': {}, 'tcp': {}}
+
+        for name, forwarder in self.udp_forwarders.items():
+            sessions = {}
+            totals = {}
+            for client_id, session in list(forwarder.sessions.items()):
+                entry = {'active': session['active'], 'queue_depth': session['queue'].qsize()}
+                for direction, counters in session['stats'].items():
+                    packets, nbytes, drops = counters
+                    key = (name, client_id, direction)
+                    last_packets, last_bytes, last_drops = self.previous.get(key, (0, 0, 0))
+                    self.previous[key] = (packets, nbytes, drops)
+                    entry[direction] = {
+                        'packets': packets,
+                        'bytes': nbytes,
+                        'drops': drops,
+                        'pps': (packets - last_packets) / elapsed,
+                        'bps': (nbytes - last_bytes) * 8 / elapsed,
+                        'drops_per_second': (drops - last_drops) / elapsed,
+                    }
+                    total = totals.setdefault(direction, {'packets': 0, 'bytes': 0, 'drops': 0, 'pps': 0, 'bps': 0})
+                    for field in total:
+                        total[field] += entry[direction][field]
+                sessions[client_id] = entry
+            packets, nbytes, drops = forwarder.ingress
+            key = (name, 'ingress')
+            last_packets, last_bytes = self.previous.get(key, (0, 0))
+            self.previous[key] = (packets, nbytes)
+            ingress = {
+                'packets': packets,
+                'bytes': nbytes,
+                'drops': drops,
+                'pps': (packets - last_packets) / elapsed,
+                'bps': (nbytes - last_bytes) * 8 / elapsed,
+            }
+            snapshot['udp'][name] = {'ingress': ingress, 'sessions': sessions, 'total': totals}
+
+        for name, forwarder in self.tcp_forwarders.items():
+            stats = forwarder.get_stats()
+            key = (name, 'tcp')
+            last_up, last_down = self.previous.get(key, (0, 0))
+            self.previous[key] = (stats['bytes_up'], stats['bytes_down'])
+            stats['bps_up'] = (stats['bytes_up'] - last_up) * 8 / elapsed
+            stats['bps_down'] = (stats['bytes_down'] - last_down) * 8 / elapsed
+            snapshot['tcp'][name] = stats
+
+        with self.lock:
+            self.latest = snapshot
+        return snapshot
+
+    def _handler_class(self):
+        reporter = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                with reporter.lock:
+                    body = json.dumps(reporter.latest).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+
+def open_output(path):
+    """'-' or None writes JSON lines to stdout"""
+    if path in (None, '-'):
+        return sys.stdout
+    return open(path, 'a')
@@ -3,6 +3,12 @@ import threading
 import queue
 import subprocess
 import argparse
+import heapq
+import time
+
+from tcp_forwarder import TCPForwarder
+from packet_rules import PacketPipeline, load_rules
+from telemetry import TelemetryReporter, new_counters, open_output, PACKETS, BYTES, DROPS
 
 class UDPHandler:
     def __init__(self, reserve_rate=0.5, new_rate=0.2, new_content='-uestc-'):
@@ -31,9 +37,64 @@ class UDPHandler:
             print(f"Handling data: original length={original_length}, truncated length={cut_length}, custom length={custom_length}")
         return new_data
         
+class DelayLine:
+    """Sends packets held back by delay rules once they are due"""
+    def __init__(self):
+        self.heap = []
+        self.counter = 0
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def schedule(self, delay, sock, data, addr):
+        with self.cond:
+            self.counter += 1
+            heapq.heappush(self.heap, (time.monotonic() + delay, self.counter, sock, data, addr))
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                due = self.heap[0][0]
+                now = time.monotonic()
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+                _, _, sock, data, addr = heapq.heappop(self.heap)
+            try:
+                sock.sendto(data, addr)
+            except OSError:
+                pass
+
 class UDPForwarder:
-    def __init__(self, reserve_rate=0.5, new_rate=0.2, new_content='-uestc-'):
+    def __init__(self, reserve_rate=0.5, new_rate=0.2, new_content='-uestc-', rules_file=None, rules=None):
         self.udp_handler = UDPHandler(reserve_rate, new_rate, new_content)
+        # Packet mutation rules, compiled once; without rules keep the legacy truncate-and-fill
+        if rules_file:
+            self.pipeline = load_rules(rules_file)
+        elif rules is not None:
+            self.pipeline = PacketPipeline(rules)
+        else:
+            self.pipeline = PacketPipeline.from_legacy(reserve_rate, new_rate, new_content)
+        self.delay_line = DelayLine() if self.pipeline.delay or self.pipeline.jitter else None
+        # Datagrams read from the listening socket, before they are queued to a session
+        self.ingress = new_counters()
+
+    def _send(self, sock, data, addr, counters):
+        """Run data through the rule pipeline and send it, returns False if it was dropped"""
+        new_data, delay = self.pipeline.apply(data)
+        if new_data is None:
+            counters[DROPS] += 1
+            return False
+        if delay:
+            self.delay_line.schedule(delay, sock, new_data, addr)
+        else:
+            sock.sendto(new_data, addr)
+        counters[PACKETS] += 1
+        counters[BYTES] += len(new_data)
+        return True
 
 class UDPForwarder_426(UDPForwarder):
     def __init__(self, forward_config, handler_config):
@@ -41,7 +102,7 @@ class UDPForwarder_426(UDPForwarder):
         listen_port, ipv6_address, ipv6_port = forward_config['listen_port'], forward_config['target_address'], forward_config['target_port']
         reserve_rate, new_rate, new_content = handler_config['reserve_rate'], handler_config['new_rate'], handler_config['new_content']
 
-        super().__init__(reserve_rate, new_rate, new_content)
+        super().__init__(reserve_rate, new_rate, new_content, handler_config.get('rules_file'), handler_config.get('rules'))
 
         # Debug mode control
         self.DEBUG = False
@@ -65,6 +126,8 @@ class UDPForwarder_426(UDPForwarder):
             # Main loop - accept new connections and create sessions for each client
             while True:
                 data, addr = self.sock_ipv4.recvfrom(65535)
+                self.ingress[PACKETS] += 1
+                self.ingress[BYTES] += len(data)
                 client_ip, client_port = addr
                 
                 client_id = f"{client_ip}:{client_port}"
@@ -92,9 +155,13 @@ class UDPForwarder_426(UDPForwarder):
         sock_ipv6.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         
         try:
-            sock_ipv6.bind(('::', client_port))
+            try:
+                sock_ipv6.bind(('::', client_port))
+            except OSError:
+                # Mirrored port already taken (e.g. client on the same host), use any free port
+                sock_ipv6.bind(('::', 0))
             if self.DEBUG:
-                print(f"IPv6 socket bound to port: {client_port}")
+                print(f"IPv6 socket bound to port: {sock_ipv6.getsockname()[1]}")
         except Exception as e:
             if self.DEBUG:
                 print(f"IPv6 socket bind error: {e}")
@@ -105,6 +172,7 @@ class UDPForwarder_426(UDPForwarder):
             'client_port': client_port,
             'ipv6_socket': sock_ipv6,
             'queue': data_queue,
+            'stats': {'4to6': new_counters(), '6to4': new_counters()},
             'active': True
         }
         
@@ -134,22 +202,20 @@ class UDPForwarder_426(UDPForwarder):
         client_port = session['client_port']
         
         ipv6_dest = (self.ipv6_address, self.ipv6_port)
+        counters = session['stats']['4to6']
         
         try:
             while session['active']:
                 try:
                     data = session['queue'].get(timeout=1.0)
-
-                    if len(data) > 100:
-                        new_data = self.udp_handler.handle(data)
-                    else:
-                        new_data = data
                     
                     try:
-                        sock_ipv6.sendto(new_data, ipv6_dest)
+                        if not self._send(sock_ipv6, data, ipv6_dest, counters):
+                            continue
                         if self.DEBUG:
                             print(f"IPv4→IPv6: {client_ip}:{client_port} → [{self.ipv6_address}]:{self.ipv6_port}")
                     except Exception as e:
+                        counters[DROPS] += 1
                         if self.DEBUG:
                             print(f"IPv6 send error: {e}")
                     
@@ -166,6 +232,7 @@ class UDPForwarder_426(UDPForwarder):
         sock_ipv6 = session['ipv6_socket']
         client_ip = session['client_ip']
         client_port = session['client_port']
+        counters = session['stats']['6to4']
 
         try:
             sock_ipv6.settimeout(1.0)
@@ -175,6 +242,8 @@ class UDPForwarder_426(UDPForwarder):
                     data, addr = sock_ipv6.recvfrom(65535)
                     
                     self.sock_ipv4.sendto(data, (client_ip, client_port))
+                    counters[PACKETS] += 1
+                    counters[BYTES] += len(data)
                     
                     if self.DEBUG:
                         src_addr = f"[{addr[0]}]:{addr[1]}" if len(addr) >= 2 else "Unknown"
@@ -183,6 +252,7 @@ class UDPForwarder_426(UDPForwarder):
                 except socket.timeout:
                     continue
                 except Exception as e:
+                    counters[DROPS] += 1
                     if self.DEBUG:
                         print(f"Error handling IPv6 packet: {e}")
         
@@ -197,7 +267,7 @@ class UDPForwarder_624(UDPForwarder):
         listen_port, ipv4_address, ipv4_port = forward_config['listen_port'], forward_config['target_address'], forward_config['target_port']
         reserve_rate, new_rate, new_content = handler_config['reserve_rate'], handler_config['new_rate'], handler_config['new_content']
 
-        super().__init__(reserve_rate, new_rate, new_content)
+        super().__init__(reserve_rate, new_rate, new_content, handler_config.get('rules_file'), handler_config.get('rules'))
 
         # Debug mode control
         self.DEBUG = False
@@ -223,6 +293,8 @@ class UDPForwarder_624(UDPForwarder):
             # Main loop - accept new connections and create sessions for each client
             while True:
                 data, addr = self.sock_ipv6.recvfrom(65535)
+                self.ingress[PACKETS] += 1
+                self.ingress[BYTES] += len(data)
                 client_id = f"{addr[0]}%{addr[1]}"  # Use % to separate IPv6 address and port
                 
                 if client_id not in self.sessions:
@@ -230,6 +302,7 @@ class UDPForwarder_624(UDPForwarder):
                         print(f"New client connection: {client_id}")
                     
                     if self._create_session(addr, client_id) is None:
+                        self.ingress[DROPS] += 1
                         continue
                 
                 self.sessions[client_id]['queue'].put(data)
@@ -246,7 +319,11 @@ class UDPForwarder_624(UDPForwarder):
         sock_ipv4 = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         
         try:
-            sock_ipv4.bind(('0.0.0.0', client_addr[1]))
+            try:
+                sock_ipv4.bind(('0.0.0.0', client_addr[1]))
+            except OSError:
+                # Mirrored port already taken (e.g. client on the same host), use any free port
+                sock_ipv4.bind(('0.0.0.0', 0))
             if self.DEBUG:
                 bound_port = sock_ipv4.getsockname()[1]
                 print(f"IPv4 socket bound to port: {bound_port}")
@@ -259,6 +336,7 @@ class UDPForwarder_624(UDPForwarder):
             'client_addr': client_addr,
             'ipv4_socket': sock_ipv4,
             'queue': data_queue,
+            'stats': {'6to4': new_counters(), '4to6': new_counters()},
             'active': True
         }
         
@@ -285,23 +363,21 @@ class UDPForwarder_624(UDPForwarder):
         """Handle data flow from IPv6 to IPv4"""
         sock_ipv4 = session['ipv4_socket']
         dest_address = (self.ipv4_address, self.ipv4_port)
+        counters = session['stats']['6to4']
         
         try:
             while session['active']:
                 try:
                     data = session['queue'].get(timeout=1.0)
-
-                    if len(data) > 100:
-                        new_data = self.udp_handler.handle(data)
-                    else:
-                        new_data = data
                     
                     try:
-                        sock_ipv4.sendto(new_data, dest_address)
+                        if not self._send(sock_ipv4, data, dest_address, counters):
+                            continue
                         if self.DEBUG:
                             client_addr = session['client_addr']
                             print(f"IPv6→IPv4: [{client_addr[0]}]:{client_addr[1]} → {dest_address[0]}:{dest_address[1]}")
                     except Exception as e:
+                        counters[DROPS] += 1
                         if self.DEBUG:
                             print(f"IPv4 send error: {e}")
                         session['active'] = False
@@ -318,6 +394,7 @@ class UDPForwarder_624(UDPForwarder):
         """Handle data flow from IPv4 to IPv6"""
         sock_ipv4 = session['ipv4_socket']
         client_addr = session['client_addr']
+        counters = session['stats']['4to6']
 
         try:
             sock_ipv4.settimeout(1.0)
@@ -327,6 +404,8 @@ class UDPForwarder_624(UDPForwarder):
                     data, addr = sock_ipv4.recvfrom(65535)
                     
                     self.sock_ipv6.sendto(data, client_addr)
+                    counters[PACKETS] += 1
+                    counters[BYTES] += len(data)
                     
                     if self.DEBUG:
                         print(f"IPv4→IPv6: {addr[0]}:{addr[1]} → [{client_addr[0]}]:{client_addr[1]}")
@@ -334,6 +413,7 @@ class UDPForwarder_624(UDPForwarder):
                 except socket.timeout:
                     continue
                 except Exception as e:
+                    counters[DROPS] += 1
                     if self.DEBUG:
                         print(f"Error handling IPv4 packet: {e}")
                     session['active'] = False
@@ -390,6 +470,14 @@ def parse_arguments():
     parser.add_argument('--reserve_rate', type=float, default=0.3, help='Reserve rate')
     parser.add_argument('--new_rate', type=float, default=0.2, help='New content rate')
     parser.add_argument('--new_content', type=str, default='-uestc-', help='New content')
+    parser.add_argument('--rules', type=str, help='JSON packet mutation rule file (replaces the reserve/new rate handling)')
+
+    parser.add_argument('--tcp_mode', type=str, choices=['native', 'socat', 'off'], default='native',
+                        help='TCP forwarding backend: in-process relay, socat subprocesses or disabled')
+
+    parser.add_argument('--stats_interval', type=float, help='Print forwarder counters as JSON lines every N seconds')
+    parser.add_argument('--stats_file', type=str, default='-', help='Where to write the JSON lines (default: stdout)')
+    parser.add_argument('--metrics_port', type=int, help='Serve the latest counters on http://127.0.0.1:PORT/metrics')
 
     parser.add_argument('-v', '--version', action='store_true', help='Print version')
     
@@ -414,6 +502,9 @@ if __name__ == '__main__':
         print(f"IPv4 Address: {ipv4_address}, IPv4 Port: {ipv4_port}")
         print(f"IPv6 Address: {ipv6_address}, IPv6 Port: {ipv6_port}")
         print(f"Reserve Rate: {reserve_rate}, New Rate: {new_rate}, New Content: {new_content}")
+        print(f"TCP Mode: {args.tcp_mode}")
+        if args.rules:
+            print(f"Rules: {args.rules}")
 
         forward_config_624 = {
             'listen_port': ipv6_port,
@@ -428,15 +519,32 @@ if __name__ == '__main__':
         handler_config = {
             'reserve_rate': reserve_rate,
             'new_rate': new_rate,
-            'new_content': new_content
+            'new_content': new_content,
+            'rules_file': args.rules
         }
 
-        socat_forwarder = SocatTCPForwarder(ipv4_address=ipv4_address, ipv4_port=ipv4_port, ipv6_address=ipv6_address, ipv6_port=ipv6_port)
-        socat_forwarder.start()
+        reporter = None
+        if args.stats_interval or args.metrics_port is not None:
+            output = open_output(args.stats_file) if args.stats_interval else None
+            reporter = TelemetryReporter(interval=args.stats_interval or 1.0, output=output, http_port=args.metrics_port)
+
+        if args.tcp_mode == 'socat':
+            socat_forwarder = SocatTCPForwarder(ipv4_address=ipv4_address, ipv4_port=ipv4_port, ipv6_address=ipv6_address, ipv6_port=ipv6_port)
+            socat_forwarder.start()
+        elif args.tcp_mode == 'native':
+            tcp_forwarder = TCPForwarder(ipv4_address=ipv4_address, ipv4_port=ipv4_port, ipv6_address=ipv6_address, ipv6_port=ipv6_port)
+            threading.Thread(target=tcp_forwarder.start, daemon=True).start()
+            if reporter:
+                reporter.add_tcp('tcp', tcp_forwarder)
 
         forwarder_624 = UDPForwarder_624(forward_config=forward_config_624, handler_config=handler_config)
         forwarder_426 = UDPForwarder_426(forward_config=forward_config_426, handler_config=handler_config)
 
+        if reporter:
+            reporter.add_udp('624', forwarder_624)
+            reporter.add_udp('426', forwarder_426)
+            reporter.start()
+
         threading_624 = threading.Thread(target=forwarder_624.start, daemon=True)
         threading_426 = threading.Thread(target=forwarder_426.start, daemon=True)
 
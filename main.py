@@ -4,6 +4,10 @@ import ipaddress
 
 from TCPFlowGenerator import TCPFlowGenerator
 from UDPFlowGenerator import UDPFlowGenerator
+from MultiFlow import MultiFlowGenerator
+from ConnectionRate import ConnectionRateGenerator
+from FlowTable import FlowTableGenerator, SPREADS
+from Affinity import AffinityPlan
 
 def is_ipv6(address):
     try:
@@ -34,9 +38,9 @@ def main():
     parser.add_argument('-l', '--packet-size', type=int, help='Packet size in bytes')
     parser.add_argument('-b', '--bandwidth', type=str, help='Bandwidth limit in bps')
     parser.add_argument('-i', '--interval', type=float, default=1.0, help='Statistics interval in seconds')
-    parser.add_argument('-dpps', '--distributed_packets_per_second', type=str, help='Distributed packets per second')
-    parser.add_argument('-dl', '--distributed_packet-size', type=str, help='Distributed packet size in bytes')
-    parser.add_argument('-db', '--distributed_bandwidth', type=str, help='Distributed bandwidth limit in bps')
+    parser.add_argument('-dpps', '--distributed_packets_per_second', type=str, help='Packet interval distribution: exp, pareto[:a], lognormal[:sigma], weibull[:k], uniform[:w], imix[:...], empirical:FILE')
+    parser.add_argument('-dl', '--distributed_packet-size', type=str, help='Packet size distribution, same choices as -dpps')
+    parser.add_argument('-db', '--distributed_bandwidth', type=str, help='Bandwidth distribution, same choices as -dpps')
     parser.add_argument('-bri','--bandwidth_reset_interval', type=float, help='Bandwidth reset interval in seconds')
     parser.add_argument('-J', '--json', action='store_true', help='Print statistics as JSON file')
     parser.add_argument('-1', '--one_test', action='store_true', help='Run only one test')
@@ -44,6 +48,68 @@ def main():
     parser.add_argument('-v', '--version', action='store_true', help='print version')
     parser.add_argument('-6', '--ipv6', action='store_true', help='Use IPv6 instead of IPv4')
     parser.add_argument('-ppkg','--printpkg', action='store_true', help='Print package')
+    parser.add_argument('--profile', action='store_true', help='Record per-phase timing of the send/receive loop')
+    parser.add_argument('--profile-dump', type=str, help='Write a profiler dump to this file (implies --profile)')
+    parser.add_argument('--profile-dump-mode', type=str, choices=['cprofile', 'sample'], default='cprofile',
+                        help='cProfile stats file or sampled stacks in folded format')
+    parser.add_argument('--trace', type=str,
+                        help='Replay packet sizes and gaps from a pcap/CSV trace or a schedule compiled by Trace.py')
+    parser.add_argument('--trace-time-scale', type=float, default=1.0, help='Stretch the trace gaps by this factor')
+    parser.add_argument('--trace-rate', type=float, default=1.0, help='Multiply the trace packet rate by this factor')
+    parser.add_argument('--burst', type=str,
+                        help='Burst model: onoff:on=SEC,off=SEC,peak=BPS[,dist=exp], '
+                             'train:packets=N,interval=SEC[,peak=BPS] or mmpp:rates=BPS/BPS,sojourn=SEC/SEC')
+    parser.add_argument('--burst-seed', type=int, help='Random seed for the burst model')
+    parser.add_argument('-R', '--reverse', action='store_true', help='Client: the server sends and the client receives')
+    parser.add_argument('--bidir', action='store_true',
+                        help='Client: send and receive at the same time on separate sockets')
+    parser.add_argument('--sink', action='store_true',
+                        help='TCP receiver: discard received data in the kernel with MSG_TRUNC (Linux)')
+    parser.add_argument('--rcvbuf', type=str,
+                        help='Receiver: SO_RCVBUF in bytes, e.g. 8M (TCP: disables autotuning)')
+    parser.add_argument('--rcvlowat', type=str,
+                        help='TCP receiver: SO_RCVLOWAT in bytes, wake up only for this much data')
+    parser.add_argument('--rxq-ovfl', action='store_true',
+                        help='UDP receiver: count datagrams dropped by the local receive buffer (SO_RXQ_OVFL, Linux)')
+    parser.add_argument('--tcp-info-interval', type=float,
+                        help='TCP client: sample the full TCP_INFO every SEC seconds, e.g. 0.01 (Linux)')
+    parser.add_argument('--tcp-info-dump', type=str, help='TCP client: save all TCP_INFO samples to this .npz file')
+    parser.add_argument('--zerocopy', action='store_true',
+                        help='Client: send with MSG_ZEROCOPY from a shared payload buffer (Linux)')
+    parser.add_argument('--flows', type=int, default=1,
+                        help='Client: emulate this many flows with the -b/-l/-dpps/-dl of one flow each')
+    parser.add_argument('--flow-file', type=str, help='Client: JSON list of flow groups (see MultiFlow.py)')
+    parser.add_argument('--flow-stats', type=str, help='Client: write per-flow statistics to this CSV file')
+    parser.add_argument('--cps', type=float, nargs='?', const=0,
+                        help='TCP client: open and close connections at this rate per second (no value: as fast as possible)')
+    parser.add_argument('--cps-bytes', type=int, default=0,
+                        help='Bytes to send on each connection before closing it')
+    parser.add_argument('--cps-concurrency', type=int, default=1000, help='Maximum connections in progress')
+    parser.add_argument('--cps-workers', type=int, default=1, help='Run this many event loop processes')
+    parser.add_argument('--cps-reset', action='store_true',
+                        help='Close connections with RST so the client keeps no TIME_WAIT sockets')
+    parser.add_argument('--src-ports', type=str,
+                        help='UDP client: spread packets over one socket per source port in this range, e.g. 20000-29999')
+    parser.add_argument('--destinations', type=str,
+                        help='Comma separated host[:port] list (or @file) to send to from every source port')
+    parser.add_argument('--spread', type=str, choices=SPREADS, default='rr',
+                        help='Pick the flow of each packet round-robin or at random')
+    parser.add_argument('--raw', type=str, metavar='IFACE',
+                        help='UDP client: send prebuilt frames through an AF_PACKET TX ring on this interface (Linux, root)')
+    parser.add_argument('--raw-dst-mac', type=str,
+                        help='Destination MAC for --raw (default: the ARP entry of the server or its gateway)')
+    parser.add_argument('--cpu-send', type=str, help='Pin the send/receive loop to these CPUs, e.g. 2 or 2-3 (Linux)')
+    parser.add_argument('--cpu-stats', type=str, help='Pin the statistics and clock offset threads to these CPUs')
+    parser.add_argument('--cpu-workers', type=str, help='Pin connection rate worker processes to these CPUs, one each')
+    parser.add_argument('--numa-node', type=int, help='Use the CPUs of this NUMA node for threads without a CPU list')
+    parser.add_argument('--irq-iface', type=str, help='Keep the CPUs handling the interrupts of this interface free')
+    parser.add_argument('--sched-fifo', type=int, metavar='PRIO',
+                        help='Run the send/receive loop with SCHED_FIFO at this priority (1-99) if permitted')
+    parser.add_argument('--nice', type=int, help='Nice level of the send/receive loop if permitted')
+    parser.add_argument('--rate-control', type=str,
+                        help='UDP client: adjust the rate from server feedback (aimd, delay or module.Class)')
+    parser.add_argument('--feedback-interval', type=float, default=0.1, help='Seconds between server feedback reports')
+    parser.add_argument('--max-bandwidth', type=str, help='Upper bound for the rate controller in bps')
     
     args = parser.parse_args()
     if args.version:
@@ -61,6 +127,123 @@ def main():
     if args.server and args.client:
         print("Error: Cannot specify both server and client")
         sys.exit(1)
+    if args.rate_control:
+        if not args.udp:
+            print("Error: Rate control is only supported in UDP mode")
+            sys.exit(1)
+        if args.distributed_bandwidth:
+            print("Error: Cannot combine rate control with distributed bandwidth")
+            sys.exit(1)
+    if args.trace:
+        if args.distributed_packets_per_second or args.distributed_packet_size or args.distributed_bandwidth \
+                or args.rate_control:
+            print("Error: Cannot combine trace replay with distributions or rate control")
+            sys.exit(1)
+        if args.trace_time_scale <= 0 or args.trace_rate <= 0:
+            print("Error: Trace time scale and rate must be positive")
+            sys.exit(1)
+    if args.burst:
+        if args.distributed_packets_per_second or args.distributed_bandwidth or args.rate_control or args.trace:
+            print("Error: Cannot combine a burst model with interval/bandwidth distributions, rate control or trace replay")
+            sys.exit(1)
+    multi_flow = args.client and (args.flows > 1 or args.flow_file)
+    if args.flows < 1:
+        print("Error: Number of flows must be at least 1")
+        sys.exit(1)
+    if multi_flow and (args.distributed_bandwidth or args.rate_control or args.trace or args.burst or args.printpkg
+                       or args.profile or args.profile_dump):
+        print("Error: Cannot combine multiple flows with -db, rate control, trace replay, burst models, -ppkg or profiling")
+        sys.exit(1)
+    if args.reverse or args.bidir:
+        if args.server or (args.reverse and args.bidir):
+            print("Error: -R and --bidir are client options and cannot be combined")
+            sys.exit(1)
+        if multi_flow or args.trace or args.rate_control or args.printpkg or args.profile or args.profile_dump:
+            print("Error: Cannot combine -R/--bidir with multiple flows, trace replay, rate control, -ppkg or profiling")
+            sys.exit(1)
+        dists = (args.distributed_packets_per_second, args.distributed_packet_size, args.distributed_bandwidth)
+        if any(dist and dist.startswith('empirical') for dist in dists):
+            print("Error: The server cannot read empirical distribution files for -R/--bidir")
+            sys.exit(1)
+        if args.reverse and (args.zerocopy or args.tcp_info_interval is not None or args.tcp_info_dump):
+            print("Error: The client does not send with -R, zero-copy and TCP_INFO sampling need --bidir")
+            sys.exit(1)
+    if args.cps is not None:
+        if args.server or args.udp or args.time is None:
+            print("Error: Connection rate mode is a TCP client mode and needs -t")
+            sys.exit(1)
+        if multi_flow or args.reverse or args.bidir or args.trace or args.burst or args.zerocopy or args.profile \
+                or args.profile_dump or args.tcp_info_interval is not None or args.tcp_info_dump:
+            print("Error: Cannot combine connection rate mode with multiple flows, -R/--bidir, trace replay, "
+                  "burst models, zero-copy, TCP_INFO sampling or profiling")
+            sys.exit(1)
+        if args.cps < 0 or args.cps_bytes < 0 or args.cps_concurrency < 1 or args.cps_workers < 1:
+            print("Error: Connection rate, bytes, concurrency and workers must not be negative")
+            sys.exit(1)
+    if args.src_ports or args.destinations:
+        if not args.client or not args.udp or not args.src_ports:
+            print("Error: Flow-table mode is a UDP client mode and needs --src-ports")
+            sys.exit(1)
+        if multi_flow or args.reverse or args.bidir or args.trace or args.burst or args.rate_control or args.zerocopy \
+                or args.printpkg or args.profile or args.profile_dump or args.distributed_packets_per_second \
+                or args.distributed_packet_size or args.distributed_bandwidth:
+            print("Error: Cannot combine flow-table mode with multiple flows, -R/--bidir, trace replay, burst models, "
+                  "rate control, zero-copy, -ppkg, profiling or distributions")
+            sys.exit(1)
+    if args.raw or args.raw_dst_mac:
+        if not args.raw or sys.platform != 'linux' or not args.client or not args.udp or args.ipv6:
+            print("Error: Raw TX ring mode needs --raw and is only supported by the IPv4 UDP client on Linux")
+            sys.exit(1)
+        if multi_flow or args.src_ports or args.reverse or args.bidir or args.trace or args.zerocopy or args.printpkg \
+                or args.distributed_packet_size:
+            print("Error: Cannot combine raw TX ring mode with multiple flows, flow-table mode, -R/--bidir, "
+                  "trace replay, zero-copy, -ppkg or -dl")
+            sys.exit(1)
+        if args.packet_size is not None and args.packet_size < 16:
+            print("Error: Packets in raw TX ring mode must hold the 16 byte header")
+            sys.exit(1)
+    if args.zerocopy:
+        if sys.platform != 'linux':
+            print("Error: Zero-copy send is only supported on Linux")
+            sys.exit(1)
+        if args.printpkg or multi_flow:
+            print("Error: Cannot combine zero-copy send with -ppkg or multiple flows")
+            sys.exit(1)
+    if args.sink and (args.udp or sys.platform != 'linux'):
+        print("Error: Sink mode is only supported by the TCP receiver on Linux")
+        sys.exit(1)
+    if args.rcvlowat and args.udp:
+        print("Error: SO_RCVLOWAT is only supported by the TCP receiver")
+        sys.exit(1)
+    if args.rxq_ovfl and (not args.udp or sys.platform != 'linux'):
+        print("Error: SO_RXQ_OVFL drop counting is only supported by the UDP receiver on Linux")
+        sys.exit(1)
+    if (args.sink or args.rcvbuf or args.rcvlowat or args.rxq_ovfl) and args.client and not (args.reverse or args.bidir):
+        print("Error: Receive options need -R or --bidir on the client")
+        sys.exit(1)
+    if args.tcp_info_interval is not None or args.tcp_info_dump:
+        if args.udp or sys.platform != 'linux':
+            print("Error: TCP_INFO sampling is only supported by the TCP client on Linux")
+            sys.exit(1)
+        if args.tcp_info_interval is not None and args.tcp_info_interval <= 0:
+            print("Error: TCP_INFO sample interval must be positive")
+            sys.exit(1)
+        args.tcp_info_interval = args.tcp_info_interval or 0.01
+    affinity = None
+    if args.cpu_send or args.cpu_stats or args.cpu_workers or args.numa_node is not None or args.irq_iface \
+            or args.sched_fifo is not None or args.nice is not None:
+        if sys.platform != 'linux':
+            print("Error: CPU affinity and scheduling options are only supported on Linux")
+            sys.exit(1)
+        if args.sched_fifo is not None and not 1 <= args.sched_fifo <= 99:
+            print("Error: SCHED_FIFO priority must be between 1 and 99")
+            sys.exit(1)
+        try:
+            affinity = AffinityPlan(args.cpu_send, args.cpu_stats, args.cpu_workers, args.numa_node, args.irq_iface,
+                                    args.sched_fifo, args.nice)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
     if args.printpkg:
         if not args.udp:
             print("Cannot support this model in TCP now")
@@ -85,19 +268,60 @@ def main():
 
     # 选择Generator类
     GeneratorClass = UDPFlowGenerator if args.udp else TCPFlowGenerator
+    options = dict(profile=args.profile, profile_dump=args.profile_dump, profile_dump_mode=args.profile_dump_mode,
+                   trace=args.trace, trace_time_scale=args.trace_time_scale, trace_rate=args.trace_rate, burst=args.burst, burst_seed=args.burst_seed, zerocopy=args.zerocopy,
+                   sink=args.sink, rcvbuf=args.rcvbuf, rcvlowat=args.rcvlowat, rxq_ovfl=args.rxq_ovfl,
+                   tcp_info_interval=args.tcp_info_interval, tcp_info_dump=args.tcp_info_dump,
+                   reverse=args.reverse, bidir=args.bidir, affinity=affinity)
+    if args.udp:
+        options.update(rate_control=args.rate_control, feedback_interval=args.feedback_interval,
+                       max_bandwidth=args.max_bandwidth, raw=args.raw, raw_dst_mac=args.raw_dst_mac)
     if args.server:
         generator = GeneratorClass(args.bind_address, args.client, args.port, "server", args.time, args.size, 
                                args.packet_size, args.bandwidth, args.interval,
                                args.distributed_packets_per_second, args.distributed_packet_size,
                                args.distributed_bandwidth, args.bandwidth_reset_interval,
-                               args.json, args.one_test, args.ipv6, args.printpkg)
+                               args.json, args.one_test, args.ipv6, args.printpkg, **options)
         generator.run_server()
+    elif args.cps is not None:
+        generator = ConnectionRateGenerator(args.bind_address, args.client, args.port, "client", args.time,
+                                            args.interval, args.json, args.one_test, args.ipv6, rate=args.cps,
+                                            exchange=args.cps_bytes, concurrency=args.cps_concurrency,
+                                            workers=args.cps_workers, reset=args.cps_reset, affinity=affinity)
+        generator.run_client()
+    elif args.src_ports:
+        try:
+            generator = FlowTableGenerator(args.bind_address, args.client, args.port, "client", args.time, args.size,
+                                           args.packet_size, args.bandwidth, args.interval, args.json, args.one_test,
+                                           args.ipv6, src_ports=args.src_ports, destinations=args.destinations,
+                                           spread=args.spread, affinity=affinity)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        generator.run_client()
+    elif multi_flow:
+        try:
+            generator = MultiFlowGenerator(args.bind_address, args.client, args.port, "client", args.time, args.size,
+                                           args.packet_size, args.bandwidth, args.interval,
+                                           args.distributed_packets_per_second, args.distributed_packet_size,
+                                           None, None, args.json, args.one_test, args.ipv6, udp=args.udp,
+                                           flows=args.flows, flow_file=args.flow_file, flow_stats=args.flow_stats,
+                                           affinity=affinity)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        generator.run_client()
     elif args.client:
-        generator = GeneratorClass(args.bind_address, args.client, args.port, "client", args.time, args.size,
-                               args.packet_size, args.bandwidth, args.interval,
-                               args.distributed_packets_per_second, args.distributed_packet_size,
-                               args.distributed_bandwidth, args.bandwidth_reset_interval,
-                               args.json, args.one_test, args.ipv6, args.printpkg)
+        try:
+            generator = GeneratorClass(args.bind_address, args.client, args.port, "client", args.time, args.size,
+                                   args.packet_size, args.bandwidth, args.interval,
+                                   args.distributed_packets_per_second, args.distributed_packet_size,
+                                   args.distributed_bandwidth, args.bandwidth_reset_interval,
+                                   args.json, args.one_test, args.ipv6, args.printpkg, **options)
+        except (OSError, ValueError) as e:
+            # 分布参数错误或经验分布文件无法读取
+            print(f"Error: {e}")
+            sys.exit(1)
         generator.run_client()
     else:
         parser.print_help()
@@ -0,0 +1,224 @@
+import argparse
+import json
+import socket
+import sys
+import time
+
+from FlowAPI import TestConfig, TestError, run_test, validate
+from FlowGenerator import FlowGenerator
+from UDPFlowGenerator import PKT_HEAD_SIZE_V4, PKT_HEAD_SIZE_V6
+from scenario import LocalServers
+
+# 以太网帧（含FCS）中UDP负载之外的字节数：以太网头14 + FCS 4 + IP头 + UDP头8
+FRAME_OVERHEAD_V4 = 14 + 4 + 20 + 8
+FRAME_OVERHEAD_V6 = 14 + 4 + 40 + 8
+# 前导码8字节 + 帧间隔12字节，计算线路速率时计入
+WIRE_OVERHEAD = 20
+# 负载中必须容纳的流发生器包头
+MIN_PAYLOAD = 16
+# 实际发送速率低于请求速率的这个比例时，认为受限于发生器而非被测设备
+GENERATOR_LIMIT_RATIO = 0.95
+
+
+class ThroughputSearch:
+    """RFC 2544吞吐量测试：对每个帧长二分查找丢包率不超过容差的最大发送速率。
+
+    每次试验都是一次UDP测试，丢包数来自服务器的FIN_ACK，时延和抖动来自FIN_ACK中的服务器报告。
+    同一帧长的所有试验复用同一个socket，被测设备看到的始终是同一个五元组。
+    """
+
+    def __init__(self, host, port, line_rate, trial_time=10, loss_tolerance=0.0, resolution=0.5,
+                 trial_gap=1.0, ipv6=False):
+        self.host = host
+        self.port = port
+        self.line_rate = line_rate              # 线路速率(bps)，含前导码和帧间隔
+        self.trial_time = trial_time
+        self.loss_tolerance = loss_tolerance    # 允许的丢包率(%)
+        self.resolution = resolution            # 搜索精度，线路速率的百分比
+        self.trial_gap = trial_gap
+        self.ipv6 = ipv6
+        self.frame_overhead = FRAME_OVERHEAD_V6 if ipv6 else FRAME_OVERHEAD_V4
+        self.pkt_head_size = PKT_HEAD_SIZE_V6 if ipv6 else PKT_HEAD_SIZE_V4
+
+    def payload_size(self, frame_size):
+        payload = frame_size - self.frame_overhead
+        if payload < MIN_PAYLOAD:
+            raise ValueError(f"Frame size {frame_size} is too small, minimum is {self.frame_overhead + MIN_PAYLOAD}")
+        return payload
+
+    def max_fps(self, frame_size):
+        return int(self.line_rate / ((frame_size + WIRE_OVERHEAD) * 8))
+
+    def trial(self, sock, frame_size, fps):
+        """以fps帧/秒发送trial_time秒，返回试验记录"""
+        payload = self.payload_size(frame_size)
+        # 按发生器自己的帧长换算带宽，使其每秒发送的包数正好为fps
+        bandwidth = fps * (payload + self.pkt_head_size) * 8
+        config = TestConfig(host=self.host, port=self.port, udp=True, duration=self.trial_time,
+                            packet_size=payload, bandwidth=bandwidth, interval=self.trial_time, ipv6=self.ipv6,
+                            options={'sock': sock})
+        record = {'offered_fps': fps, 'offered_l2_bps': fps * frame_size * 8}
+        try:
+            result = run_test(config)
+        except TestError as e:
+            record.update({'error': str(e), 'passed': False})
+            return record
+        summary = result.summary
+        sent = result.intervals[-1].total_packets
+        achieved = sent / summary.seconds if summary.seconds > 0 else 0
+        server = summary.server or {}
+        record.update({
+            'sent': sent,
+            'lost': summary.lost_packets,
+            'loss_percent': summary.lost_percent,
+            'achieved_fps': achieved,
+            'generator_limited': achieved < fps * GENERATOR_LIMIT_RATIO,
+            'delay_ms': server.get('delay_ms'),
+            'jitter_ms': server.get('jitter_ms'),
+            'passed': summary.lost_percent <= self.loss_tolerance,
+        })
+        return record
+
+    def search(self, frame_size, log=print):
+        """二分查找一个帧长的吞吐量，返回该帧长的结果"""
+        family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        trials = []
+        best = None
+        try:
+            high = self.max_fps(frame_size)
+            low = 0
+            step = max(1, int(high * self.resolution / 100))
+            fps = high
+            while True:
+                record = self.trial(sock, frame_size, fps)
+                trials.append(record)
+                log(self.describe(frame_size, record))
+                if record['passed']:
+                    best = record
+                    low = fps
+                else:
+                    high = fps
+                if record['passed'] and record['generator_limited']:
+                    # 发生器已经发不出更高的速率，继续向上搜索没有意义
+                    break
+                if high - low <= step:
+                    break
+                fps = (low + high) // 2
+                time.sleep(self.trial_gap)
+        finally:
+            sock.close()
+
+        result = {
+            'frame_size': frame_size,
+            'payload_size': self.payload_size(frame_size),
+            'max_fps': self.max_fps(frame_size),
+            'trials': trials,
+        }
+        if best:
+            result.update({
+                'throughput_fps': best['offered_fps'],
+                'throughput_l2_bps': best['offered_l2_bps'],
+                'throughput_wire_bps': best['offered_fps'] * (frame_size + WIRE_OVERHEAD) * 8,
+                'throughput_percent': 100 * best['offered_fps'] / result['max_fps'],
+                'latency_ms': best['delay_ms'],
+                'jitter_ms': best['jitter_ms'],
+                'generator_limited': best['generator_limited'],
+            })
+        else:
+            result['throughput_fps'] = 0
+        return result
+
+    def frame_loss_curve(self, frame_size, steps, log=print):
+        """RFC 2544帧丢失率测试：以线路速率的各个百分比发送，记录丢包率"""
+        family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        curve = []
+        try:
+            for percent in steps:
+                record = self.trial(sock, frame_size, max(1, int(self.max_fps(frame_size) * percent / 100)))
+                record['percent'] = percent
+                curve.append(record)
+                log(self.describe(frame_size, record))
+                time.sleep(self.trial_gap)
+        finally:
+            sock.close()
+        return curve
+
+    @staticmethod
+    def describe(frame_size, record):
+        if 'error' in record:
+            return f"[{frame_size}B] {record['offered_fps']} fps: error: {record['error']}"
+        delay = f", delay {record['delay_ms']:.3f} ms" if record['delay_ms'] is not None else ''
+        limited = ' (generator limited)' if record['generator_limited'] else ''
+        return (f"[{frame_size}B] {record['offered_fps']} fps ({record['offered_l2_bps'] / 1e6:.2f} Mbps): "
+                f"achieved {record['achieved_fps']:.0f} fps, loss {record['loss_percent']:.3f}%{delay}"
+                f" -> {'pass' if record['passed'] else 'fail'}{limited}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='RFC 2544 throughput search with UDP')
+    parser.add_argument('-c', '--client', required=True, help='Server IP address (a long-lived `main.py -s -u`)')
+    parser.add_argument('-p', '--port', type=int, default=5001, help='Port number')
+    parser.add_argument('-6', '--ipv6', action='store_true', help='Use IPv6 instead of IPv4')
+    parser.add_argument('--frame-sizes', type=str, default='64,128,256,512,1024,1280,1518',
+                        help='Comma separated Ethernet frame sizes including FCS')
+    parser.add_argument('--line-rate', type=str, default='1G', help='Line rate in bps, the search starts here')
+    parser.add_argument('-t', '--trial-time', type=int, default=10, help='Seconds per trial')
+    parser.add_argument('--loss-tolerance', type=float, default=0.0, help='Allowed frame loss in percent')
+    parser.add_argument('--resolution', type=float, default=0.5, help='Search resolution in percent of line rate')
+    parser.add_argument('--trial-gap', type=float, default=1.0, help='Seconds between trials')
+    parser.add_argument('--frame-loss-steps', type=str,
+                        help='Also run the frame loss rate test at these percents of line rate, e.g. 100,90,80')
+    parser.add_argument('--local-server', action='store_true', help='Start a UDP server on this host for the test')
+    parser.add_argument('-o', '--output', type=str, default='rfc2544.json', help='Results file')
+    args = parser.parse_args()
+
+    search = ThroughputSearch(args.client, args.port, FlowGenerator.to_bps(args.line_rate), args.trial_time,
+                              args.loss_tolerance, args.resolution, args.trial_gap, args.ipv6)
+    try:
+        frame_sizes = [int(x) for x in args.frame_sizes.split(',') if x]
+        for frame_size in frame_sizes:
+            search.payload_size(frame_size)
+        validate(TestConfig(host=args.client, port=args.port, udp=True, duration=args.trial_time, ipv6=args.ipv6))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    servers = None
+    if args.local_server:
+        servers = LocalServers({}, [(TestConfig(port=args.port, udp=True, ipv6=args.ipv6), 1)])
+    results = {'config': vars(args), 'time': time.time(), 'results': []}
+    try:
+        for frame_size in frame_sizes:
+            result = search.search(frame_size)
+            if args.frame_loss_steps:
+                steps = [float(x) for x in args.frame_loss_steps.split(',') if x]
+                result['frame_loss'] = search.frame_loss_curve(frame_size, steps)
+            results['results'].append(result)
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=4)
+    finally:
+        if servers:
+            servers.close()
+
+    print("\n=== Throughput ===")
+    print(f"{'frame':>6}{'fps':>12}{'Mbps (L2)':>12}{'% line':>9}{'delay ms':>10}{'jitter ms':>11}")
+    for result in results['results']:
+        if not result['throughput_fps']:
+            print(f"{result['frame_size']:>6}{'-':>12}   no lossless rate found")
+            continue
+        delay = result['latency_ms'] if result['latency_ms'] is not None else float('nan')
+        jitter = result['jitter_ms'] if result['jitter_ms'] is not None else float('nan')
+        note = '  (generator limited)' if result['generator_limited'] else ''
+        print(f"{result['frame_size']:>6}{result['throughput_fps']:>12}{result['throughput_l2_bps'] / 1e6:>12.2f}"
+              f"{result['throughput_percent']:>8.1f}%{delay:>10.3f}{jitter:>11.3f}{note}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nExiting...")
+        sys.exit(0)
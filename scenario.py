@@ -0,0 +1,182 @@
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import asdict, replace
+
+from FlowAPI import TestConfig, TestError, run_test, validate
+
+def load_scenario(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def expand_tests(scenario):
+    """展开场景文件：先是tests中按顺序列出的测试，再是matrix的笛卡尔积，每项都叠加defaults"""
+    defaults = scenario.get('defaults', {})
+    entries = [dict(defaults, **test) for test in scenario.get('tests', [])]
+    matrix = scenario.get('matrix')
+    if matrix:
+        keys = list(matrix)
+        for values in itertools.product(*(matrix[k] for k in keys)):
+            entries.append(dict(defaults, **dict(zip(keys, values))))
+    if not entries:
+        raise ValueError("Scenario has neither 'tests' nor 'matrix'")
+    return entries
+
+
+def make_config(entry, scenario):
+    """场景中的测试项 -> (名称, TestConfig, 并行流数, 重复次数)
+
+    除TestConfig字段外，测试项还可以包含name、parallel、repeat和protocol('tcp'/'udp')。
+    """
+    entry = dict(entry)
+    name = entry.pop('name', None)
+    parallel = int(entry.pop('parallel', 1))
+    repeat = int(entry.pop('repeat', 1))
+    protocol = entry.pop('protocol', None)
+    if protocol is not None:
+        if protocol not in ('tcp', 'udp'):
+            raise ValueError(f"Unknown protocol: {protocol}")
+        entry['udp'] = protocol == 'udp'
+    entry.setdefault('host', scenario.get('host'))
+    entry.setdefault('port', scenario.get('port', 5001))
+    entry.setdefault('ipv6', scenario.get('ipv6', False))
+    config = TestConfig.from_dict(entry)
+    validate(config)
+    if name is None:
+        name = ' '.join(f"{k}={v}" for k, v in sorted(entry.items()) if k not in ('host', 'port', 'ipv6'))
+    return name, config, parallel, repeat
+
+
+def run_streams(config, parallel):
+    """并行运行parallel条流，第i条流连接port+i；返回每条流的结果或错误"""
+    streams = [None] * parallel
+
+    def run(index):
+        stream_config = replace(config, port=config.port + index)
+        try:
+            streams[index] = {'port': stream_config.port, 'result': run_test(stream_config).to_dict()}
+        except (TestError, ValueError) as e:
+            streams[index] = {'port': stream_config.port, 'error': str(e)}
+
+    if parallel == 1:
+        run(0)
+        return streams
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(parallel)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return streams
+
+
+def combine(streams):
+    """各条流客户端汇总之和"""
+    total = {'bytes': 0, 'bits_per_second': 0, 'data_bits_per_second': 0}
+    for stream in streams:
+        if 'result' not in stream:
+            continue
+        end = stream['result']['end']
+        for key in total:
+            total[key] += end[key]
+        if 'lost_packets' in end:
+            total['lost_packets'] = total.get('lost_packets', 0) + end['lost_packets']
+    return total
+
+
+class LocalServers:
+    """local_server为true时，为整个场景启动一组常驻的main.py服务器，场景结束时关闭"""
+
+    def __init__(self, scenario, configs):
+        self.processes = []
+        main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+        needed = set()
+        for config, parallel in configs:
+            for index in range(parallel):
+                needed.add((config.udp, config.port + index, config.ipv6))
+        for udp, port, ipv6 in sorted(needed):
+            args = [sys.executable, main, '-s', '-J', '-p', str(port)]
+            if udp:
+                args.append('-u')
+            if ipv6:
+                args.append('-6')
+            if scenario.get('bind_address'):
+                args += ['-B', scenario['bind_address']]
+            self.processes.append(subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        time.sleep(scenario.get('server_startup', 1.0))
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a sequence or matrix of tests against one long-lived server')
+    parser.add_argument('scenario', help='Scenario JSON file')
+    parser.add_argument('-o', '--output', type=str, help='JSON lines results file (overrides "output" in the scenario)')
+    parser.add_argument('-c', '--client', type=str, help='Server address (overrides "host" in the scenario)')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the expanded tests')
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    if args.client:
+        scenario['host'] = args.client
+    try:
+        tests = [make_config(entry, scenario) for entry in expand_tests(scenario)]
+    except (TypeError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.dry_run:
+        for index, (name, config, parallel, repeat) in enumerate(tests):
+            print(f"[{index}] {name} (parallel {parallel}, repeat {repeat})")
+        return
+
+    output_path = args.output or scenario.get('output', 'scenario_results.jsonl')
+    pause = scenario.get('pause', 0.2)
+    servers = LocalServers(scenario, [(c, p) for _, c, p, _ in tests]) if scenario.get('local_server') else None
+    failed = 0
+    try:
+        with open(output_path, 'a') as output:
+            def write(record):
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+
+            write({'type': 'start', 'scenario': os.path.abspath(args.scenario), 'time': time.time(), 'tests': len(tests)})
+            for index, (name, config, parallel, repeat) in enumerate(tests):
+                for run in range(repeat):
+                    started = time.time()
+                    streams = run_streams(config, parallel)
+                    errors = [s['error'] for s in streams if 'error' in s]
+                    failed += bool(errors)
+                    total = combine(streams)
+                    write({'type': 'test', 'index': index, 'run': run, 'name': name, 'time': started,
+                           'config': asdict(config), 'parallel': parallel, 'total': total, 'streams': streams})
+                    if errors:
+                        print(f"[{index}.{run}] {name}: error: {errors[0]}")
+                    else:
+                        lost = f", lost {total['lost_packets']}" if 'lost_packets' in total else ''
+                        print(f"[{index}.{run}] {name}: {total['bits_per_second'] / 1e6:.2f} Mbps{lost}")
+                    # 给服务器留出输出汇总并回到等待状态的时间
+                    time.sleep(pause)
+            write({'type': 'end', 'time': time.time(), 'failed': failed})
+    finally:
+        if servers:
+            servers.close()
+    print(f"Results appended to {output_path}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nExiting...")
+        sys.exit(0)